@@ -0,0 +1,403 @@
+#-------------------------------------------------------------
+# Name:       ArcGIS Admin Client
+# Purpose:    Shared HTTP client used by the ArcGIS admin toolkit scripts. Keeps a pool of keep-alive
+#             connections per host so repeated requests to the ArcGIS Server site reuse the same
+#             TCP (and TLS) connection rather than opening a new one for every request.
+#             - Import into a script and call postToServer as before, or getURL to download a URL (or
+#               check it exists with a HEAD request).
+#             - Call runConcurrently to run a function on a list of items on a number of threads, optionally
+#               limiting the requests in flight to each host while it runs.
+#             - Call getConnectionStats to see how many connections were opened and reused.
+#             - Pass a timings dictionary to getURL to get the DNS, connect, TLS, time to first byte and
+#               transfer times of the request.
+#             - If the server rejects the token sent, a new token is got from ArcGISTokenManager and the
+#               request is sent once more.
+#             - Requests have no timeout unless one is passed in, so long admin operations are not cut off.
+#               A request is only sent again if a reused idle connection had been closed by the server
+#               before the request was sent, never after a timeout or once the request has been sent.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import httplib
+import socket
+import ssl
+import select
+import errno
+import threading
+import urllib
+import urlparse
+from timeit import default_timer as timer
+from multiprocessing.pool import ThreadPool
+import ArcGISTokenManager
+
+# Set variables
+maxIdleConnections = 10 # Maximum number of idle connections kept open per host
+maxRequestsPerHost = 0 # Maximum number of requests in flight to a host at once, 0 is unlimited
+connectionTimeout = None # Seconds to wait on a connection before giving up when no timeout is passed in, None waits for as long as the request takes
+requestHeaders = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain", "Connection": "keep-alive", 'referer':'backuputility', 'referrer':'backuputility'}
+
+# Pool of idle connections keyed by (protocol, server name, server port)
+connectionPool = {}
+connectionLock = threading.Lock()
+hostLimits = {}
+connectionStats = {'requests': 0, 'opened': 0, 'reused': 0, 'retried': 0}
+
+
+# Start of HTTP POST request to the server function
+def postToServer(serverName, serverPort, protocol, url, params, headers=None, timeout=None):
+    # URL encode the resource URL
+    url = urllib.quote(url.encode('utf-8'))
+
+    # Use the default headers if none provided
+    if (headers == None):
+        headers = requestHeaders
+
+    # Use the new token if the token has been renewed
+    params = ArcGISTokenManager.replaceRenewedToken(params)
+    response, data = requestToServer(serverName, serverPort, protocol, "POST", url, params, headers, None, timeout)
+
+    # If the server rejected the token, send the request once more with a new token
+    renewedParams = ArcGISTokenManager.renewRejectedToken(params, response.status, data)
+    if renewedParams:
+        response, data = requestToServer(serverName, serverPort, protocol, "POST", url, renewedParams, headers, None, timeout)
+
+    # Return response
+    return response, data
+# End of HTTP POST request to the server function
+
+
+# Start of get URL function
+def getURL(url, headers=None, timings=None, method="GET", timeout=None):
+    # Split the URL into the server details and the path with query
+    urlParts = urlparse.urlsplit(url)
+    serverNameAndPort = urlParts.netloc.split(":")
+    serverName = serverNameAndPort[0]
+    serverPort = -1
+    if (len(serverNameAndPort) > 1):
+        serverPort = serverNameAndPort[1]
+    path = urlParts.path or "/"
+    if (urlParts.query):
+        path = path + "?" + urlParts.query
+
+    # Use the default headers if none provided
+    if (headers == None):
+        headers = {"Connection": "keep-alive"}
+
+    # Use the new token if the token has been renewed
+    path = ArcGISTokenManager.replaceRenewedToken(path)
+    response, data = requestToServer(serverName, serverPort, urlParts.scheme or "http", method, path, None, headers, timings, timeout)
+
+    # If the server rejected the token, send the request once more with a new token
+    renewedPath = ArcGISTokenManager.renewRejectedToken(path, response.status, data)
+    if renewedPath:
+        response, data = requestToServer(serverName, serverPort, urlParts.scheme or "http", method, renewedPath, None, headers, timings, timeout)
+
+    # Return response
+    return response, data
+# End of get URL function
+
+
+# Start of request to the server function
+def requestToServer(serverName, serverPort, protocol, method, url, params, headers, timings=None, timeout=None):
+    # Times for each phase of the request, the connection phases are 0 if a pooled connection is reused
+    if (timings == None):
+        timings = {}
+    timings.update({'dns': 0.0, 'connect': 0.0, 'tls': 0.0, 'ttfb': 0.0, 'transfer': 0.0})
+    if (timeout == None):
+        timeout = connectionTimeout
+
+    # Wait if there are already too many requests in flight to this host
+    hostLimit = getHostLimit(serverName, serverPort, protocol)
+    if hostLimit:
+        hostLimit.acquire()
+    try:
+        # Get a connection from the pool
+        httpConn, reused = getConnection(serverName, serverPort, protocol, timings, timeout)
+        try:
+            # Send the request
+            requestStartTime = sendRequest(httpConn, method, url, params, headers)
+        except (httplib.HTTPException, socket.error), error:
+            httpConn.close()
+            # If an idle connection was reused and the server had closed it, the request did not get to the server, so retry once on a new connection
+            if (reused == False) or (isConnectionClosedError(error) == False):
+                raise
+            updateStats('retried')
+            httpConn = openConnection(serverName, serverPort, protocol, timings, timeout)
+            try:
+                requestStartTime = sendRequest(httpConn, method, url, params, headers)
+            except:
+                httpConn.close()
+                raise
+        # Never sent again once the request has been sent, as the server may have run it
+        try:
+            response, data = readResponse(httpConn, requestStartTime, timings)
+        except:
+            httpConn.close()
+            raise
+
+        # Put the connection back in the pool if the server is keeping it open
+        if (response.will_close):
+            httpConn.close()
+        else:
+            releaseConnection(serverName, serverPort, protocol, httpConn)
+    finally:
+        if hostLimit:
+            hostLimit.release()
+
+    updateStats('requests')
+    # Return response
+    return (response, data)
+# End of request to the server function
+
+
+# Start of send request function
+def sendRequest(httpConn, method, url, params, headers):
+    # Send the request, returning the time it was sent
+    requestStartTime = timer()
+    httpConn.request(method, url, params, headers)
+    return requestStartTime
+# End of send request function
+
+
+# Start of is connection closed error function
+def isConnectionClosedError(error):
+    # A timeout means the server may still be running the request
+    if isinstance(error, socket.timeout):
+        return False
+    # The server closed or reset the connection
+    if isinstance(error, socket.error) and (error.args) and (error.args[0] in [errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED, errno.ENOTCONN]):
+        return True
+    return isinstance(error, httplib.NotConnected)
+# End of is connection closed error function
+
+
+# Start of read response function
+def readResponse(httpConn, requestStartTime, timings=None):
+    # Read the whole response so the connection can be used again
+    response = httpConn.getresponse()
+    responseStartTime = timer()
+    data = response.read()
+
+    # Time to first byte includes sending the request, transfer is reading the body
+    if (timings != None):
+        timings['ttfb'] = responseStartTime - requestStartTime
+        timings['transfer'] = timer() - responseStartTime
+
+    return (response, data)
+# End of read response function
+
+
+# Start of get connection function
+def getConnection(serverName, serverPort, protocol, timings=None, timeout=None):
+    poolKey = getPoolKey(serverName, serverPort, protocol)
+
+    # Take an idle connection from the pool if there is one
+    while True:
+        with connectionLock:
+            idleConnections = connectionPool.get(poolKey)
+            if not idleConnections:
+                break
+            httpConn = idleConnections.pop()
+        # Don't use the connection if the server has closed it while it was idle
+        if isConnectionDropped(httpConn):
+            httpConn.close()
+            continue
+        # Use the timeout for this request
+        httpConn.timeout = timeout
+        httpConn.sock.settimeout(timeout)
+        updateStats('reused')
+        return httpConn, True
+
+    # Otherwise open a new connection
+    return openConnection(serverName, serverPort, protocol, timings, timeout), False
+# End of get connection function
+
+
+# Start of is connection dropped function
+def isConnectionDropped(httpConn):
+    if (httpConn.sock == None):
+        return True
+    # An idle connection is only readable if the server has closed it
+    try:
+        readable, writable, failed = select.select([httpConn.sock], [], [], 0)
+        return len(readable) > 0
+    except (select.error, socket.error, ValueError):
+        return True
+# End of is connection dropped function
+
+
+# Start of open connection function
+def openConnection(serverName, serverPort, protocol, timings=None, timeout=None):
+    protocol, serverName, serverPort = getPoolKey(serverName, serverPort, protocol)
+
+    if (protocol == 'https'):
+        httpConn = httplib.HTTPSConnection(serverName, serverPort, timeout=timeout)
+    else:
+        httpConn = httplib.HTTPConnection(serverName, serverPort, timeout=timeout)
+
+    # Connect now so each phase of opening the connection can be timed
+    if (timings == None):
+        timings = {}
+    # Look up the server address
+    phaseStartTime = timer()
+    addressInfo = socket.getaddrinfo(serverName, serverPort, 0, socket.SOCK_STREAM)
+    timings['dns'] = timer() - phaseStartTime
+    # Open the TCP connection
+    phaseStartTime = timer()
+    sock = socket.create_connection(addressInfo[0][4][:2], timeout)
+    timings['connect'] = timer() - phaseStartTime
+    # TLS handshake if secure
+    if (protocol == 'https'):
+        phaseStartTime = timer()
+        try:
+            if (getattr(httpConn, '_context', None) != None):
+                sock = httpConn._context.wrap_socket(sock, server_hostname=serverName)
+            else:
+                sock = ssl.wrap_socket(sock, httpConn.key_file, httpConn.cert_file)
+        except:
+            sock.close()
+            raise
+        timings['tls'] = timer() - phaseStartTime
+    httpConn.sock = sock
+
+    updateStats('opened')
+    return httpConn
+# End of open connection function
+
+
+# Start of release connection function
+def releaseConnection(serverName, serverPort, protocol, httpConn):
+    poolKey = getPoolKey(serverName, serverPort, protocol)
+
+    with connectionLock:
+        idleConnections = connectionPool.setdefault(poolKey, [])
+        # Keep the connection if the pool is not full
+        if (len(idleConnections) < maxIdleConnections):
+            idleConnections.append(httpConn)
+            return
+
+    # Pool is full so close the connection
+    httpConn.close()
+# End of release connection function
+
+
+# Start of get host limit function
+def getHostLimit(serverName, serverPort, protocol):
+    # No limit on requests in flight
+    if (int(maxRequestsPerHost) <= 0):
+        return None
+
+    poolKey = getPoolKey(serverName, serverPort, protocol)
+    with connectionLock:
+        # Create a semaphore for the host the first time it is used
+        if poolKey not in hostLimits:
+            hostLimits[poolKey] = threading.BoundedSemaphore(int(maxRequestsPerHost))
+        return hostLimits[poolKey]
+# End of get host limit function
+
+
+# Start of set max requests per host function
+def setMaxRequestsPerHost(maxRequests):
+    global maxRequestsPerHost
+    with connectionLock:
+        maxRequestsPerHost = int(maxRequests)
+        # Clear the existing semaphores so the new limit is used
+        hostLimits.clear()
+# End of set max requests per host function
+
+
+# Start of run concurrently function
+def runConcurrently(function, items, workers, maxRequests=None):
+    # Limit the number of requests in flight to each host while running, if a limit is given
+    if (maxRequests != None):
+        previousMaxRequests = maxRequestsPerHost
+        setMaxRequestsPerHost(maxRequests)
+
+    # Function run on each of the workers, passing back any error
+    def runItem(item):
+        try:
+            return (True, function(item))
+        # Includes sys.exit() being called, which would otherwise stop the worker
+        except BaseException, error:
+            return (False, error)
+
+    try:
+        # If running one item at a time
+        if (int(workers) <= 1) or (len(items) <= 1):
+            results = map(runItem, items)
+        else:
+            # Run the items in parallel, results are returned in the same order as the items
+            # Items are handed out one at a time so a slow item does not hold up the items after it
+            pool = ThreadPool(min(int(workers), len(items)))
+            try:
+                results = pool.map(runItem, items, 1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        if (maxRequests != None):
+            setMaxRequestsPerHost(previousMaxRequests)
+
+    # Raise the first error in this thread
+    for succeeded, result in results:
+        if (succeeded == False):
+            raise result
+    return [result for succeeded, result in results]
+# End of run concurrently function
+
+
+# Start of close connections function
+def closeConnections():
+    with connectionLock:
+        # Close all idle connections in the pool
+        for poolKey in connectionPool:
+            for httpConn in connectionPool[poolKey]:
+                httpConn.close()
+        connectionPool.clear()
+# End of close connections function
+
+
+# Start of get pool key function
+def getPoolKey(serverName, serverPort, protocol):
+    protocol = protocol.lower()
+
+    # If on standard port
+    if ((serverPort == -1 or serverPort == None) and protocol == 'http'):
+        serverPort = 80
+
+    # If on secure port
+    if ((serverPort == -1 or serverPort == None) and protocol == 'https'):
+        serverPort = 443
+
+    return (protocol, serverName.lower(), int(serverPort))
+# End of get pool key function
+
+
+# Start of update stats function
+def updateStats(statName):
+    with connectionLock:
+        connectionStats[statName] += 1
+# End of update stats function
+
+
+# Start of get connection stats function
+def getConnectionStats():
+    with connectionLock:
+        stats = dict(connectionStats)
+    # Number of TCP connections saved by reusing pooled connections
+    stats['saved'] = stats['requests'] - stats['opened']
+    return stats
+# End of get connection stats function
+
+
+# Start of connection stats message function
+def connectionStatsMessage():
+    stats = getConnectionStats()
+    return "HTTP requests - " + str(stats['requests']) + ", connections opened - " + str(stats['opened']) + ", connections reused - " + str(stats['reused']) + "..."
+# End of connection stats message function
@@ -0,0 +1,117 @@
+#-------------------------------------------------------------
+# Name:       ArcGIS Cache Helper
+# Purpose:    Shared map service functions used by the ArcGIS admin toolkit scripts that work on the tiles
+#             of a cached map service.
+#             - Call getServiceInfo to get the details of a map service, including its tile info.
+#             - Call getAreaOfInterest for the extents in an area of interest (a list of extents or the
+#               polygons in a feature class), or the full extent of the service if there is no area of interest. Call getEnvelope for the extent covering them all.
+#             - Call requestURL to request a URL, returning the HTTP status and response.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import socket
+import httplib
+import urllib2
+import json
+import arcpy
+import ArcGISAdminClient
+
+
+# Start of get service info function
+def getServiceInfo(mapService, token, useProxy=False):
+    # Setup the query
+    query = mapService + "?f=json"
+    # If token received
+    if (token):
+        query = query + "&token=" + token
+
+    # Make the query to the map service
+    responseStatus, response = requestURL(query, "GET", useProxy)
+    if (responseStatus != 200):
+        raise Exception("Could not get the map service details - HTTP Error " + str(responseStatus) + ": " + str(response))
+    dataObject = json.loads(response)
+
+    # If there is an error in the response
+    if "error" in dataObject:
+        raise Exception("Error in the query response. " + response)
+    return dataObject
+# End of get service info function
+
+
+# Start of get area of interest function
+def getAreaOfInterest(areaOfInterest, dataObject=None):
+    # If no area of interest, use the full extent of the service
+    if not areaOfInterest:
+        fullExtent = dataObject['fullExtent']
+        return [[float(fullExtent['xmin']), float(fullExtent['ymin']), float(fullExtent['xmax']), float(fullExtent['ymax'])]]
+
+    # If a list of extents e.g. "XMin YMin XMax YMax;XMin YMin XMax YMax"
+    try:
+        extents = []
+        for eachExtent in areaOfInterest.split(";"):
+            if (eachExtent.strip()):
+                XMin, YMin, XMax, YMax = [float(value) for value in eachExtent.split()]
+                extents.append([XMin, YMin, XMax, YMax])
+        return extents
+    # Otherwise a polygon feature class
+    except ValueError:
+        pass
+
+    # Get the extent of each polygon
+    extents = []
+    with arcpy.da.SearchCursor(areaOfInterest, ["SHAPE@"]) as searchCursor:
+        for row in searchCursor:
+            if (row[0]):
+                extent = row[0].extent
+                extents.append([extent.XMin, extent.YMin, extent.XMax, extent.YMax])
+    if (len(extents) == 0):
+        raise Exception("No polygons found in the area of interest - " + areaOfInterest)
+    return extents
+# End of get area of interest function
+
+
+# Start of get envelope function
+def getEnvelope(extents):
+    # Get the extent covering all the extents
+    envelope = None
+    for extent in extents:
+        if (envelope == None):
+            envelope = list(extent)
+        else:
+            envelope = [min(envelope[0], extent[0]), min(envelope[1], extent[1]), max(envelope[2], extent[2]), max(envelope[3], extent[3])]
+    return envelope
+# End of get envelope function
+
+
+# Start of request URL function
+def requestURL(query, method, useProxy=False):
+    # Make the request, returning a status of 0 if the server could not be reached
+    # If using a proxy
+    if (useProxy):
+        try:
+            request = urllib2.Request(query)
+            request.get_method = lambda: method
+            response = urllib2.urlopen(request).read()
+            responseStatus = 200
+        except urllib2.HTTPError, error:
+            response = str(error)
+            responseStatus = error.code
+        except urllib2.URLError, error:
+            response = str(error)
+            responseStatus = 0
+    # Otherwise reuse connections to the server
+    else:
+        try:
+            httpResponse, response = ArcGISAdminClient.getURL(query, None, None, method)
+            responseStatus = httpResponse.status
+        except (httplib.HTTPException, socket.error), error:
+            response = str(error)
+            responseStatus = 0
+    return responseStatus, response
+# End of request URL function
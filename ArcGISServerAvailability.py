@@ -16,11 +16,13 @@ import sys
 import logging
 import datetime
 import smtplib
-import httplib
 import json
 import urllib
 import urlparse
 import arcpy
+import ArcGISAdminClient
+import ArcGISTokenManager
+import ArcGISServiceCatalog
 
 # Enable data to be overwritten
 arcpy.env.overwriteOutput = True
@@ -37,6 +39,8 @@ emailMessage = ""
 enableProxy = "false"
 requestProtocol = "http" # http or https
 proxyURL = ""
+maxWorkers = 8 # Number of services to check at the same time, 1 checks one service at a time
+maxRequestsPerServer = 4 # Maximum number of requests in flight to the server at once
 output = None
 
 # Start of main function
@@ -107,15 +111,7 @@ def mainFunction(agsServerSite,username,password,service): # Get parameters from
                 # Get all services
                 services = getServices(serverName, serverPort, protocol, token)
                 # Query all services
-                # Iterate through services
-                for eachService in services:
-                    # Query the service status
-                    realtimeStatus = getServiceStatus(serverName, serverPort, protocol, eachService, token)          
-                    # Check the service
-                    serviceInfo = checkService(serverName, serverPort, protocol, eachService, token)
-
-                    serviceDetails = {'status': realtimeStatus, 'info': serviceInfo, 'service': eachService}
-                    servicesStatus.append(serviceDetails)
+                servicesStatus = checkServices(serverName, serverPort, protocol, services, token)
                     
             stoppedServices = 0
             errorServices = 0
@@ -157,6 +153,12 @@ def mainFunction(agsServerSite,username,password,service): # Get parameters from
                 if (enableLogging == "true"):
                     logger.info("All services are running correctly...")            
 
+            # Show how many connections were reused
+            arcpy.AddMessage(ArcGISAdminClient.connectionStatsMessage())
+            # Logging
+            if (enableLogging == "true"):
+                logger.info(ArcGISAdminClient.connectionStatsMessage())
+
         # --------------------------------------- End of code --------------------------------------- #  
             
         # If called from gp tool return the arcpy parameter   
@@ -302,94 +304,42 @@ def checkWebAdaptor(serverName, serverPort, protocol, webName, token):
 
 # Start of get services function
 def getServices(serverName, serverPort, protocol, token):
-    params = urllib.urlencode({'token': token, 'f': 'json'})
-
-    # Services list
-    services = []
-    
-    # Construct URL to get services
-    url = "/arcgis/admin/services"
-
-    # Post to the server
+    # Get services from the service catalog, querying the folders in parallel
     try:
-        response, data = postToServer(serverName, serverPort, protocol, url, params)
-    except:
-        arcpy.AddError("Unable to connect to the ArcGIS Server site on " + serverName + ". Check if the server is running.")
-        # Logging
-        if (enableLogging == "true"):     
-            logger.error("Unable to connect to the ArcGIS Server site on " + serverName + ". Check if the server is running.")
-            sys.exit()
-        return -1
-
-    # If there is an error
-    if (response.status != 200):
-        arcpy.AddError("Error getting services.")
-        arcpy.AddError(str(data))
-        # Logging
-        if (enableLogging == "true"): 
-            logger.error("Error getting services.")
-            sys.exit()
-        return -1
-    if (not assertJsonSuccess(data)):
+        services = ArcGISServiceCatalog.getServices(serverName, serverPort, protocol, token)
+    except Exception, error:
         arcpy.AddError("Error getting services. Check if the server is running and ensure that the username/password provided are correct.")
+        arcpy.AddError(str(error))
         # Logging
         if (enableLogging == "true"):
-            logger.error("Error getting services. Check if the server is running and ensure that the username/password provided are correct.")  
+            logger.error("Error getting services. Check if the server is running and ensure that the username/password provided are correct.")
+            logger.error(str(error))
             sys.exit()
         return -1
-    # On successful query
-    else: 
-        dataObject = json.loads(data)
-        
-        # Iterate through services
-        for eachService in dataObject['services']:
-            # Add to list
-            services.append(eachService['serviceName'] + "." + eachService['type'])
-                    
-        # Iterate through folders
-        for folder in dataObject['folders']:
-
-            # Construct URL to get services for the folder
-            url = "/arcgis/admin/services/" + folder
 
-            # Post to the server
-            try:
-                response, data = postToServer(serverName, serverPort, protocol, url, params)
-            except:
-                arcpy.AddError("Unable to connect to the ArcGIS Server site on " + serverName + ". Check if the server is running.")
-                # Logging
-                if (enableLogging == "true"):     
-                    logger.error("Unable to connect to the ArcGIS Server site on " + serverName + ". Check if the server is running.")
-                    sys.exit()
-                return -1
-    
-            # If there is an error
-            if (response.status != 200):
-                arcpy.AddError("Error getting services.")
-                arcpy.AddError(str(data))
-                # Logging
-                if (enableLogging == "true"):     
-                    logger.error("Error getting services.")
-                    sys.exit()
-                return -1
-            if (not assertJsonSuccess(data)):
-                arcpy.AddError("Error getting services. Check if the server is running and ensure that the username/password provided are correct.")
-                # Logging
-                if (enableLogging == "true"):   
-                    logger.error("Error getting services. Check if the server is running and ensure that the username/password provided are correct.")
-                    sys.exit()
-                return -1
-            # On successful query
-            else: 
-                dataObject = json.loads(data)
-                # Iterate through services
-                for eachService in dataObject['services']:                
-                    services.append(folder + "/" + eachService['serviceName']+ "." + eachService['type'])
-        # Return a list of services
-        return services                    
+    # Return a list of services
+    return services                    
 # End of get services function
 
 
+# Start of check services function
+def checkServices(serverName, serverPort, protocol, services, token):
+    arcpy.AddMessage("Checking " + str(len(services)) + " services...")
+
+    # Function to check a single service, run on each of the workers
+    def checkEachService(eachService):
+        # Query the service status
+        realtimeStatus = getServiceStatus(serverName, serverPort, protocol, eachService, token)          
+        # Check the service
+        serviceInfo = checkService(serverName, serverPort, protocol, eachService, token)
+        return {'status': realtimeStatus, 'info': serviceInfo, 'service': eachService}
+
+    # Check the services in parallel, results are returned in the same order as the services
+    # Limit the number of requests in flight to the server so the check does not overload the site, if any of the checks exit this is raised here
+    return ArcGISAdminClient.runConcurrently(checkEachService, services, maxWorkers, maxRequestsPerServer)
+# End of check services function
+
+
 # Start of get service status function
 def getServiceStatus(serverName, serverPort, protocol, service, token):
     params = urllib.urlencode({'token': token, 'f': 'json'})
@@ -477,6 +427,14 @@ def checkService(serverName, serverPort, protocol, service, token):
 
 # Start of get token function
 def getToken(username, password, serverName, serverPort, protocol):
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort, protocol)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, protocol, username, "referer", renewToken)
+    if cachedToken:
+        return cachedToken
+
     params = urllib.urlencode({'username': username.decode(sys.stdin.encoding or sys.getdefaultencoding()).encode('utf-8'), 'password': password.decode(sys.stdin.encoding or sys.getdefaultencoding()).encode('utf-8'),'client': 'referer','referer':'backuputility','f': 'json'})
            
     # Construct URL to get a token
@@ -521,39 +479,16 @@ def getToken(username, password, serverName, serverPort, protocol):
                 sys.exit()
             return -1        
         else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, protocol, username, "referer", dataObject['token'], dataObject.get('expires'), renewToken)
             return dataObject['token']
 # End of get token function
 
 
 # Start of HTTP POST request to the server function
 def postToServer(serverName, serverPort, protocol, url, params):
-    # If on standard port
-    if (serverPort == -1 and protocol == 'http'):
-        serverPort = 80
-
-    # If on secure port
-    if (serverPort == -1 and protocol == 'https'):
-        serverPort = 443
-        
-    if (protocol == 'http'):
-        httpConn = httplib.HTTPConnection(serverName, int(serverPort))
-
-    if (protocol == 'https'):
-        httpConn = httplib.HTTPSConnection(serverName, int(serverPort))
-        
-    headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain",'referer':'backuputility','referrer':'backuputility'}     
-    # URL encode the resource URL
-    url = urllib.quote(url.encode('utf-8'))
-
-    # Build the connection to add the roles to the server
-    httpConn.request("POST", url, params, headers) 
-
-    response = httpConn.getresponse()
-    data = response.read()
-
-    httpConn.close()
-    # Return response
-    return (response, data)
+    # Post to the server using the shared keep-alive connection pool
+    return ArcGISAdminClient.postToServer(serverName, serverPort, protocol, url, params)
 # End of HTTP POST request to the server function
 
 
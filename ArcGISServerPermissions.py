@@ -15,12 +15,13 @@ import sys
 import logging
 import datetime
 import smtplib
-import httplib
 import json
 import urllib
 import urllib2
 import urlparse
 import arcpy
+import ArcGISAdminClient
+import ArcGISTokenManager
 
 # Enable data to be overwritten
 arcpy.env.overwriteOutput = True
@@ -202,7 +203,14 @@ def checkPermissions(serverName, serverPort, protocol, service, token):
 
 # Start of get token function
 def getToken(username, password, serverName, serverPort):
-    
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, "http", username, "requestip", renewToken)
+    if cachedToken:
+        return cachedToken
+
     query_dict = {'username':   username,
                   'password':   password,
                   'expiration': "60",
@@ -222,6 +230,8 @@ def getToken(username, password, serverName, serverPort):
                 logger.error(token['messages'])                
             sys.exit()
         else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, "http", username, "requestip", token['token'], token.get('expires'), renewToken)
             # Return the token to the function which called for it
             return token['token']
     
@@ -238,35 +248,8 @@ def getToken(username, password, serverName, serverPort):
 
 # Start of HTTP POST request to the server function
 def postToServer(serverName, serverPort, protocol, url, params):
-    # If on standard port
-    if (serverPort == -1 and protocol == 'http'):
-        serverPort = 80
-
-    # If on secure port
-    if (serverPort == -1 and protocol == 'https'):
-        serverPort = 443
-        
-    if (protocol == 'http'):
-        httpConn = httplib.HTTPConnection(serverName, int(serverPort))
-
-    if (protocol == 'https'):
-        httpConn = httplib.HTTPSConnection(serverName, int(serverPort))
-        
-    headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain",'referer':'backuputility','referrer':'backuputility'}
-     
-    # URL encode the resource URL
-    url = urllib.quote(url.encode('utf-8'))
-
-    # Build the connection to add the roles to the server
-    httpConn.request("POST", url, params, headers) 
-
-    response = httpConn.getresponse()
-    data = response.read()
-
-    httpConn.close()
-
-    # Return response
-    return (response, data)
+    # Post to the server using the shared keep-alive connection pool
+    return ArcGISAdminClient.postToServer(serverName, serverPort, protocol, url, params)
 # End of HTTP POST request to the server function
 
 
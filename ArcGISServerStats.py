@@ -16,13 +16,21 @@ import sys
 import logging
 import smtplib
 import arcpy
-import httplib
 import json
 import urllib
 import urllib2
 import urlparse
 import time
 import datetime
+import re
+import math
+import array
+import sqlite3
+import threading
+import Queue
+from multiprocessing.pool import ThreadPool
+import ArcGISAdminClient
+import ArcGISTokenManager
 
 # Enable data to be overwritten
 arcpy.env.overwriteOutput = True
@@ -39,8 +47,24 @@ emailMessage = ""
 enableProxy = "false"
 requestProtocol = "http" # http or https
 proxyURL = ""
+prefetchDepth = 2 # Number of log pages to download ahead while the current page is read
+timeSlices = 1 # Number of time slices the time window is split into and queried at the same time e.g. 6 for the last 30 days
+statsDatabase = "" # os.path.join(os.path.dirname(__file__), "ArcGISServerStats.sqlite") - Set to only query logs newer than the last run and keep hourly stats
+statsRetentionDays = 31 # Days of hourly stats to keep in the stats database
+latencyPercentiles = [50, 90, 99] # Percentiles of the request times to add to the CSV file
+latencyPrecision = 0.05 # Relative accuracy of the percentiles e.g. 0.05 is within 5%
+minimumLatency = 0.001 # Request times (seconds) below this are counted as this
 output = None
 
+# Operation types counted for each service
+operationTypes = ["Request", "Draw", "Query"]
+# Log messages for each of the operation types, matched in one pass
+logMessageMatcher = re.compile(r"(request successfully processed)|(End ExportMapImage)|(End (?:Query|Find|Identify))")
+# Used when reading log pages
+whitespaceMatcher = re.compile(r"[ \t\n\r]*")
+lastTimeMatcher = re.compile(r'"time"\s*:\s*(-?\d+)')
+hasMoreMatcher = re.compile(r'"hasMore"\s*:\s*(true|false)')
+
 # Start of main function
 def mainFunction(agsServerSite,username,password,csvFile,timeFilter): # Get parameters from ArcGIS Desktop tool by seperating by comma e.g. (var1 is 1st parameter,var2 is 2nd parameter,var3 is 3rd parameter)  
     try:
@@ -81,47 +105,48 @@ def mainFunction(agsServerSite,username,password,csvFile,timeFilter): # Get para
             startTime = int(round(time.time() * 1000))
             endTime = startTime - millisecondsToQuery
 
-            # Query logs
-            servicesStats = {}
-            queryResult,lastRecordDate = queryLogs(serverName,serverPort,startTime,endTime,servicesStats,token)
-
-            # While there are still more queries - More than 10,000
-            while (queryResult == -1):
-                # Query logs
-                queryResult,lastRecordDate = queryLogs(serverName,serverPort,lastRecordDate,endTime,servicesStats,token)         
+            # If keeping stats in a database, only query logs newer than the last run
+            if (statsDatabase):
+                servicesStats, queryTimes = queryIncrementalLogs(serverName,serverPort,protocol,startTime,endTime,token)
+            # Otherwise query logs for the whole time window
+            else:
+                servicesStats, queryTimes = querySlicedLogs(serverName,serverPort,protocol,startTime,endTime,token)
+            arcpy.AddMessage("Log pages read - " + str(queryTimes['pages']) + ", download time - " + str(round(queryTimes['fetch'], 2)) + " seconds, read time - " + str(round(queryTimes['parse'], 2)) + " seconds, waiting for download - " + str(round(queryTimes['wait'], 2)) + " seconds...")
 
             arcpy.AddMessage("Creating CSV file with stats...")
             
             # Open text file and write header line       
             summaryFile = open(csvFile, "w")        
-            header = "Service,Requests,Request Time,Draw Requests,Draw Time,Query Requests,Query Time\n"
-            summaryFile.write(header)
-
-            # Read through dictionary and write totals into file 
-            for service in servicesStats:
-                requestCount = servicesStats[service][0]
-                requestTimeCount = servicesStats[service][1]
-                avgRequestTime = 0
-                
-                drawCount = servicesStats[service][2]
-                drawTimeCount = servicesStats[service][3]
-                avgDrawTime = 0
-
-                queryCount = servicesStats[service][4]
-                queryTimeCount = servicesStats[service][5]
-                avgQueryTime = 0
-                
-                # Get average time
-                if requestCount > 0:     
-                    avgRequestTime = (1.0 * (requestTimeCount / requestCount))
-                if drawCount > 0:     
-                    avgDrawTime = (1.0 * (drawTimeCount / drawCount))
-                if queryCount > 0:     
-                    avgQueryTime = (1.0 * (queryTimeCount / queryCount))                            
-
-                # Construct and write the comma-separated line         
-                serviceLine = service + "," + str(requestCount) + "," + str(avgRequestTime) + "," + str(drawCount) + "," + str(avgDrawTime) + "," + str(queryCount) + "," + str(avgQueryTime) + "\n"
-                summaryFile.write(serviceLine)
+            header = "Service,Requests,Request Time,Draw Requests,Draw Time,Query Requests,Query Time"
+            for operationType in operationTypes:
+                for percentile in latencyPercentiles:
+                    header = header + "," + operationType + " Time P" + str(percentile)
+                header = header + "," + operationType + " Time Max"
+            summaryFile.write(header + "\n")
+
+            # Read through stats and write totals into file 
+            for serviceIndex in range(len(servicesStats['names'])):
+                serviceLine = servicesStats['names'][serviceIndex]
+                for operation in range(len(operationTypes)):
+                    operationCount = servicesStats['counts'][(serviceIndex * len(operationTypes)) + operation]
+                    operationTimeCount = servicesStats['times'][(serviceIndex * len(operationTypes)) + operation]
+
+                    # Get average time
+                    avgOperationTime = 0
+                    if operationCount > 0:     
+                        avgOperationTime = (1.0 * (operationTimeCount / operationCount))
+
+                    serviceLine = serviceLine + "," + str(operationCount) + "," + str(avgOperationTime)
+
+                # Get the percentiles and maximum time
+                for operation in range(len(operationTypes)):
+                    statIndex = (serviceIndex * len(operationTypes)) + operation
+                    for percentile in latencyPercentiles:
+                        serviceLine = serviceLine + "," + str(getLatencyPercentile(servicesStats, statIndex, percentile))
+                    serviceLine = serviceLine + "," + str(servicesStats['maxTimes'][statIndex])
+
+                # Write the comma-separated line         
+                summaryFile.write(serviceLine + "\n")
             summaryFile.close() 
             
         # --------------------------------------- End of code --------------------------------------- #  
@@ -186,106 +211,424 @@ def mainFunction(agsServerSite,username,password,csvFile,timeFilter): # Get para
 # End of main function
 
 
+# Start of query incremental logs function
+def queryIncrementalLogs(serverName,serverPort,protocol,startTime,endTime,token):
+    siteKey = protocol + "://" + serverName.lower() + ":" + str(serverPort)
+    queryTimes = {'pages': 0, 'fetch': 0.0, 'parse': 0.0, 'wait': 0.0}
+
+    # Open the stats database
+    database = sqlite3.connect(statsDatabase)
+    try:
+        database.execute("CREATE TABLE IF NOT EXISTS serviceStats (site TEXT, service TEXT, hour INTEGER, operation INTEGER, requestCount INTEGER, requestTime REAL, histogram TEXT, maxTime REAL, PRIMARY KEY (site, service, hour, operation))")
+        database.execute("CREATE TABLE IF NOT EXISTS queryState (site TEXT PRIMARY KEY, earliestTime INTEGER, latestTime INTEGER)")
+        # Add the latency histogram columns if the database is from an earlier version
+        statsColumns = [column[1] for column in database.execute("PRAGMA table_info(serviceStats)")]
+        if ("histogram" not in statsColumns):
+            database.execute("ALTER TABLE serviceStats ADD COLUMN histogram TEXT")
+            database.execute("ALTER TABLE serviceStats ADD COLUMN maxTime REAL")
+
+        # Get the time range already in the database
+        queryState = database.execute("SELECT earliestTime, latestTime FROM queryState WHERE site = ?", (siteKey,)).fetchone()
+
+        # Time ranges to query - Logs newer than the last log record processed and any older logs not queried yet
+        timeRanges = []
+        if (queryState == None):
+            earliestTime = endTime
+            latestTime = None
+            timeRanges.append((startTime, endTime))
+        else:
+            earliestTime, latestTime = queryState
+            if (startTime > max(latestTime + 1, endTime)):
+                timeRanges.append((startTime, max(latestTime + 1, endTime)))
+            if (endTime < earliestTime):
+                timeRanges.append((earliestTime - 1, endTime))
+                earliestTime = endTime
+
+        for timeRange in timeRanges:
+            arcpy.AddMessage("Querying new ArcGIS Server logs from " + datetime.datetime.fromtimestamp(int(timeRange[0]) / 1000).strftime('%d/%m/%Y %H:%M:%S') + " to " + datetime.datetime.fromtimestamp(int(timeRange[1]) / 1000).strftime('%d/%m/%Y %H:%M:%S') + "...")
+            rangeStats, rangeTimes = querySlicedLogs(serverName,serverPort,protocol,timeRange[0],timeRange[1],token,True)
+            for timeName in queryTimes:
+                queryTimes[timeName] += rangeTimes[timeName]
+
+            # Add the hourly stats to the database
+            for statsIndex in range(len(rangeStats['names'])):
+                serviceName, hour = rangeStats['names'][statsIndex]
+                for operation in range(len(operationTypes)):
+                    statIndex = (statsIndex * len(operationTypes)) + operation
+                    if (rangeStats['counts'][statIndex] > 0):
+                        histogram = dict(rangeStats['histograms'][statIndex])
+                        maxTime = rangeStats['maxTimes'][statIndex]
+
+                        # If the hour is already in the database, add the stats to it
+                        existingRow = database.execute("SELECT histogram, maxTime FROM serviceStats WHERE site = ? AND service = ? AND hour = ? AND operation = ?", (siteKey, serviceName, hour, operation)).fetchone()
+                        if existingRow:
+                            for bucket, bucketCount in json.loads(existingRow[0] or "{}").items():
+                                histogram[int(bucket)] = histogram.get(int(bucket), 0) + bucketCount
+                            maxTime = max(maxTime, existingRow[1] or 0)
+                            database.execute("UPDATE serviceStats SET requestCount = requestCount + ?, requestTime = requestTime + ?, histogram = ?, maxTime = ? WHERE site = ? AND service = ? AND hour = ? AND operation = ?", (rangeStats['counts'][statIndex], rangeStats['times'][statIndex], json.dumps(histogram), maxTime, siteKey, serviceName, hour, operation))
+                        else:
+                            database.execute("INSERT INTO serviceStats (site, service, hour, operation, requestCount, requestTime, histogram, maxTime) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (siteKey, serviceName, hour, operation, rangeStats['counts'][statIndex], rangeStats['times'][statIndex], json.dumps(histogram), maxTime))
+
+            # Keep the time of the newest log record processed, or the start of the range if there were no new records
+            if (timeRange[0] == startTime):
+                latestTime = rangeStats['latestTime'] or startTime
+
+        # Remove hourly stats older than the retention period
+        retentionTime = startTime - (int(statsRetentionDays) * 86400000)
+        database.execute("DELETE FROM serviceStats WHERE site = ? AND hour < ?", (siteKey, retentionTime / 3600000))
+        earliestTime = max(earliestTime, retentionTime)
+
+        # Save the time range now in the database
+        database.execute("DELETE FROM queryState WHERE site = ?", (siteKey,))
+        database.execute("INSERT INTO queryState VALUES (?, ?, ?)", (siteKey, earliestTime, latestTime))
+        database.commit()
+
+        # Build the stats for the time window from the hourly stats
+        servicesStats = createStats()
+        for serviceName, operation, requestCount, requestTime, histogram, maxTime in database.execute("SELECT service, operation, requestCount, requestTime, histogram, maxTime FROM serviceStats WHERE site = ? AND hour >= ? ORDER BY service, hour, operation", (siteKey, endTime / 3600000)):
+            histogram = dict((int(bucket), bucketCount) for bucket, bucketCount in json.loads(histogram or "{}").items())
+            addServiceStat(servicesStats, serviceName, operation, requestTime, requestCount, histogram, maxTime or 0.0)
+    finally:
+        database.close()
+
+    return servicesStats, queryTimes
+# End of query incremental logs function
+
+
+# Start of query sliced logs function
+def querySlicedLogs(serverName,serverPort,protocol,startTime,endTime,token,hourly=False):
+    # Split the time window into slices, from the most recent back
+    numberSlices = max(1, int(timeSlices))
+    sliceLength = (startTime - endTime) / numberSlices
+    slices = []
+    for sliceNumber in range(numberSlices):
+        sliceStartTime = startTime - (sliceNumber * sliceLength)
+        # Don't include the first millisecond of the previous slice
+        if (sliceNumber > 0):
+            sliceStartTime = sliceStartTime - 1
+        sliceEndTime = startTime - ((sliceNumber + 1) * sliceLength)
+        if (sliceNumber == numberSlices - 1):
+            sliceEndTime = endTime
+        slices.append((sliceStartTime, sliceEndTime))
+
+    # Function to query a single slice, run on each of the workers
+    def querySlice(timeSlice):
+        sliceStats = createStats(hourly)
+        sliceTimes = queryLogs(serverName,serverPort,protocol,timeSlice[0],timeSlice[1],sliceStats,token)
+        return sliceStats, sliceTimes
+
+    # Query the slices at the same time
+    if (numberSlices > 1):
+        arcpy.AddMessage("Querying the ArcGIS Server logs in " + str(numberSlices) + " time slices...")
+        pool = ThreadPool(numberSlices)
+        try:
+            sliceResults = pool.map(querySlice, slices)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        sliceResults = [querySlice(slices[0])]
+
+    # Merge the stats and times from each of the slices
+    servicesStats = createStats(hourly)
+    queryTimes = {'pages': 0, 'fetch': 0.0, 'parse': 0.0, 'wait': 0.0}
+    for sliceStats, sliceTimes in sliceResults:
+        mergeStats(servicesStats, sliceStats)
+        for timeName in queryTimes:
+            queryTimes[timeName] += sliceTimes[timeName]
+    return servicesStats, queryTimes
+# End of query sliced logs function
+
+
 # Start of query logs function
-def queryLogs(serverName,serverPort,startTime,endTime,servicesStats,token):
+def queryLogs(serverName,serverPort,protocol,startTime,endTime,servicesStats,token):
+    # Time spent downloading and reading log pages
+    queryTimes = {'pages': 0, 'fetch': 0.0, 'parse': 0.0, 'wait': 0.0}
+
+    # Download the log pages in the background, holding up to the prefetch depth of pages
+    pageQueue = Queue.Queue(max(1, int(prefetchDepth)))
+    stopFetching = threading.Event()
+    fetchThread = threading.Thread(target=fetchLogPages, args=(serverName,serverPort,protocol,startTime,endTime,token,pageQueue,queryTimes,stopFetching))
+    fetchThread.daemon = True
+    fetchThread.start()
+
+    # While there are still more pages - More than 10,000 records
+    logPage = ""
+    queryError = None
+    try:
+        while True:
+            waitStart = time.time()
+            logPage = pageQueue.get()
+            queryTimes['wait'] += time.time() - waitStart
+
+            # If all pages downloaded
+            if (logPage == None):
+                break
+            # If there was an error downloading the page
+            if isinstance(logPage, BaseException):
+                raise logPage
+
+            response, data = logPage
+            # Read response
+            if (response.status != 200):
+                queryError = "Error while querying logs."
+                break
+
+            # Add the log messages on the page to the stats
+            parseStart = time.time()
+            pageInfo = {}
+            try:
+                lastRecordDate = addLogPage(data, servicesStats, pageInfo)
+            except ValueError:
+                queryError = "Error reading the logs returned. " + data
+                break
+            queryTimes['parse'] += time.time() - parseStart
+            queryTimes['pages'] += 1
+
+            # Check that data returned is not an error object
+            if ('status' in pageInfo and pageInfo['status'] == "error"):
+                queryError = "Error returned by operation. " + data
+                break
+
+            if (lastRecordDate != None):
+                arcpy.AddMessage("ArcGIS Server logs query to (Last log record found to filter set) " + datetime.datetime.fromtimestamp(int(lastRecordDate) / 1000).strftime('%d/%m/%Y %H:%M:%S') + "...")
+    finally:
+        # Stop downloading and wait for the download thread to finish
+        stopFetching.set()
+        while (logPage != None):
+            logPage = pageQueue.get()
+        fetchThread.join()
+
+    # Stop if not all of the logs in the time range were read, so the stats are not saved as complete
+    if (queryError != None):
+        raise Exception(queryError)
+    arcpy.AddMessage("Querying finished...")
+    return queryTimes
+# End of query logs function
+
+
+# Start of fetch log pages function
+def fetchLogPages(serverName,serverPort,protocol,startTime,endTime,token,pageQueue,queryTimes,stopFetching):
+    try:
+        pageStartTime = startTime
+        while (stopFetching.is_set() == False):
+            # Download the page
+            fetchStart = time.time()
+            response, data = fetchLogPage(serverName,serverPort,protocol,pageStartTime,endTime,token)
+            queryTimes['fetch'] += time.time() - fetchStart
+            pageQueue.put((response, data))
+
+            # Stop if there is an error
+            if (response.status != 200):
+                break
+
+            # Get the time of the last record to start the next page from
+            lastRecordDate, hasMore = scanLogPage(data)
+            if (hasMore == False) or (lastRecordDate == None):
+                break
+            pageStartTime = lastRecordDate
+    # Pass any error back to be raised when reading the pages
+    except BaseException, error:
+        pageQueue.put(error)
+    pageQueue.put(None)
+# End of fetch log pages function
+
+
+# Start of fetch log page function
+def fetchLogPage(serverName,serverPort,protocol,startTime,endTime,token):
     # Construct URL to query the logs
     logQueryURL = "/arcgis/admin/logs/query"
     logFilter = "{'services':'*','server':'*','machines':'*'}"          
     params = urllib.urlencode({'level': 'FINE', 'startTime': startTime, 'endTime': endTime, 'filter':logFilter, 'token': token, 'f': 'json', 'pageSize':10000})
-    headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
 
     # Connect to URL and post parameters
     arcpy.AddMessage("Querying the ArcGIS Server logs...")
     arcpy.AddMessage("ArcGIS Server logs query showing from " + datetime.datetime.fromtimestamp(int(startTime) / 1000).strftime('%d/%m/%Y %H:%M:%S') + "...")
-            
-    httpConn = httplib.HTTPConnection(serverName, int(serverPort))
-    httpConn.request("POST", logQueryURL, params, headers)
-    
-    # Read response
-    response = httpConn.getresponse()
-    if (response.status != 200):
-        httpConn.close()
-        arcpy.AddError("Error while querying logs.")
-        # Logging
-        if (enableLogging == "true"):      
-            logger.error("Error while querying logs.")
+
+    # Post to the server
+    return postToServer(serverName, serverPort, protocol, logQueryURL, params)
+# End of fetch log page function
+
+
+# Start of scan log page function
+def scanLogPage(data):
+    # Find the time of the last record without reading the whole page
+    lastRecordDate = None
+    position = len(data)
+    while (position > 0):
+        position = data.rfind('"time"', 0, position)
+        if (position == -1):
+            break
+        timeMatch = lastTimeMatcher.match(data, position)
+        if timeMatch:
+            lastRecordDate = int(timeMatch.group(1))
+            break
+
+    # Find if there are more records
+    hasMoreMatch = hasMoreMatcher.search(data)
+    hasMore = (hasMoreMatch != None) and (hasMoreMatch.group(1) == "true")
+    return lastRecordDate, hasMore
+# End of scan log page function
+
+
+# Start of add log page function
+def addLogPage(data, servicesStats, pageInfo):
+    lastRecordDate = None
+
+    # For each log message, read one at a time from the page
+    for item in iterLogMessages(data, pageInfo):
+        # Find the operation type from the message
+        operationMatch = logMessageMatcher.search(item.get("message", ""))
+        if operationMatch:
+            # If keeping hourly stats, add the hour to the service
+            if (servicesStats['hourly']):
+                addServiceStat(servicesStats, (item["source"], int(item["time"]) / 3600000), operationMatch.lastindex - 1, float(item["elapsed"]))
+            else:
+                addServiceStat(servicesStats, item["source"], operationMatch.lastindex - 1, float(item["elapsed"]))
+        lastRecordDate = item["time"]
+
+        # Keep the time of the newest log record
+        if (servicesStats['latestTime'] == None) or (int(lastRecordDate) > servicesStats['latestTime']):
+            servicesStats['latestTime'] = int(lastRecordDate)
+
+    # Return the time of the last record on the page
+    return lastRecordDate
+# End of add log page function
+
+
+# Start of iterate log messages function
+def iterLogMessages(data, pageInfo):
+    decoder = json.JSONDecoder()
+
+    # Read the page object, adding everything except the log messages to the page info
+    position = whitespaceMatcher.match(data, 0).end()
+    if (data[position:position + 1] != "{"):
         return
+    position = whitespaceMatcher.match(data, position + 1).end()
+    while (data[position:position + 1] not in ("}", "")):
+        # Get the key
+        key, position = decoder.raw_decode(data, position)
+        position = whitespaceMatcher.match(data, position).end() + 1
+        position = whitespaceMatcher.match(data, position).end()
+
+        # If the log messages, read and return one message at a time
+        if (key == "logMessages"):
+            position = whitespaceMatcher.match(data, position + 1).end()
+            while (data[position:position + 1] not in ("]", "")):
+                item, position = decoder.raw_decode(data, position)
+                yield item
+                position = whitespaceMatcher.match(data, position).end()
+                if (data[position:position + 1] == ","):
+                    position = whitespaceMatcher.match(data, position + 1).end()
+            position = position + 1
+        # Otherwise add the value to the page info
+        else:
+            pageInfo[key], position = decoder.raw_decode(data, position)
+
+        position = whitespaceMatcher.match(data, position).end()
+        if (data[position:position + 1] == ","):
+            position = whitespaceMatcher.match(data, position + 1).end()
+# End of iterate log messages function
+
+
+# Start of create stats function
+def createStats(hourly=False):
+    # Services are numbered in the order found, with a count and total time for each operation type stored in typed arrays
+    # If hourly, the stats are kept for each service and hour
+    # Request times are kept in a log scale histogram for each service and operation type, holding the count for each bucket used
+    return {'services': {}, 'names': [], 'counts': array.array('l'), 'times': array.array('d'), 'maxTimes': array.array('d'), 'histograms': [], 'hourly': hourly, 'latestTime': None}
+# End of create stats function
+
+
+# Start of add service stat function
+def addServiceStat(servicesStats, serviceName, operation, elapsed, count=1, histogram=None, maxTime=None):
+    serviceIndex = servicesStats['services'].get(serviceName)
+
+    # If a new service, add it to the stats
+    if (serviceIndex == None):
+        serviceIndex = len(servicesStats['names'])
+        servicesStats['services'][serviceName] = serviceIndex
+        servicesStats['names'].append(serviceName)
+        servicesStats['counts'].extend([0] * len(operationTypes))
+        servicesStats['times'].extend([0.0] * len(operationTypes))
+        servicesStats['maxTimes'].extend([0.0] * len(operationTypes))
+        for operationType in operationTypes:
+            servicesStats['histograms'].append({})
+
+    # Add to the count and total time for the operation
+    statIndex = (serviceIndex * len(operationTypes)) + operation
+    servicesStats['counts'][statIndex] += count
+    servicesStats['times'][statIndex] += elapsed
+
+    # Add to the request time histogram
+    serviceHistogram = servicesStats['histograms'][statIndex]
+    if (histogram == None):
+        bucket = getLatencyBucket(elapsed)
+        serviceHistogram[bucket] = serviceHistogram.get(bucket, 0) + 1
+        maxTime = elapsed
     else:
-        data = response.read()
+        for bucket in histogram:
+            serviceHistogram[bucket] = serviceHistogram.get(bucket, 0) + histogram[bucket]
+    if (maxTime > servicesStats['maxTimes'][statIndex]):
+        servicesStats['maxTimes'][statIndex] = maxTime
+# End of add service stat function
+
+
+# Start of merge stats function
+def mergeStats(servicesStats, otherStats):
+    # Add the counts, times and histograms from the other stats
+    for serviceIndex in range(len(otherStats['names'])):
+        for operation in range(len(operationTypes)):
+            statIndex = (serviceIndex * len(operationTypes)) + operation
+            if (otherStats['counts'][statIndex] > 0):
+                addServiceStat(servicesStats, otherStats['names'][serviceIndex], operation, otherStats['times'][statIndex], otherStats['counts'][statIndex], otherStats['histograms'][statIndex], otherStats['maxTimes'][statIndex])
+
+    # Keep the time of the newest log record
+    if (otherStats['latestTime'] != None) and ((servicesStats['latestTime'] == None) or (otherStats['latestTime'] > servicesStats['latestTime'])):
+        servicesStats['latestTime'] = otherStats['latestTime']
+    return servicesStats
+# End of merge stats function
+
+
+# Start of get latency bucket function
+def getLatencyBucket(elapsed):
+    # Times up to the minimum go in the first bucket, then each bucket is latencyPrecision larger than the last
+    if (elapsed <= minimumLatency):
+        return 0
+    return int(math.ceil(math.log(elapsed / minimumLatency) / math.log(1 + latencyPrecision)))
+# End of get latency bucket function
+
+
+# Start of get latency percentile function
+def getLatencyPercentile(servicesStats, statIndex, percentile):
+    histogram = servicesStats['histograms'][statIndex]
+    requestCount = sum(histogram.values())
+    if (requestCount == 0):
+        return 0
+
+    # Go through the buckets until the percentile of requests is reached
+    percentileCount = math.ceil(requestCount * (percentile / 100.0))
+    runningCount = 0
+    for bucket in sorted(histogram):
+        runningCount += histogram[bucket]
+        if (runningCount >= percentileCount):
+            break
+
+    # Return the top of the bucket, but no more than the maximum time
+    return round(min(minimumLatency * math.pow(1 + latencyPrecision, bucket), servicesStats['maxTimes'][statIndex]), 4)
+# End of get latency percentile function
 
-        # Check that data returned is not an error object
-        if not assertJsonSuccess(data):
-            arcpy.AddError("Error returned by operation. " + data)
-            # Logging
-            if (enableLogging == "true"):      
-                logger.error("Error returned by operation. " + data)
-        else:
-            # Deserialize response into Python object
-            dataObj = json.loads(data)
-            httpConn.close()
-            # Setup the variables       
-            logs = dataObj["logMessages"]
-            logCount = 0           
-
-            # For each log message                    
-            for item in logs:
-                # Get request stats
-                if "request successfully processed" in item["message"]:
-                    serviceName = item["source"]
-
-                    if serviceName in servicesStats:
-                        # Add 1 to request count
-                        servicesStats[serviceName][0] += 1
-                        
-                        # Add elapsed time to request time count
-                        servicesStats[serviceName][1] += float(item["elapsed"])
-                    else:
-                        # Add key with one count and total elapsed time
-                        servicesStats[serviceName] = [1,float(item["elapsed"]),0,0,0,0]
-                        
-                # Get draw stats
-                if "End ExportMapImage" in item["message"]:
-                    serviceName = item["source"]
-
-                    if serviceName in servicesStats:
-                        # Add 1 to draw count
-                        servicesStats[serviceName][2] += 1
-                        
-                        # Add elapsed time to draw time count
-                        servicesStats[serviceName][3] += float(item["elapsed"])
-                    else:
-                        # Add key with one count and total elapsed time
-                        servicesStats[serviceName] = [0,0,1,float(item["elapsed"]),0,0]
-
-                # Get query stats
-                if ("End Query" or "End Find" or "End Identify") in item["message"]:
-                    serviceName = item["source"]
-
-                    if serviceName in servicesStats:
-                        # Add 1 to query count
-                        servicesStats[serviceName][4] += 1
-                        
-                        # Add elapsed time to draw time count
-                        servicesStats[serviceName][5] += float(item["elapsed"])
-                    else:
-                        # Add key with one count and total elapsed time
-                        servicesStats[serviceName] = [0,0,0,0,1,float(item["elapsed"])]
-
-                # When at the last record
-                if (logCount == (len(logs)-1)):
-                    lastRecordDate = item["time"]
-                    arcpy.AddMessage("ArcGIS Server logs query to (Last log record found to filter set) " + datetime.datetime.fromtimestamp(int(lastRecordDate) / 1000).strftime('%d/%m/%Y %H:%M:%S') + "...")
-                    if (dataObj["hasMore"] == 1):
-                        return -1,lastRecordDate
-                    else:
-                        arcpy.AddMessage("Querying finished...")
-                        return 1,lastRecordDate
-                logCount += 1 
-# End of query logs function
 
-      
 # Start of get token function
 def getToken(username, password, serverName, serverPort):
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, "http", username, "requestip", renewToken)
+    if cachedToken:
+        return cachedToken
+
     query_dict = {'username':   username,
                   'password':   password,
                   'expiration': "60",
@@ -305,6 +648,8 @@ def getToken(username, password, serverName, serverPort):
                 logger.error(token['messages'])                
             sys.exit()
         else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, "http", username, "requestip", token['token'], token.get('expires'), renewToken)
             # Return the token to the function which called for it
             return token['token']
     
@@ -319,6 +664,13 @@ def getToken(username, password, serverName, serverPort):
 # End of get token function
 
 
+# Start of HTTP POST request to the server function
+def postToServer(serverName, serverPort, protocol, url, params):
+    # Post to the server using the shared keep-alive connection pool
+    return ArcGISAdminClient.postToServer(serverName, serverPort, protocol, url, params)
+# End of HTTP POST request to the server function
+
+
 # Start of split URL function 
 def splitSiteURL(siteURL):
     try:
@@ -0,0 +1,198 @@
+#-------------------------------------------------------------
+# Name:       ArcGIS Service Catalog
+# Purpose:    Shared service catalog used by the ArcGIS admin toolkit scripts. Gets the list of services
+#             for an ArcGIS Server site, querying the folders in parallel, and keeps a local catalog of
+#             the services (name, type, folder, last seen time) that later runs refresh incrementally.
+#             - The catalog is held in memory, and also in a file if catalogFile is set.
+#             - Folders refreshed less than catalogMaxAge seconds ago are taken from the catalog.
+#             - Services are returned in the order the server lists them, so services are started and
+#               stopped in the same order as before.
+#             - There is a catalog for each site and set of excluded folders.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import os
+import json
+import time
+import threading
+import urllib
+import ArcGISAdminClient
+
+# Set variables
+catalogFile = "" # os.path.join(os.path.dirname(__file__), "ServiceCatalog.json") - Leave blank to only keep the catalog in memory
+catalogMaxAge = 0 # Seconds a folder in the catalog is used for before it is queried again, 0 always queries the folders
+maxWorkers = 8 # Number of folders to query at the same time
+
+# Catalog of services keyed by site and excluded folders
+serviceCatalog = {}
+catalogLock = threading.Lock()
+
+
+# Start of get services function
+def getServices(serverName, serverPort, protocol, token, excludeFolders=[]):
+    # Get the catalog for the site
+    siteCatalog = refreshCatalog(serverName, serverPort, protocol, token, excludeFolders)
+
+    # Return a list of services in the format folder/service.type, root level services first, in the order listed by the server
+    services = []
+    for folder in [""] + siteCatalog.get('folderOrder', sorted(siteCatalog['folders'])):
+        folderServices = []
+        for serviceKey in siteCatalog['services']:
+            if (siteCatalog['services'][serviceKey]['folder'] == folder):
+                folderServices.append((siteCatalog['services'][serviceKey].get('position', 0), serviceKey))
+        for position, serviceKey in sorted(folderServices):
+            services.append(serviceKey)
+    return services
+# End of get services function
+
+
+# Start of refresh catalog function
+def refreshCatalog(serverName, serverPort, protocol, token, excludeFolders=[]):
+    siteKey = getCatalogKey(serverName, serverPort, protocol, excludeFolders)
+    currentTime = int(time.time() * 1000)
+
+    with catalogLock:
+        # If not in memory, look in the catalog file
+        if (siteKey not in serviceCatalog):
+            loadCatalogFile()
+        siteCatalog = serviceCatalog.setdefault(siteKey, {'services': {}, 'folders': {}})
+
+    # Query the root level for services and folders
+    dataObject = queryFolder(serverName, serverPort, protocol, token, "")
+    folders = []
+    for folder in dataObject['folders']:
+        if folder not in excludeFolders:
+            folders.append(folder)
+
+    # Services found on this run by folder
+    foundServices = {"": dataObject['services']}
+
+    # Query the folders that are not in the catalog or have not been refreshed recently
+    foldersToQuery = []
+    for folder in folders:
+        folderRefreshed = siteCatalog['folders'].get(folder)
+        if (folderRefreshed == None) or (currentTime - folderRefreshed >= (catalogMaxAge * 1000)):
+            foldersToQuery.append(folder)
+
+    if (len(foldersToQuery) > 0):
+        # Query the folders in parallel
+        folderResults = ArcGISAdminClient.runConcurrently(lambda folder: queryFolder(serverName, serverPort, protocol, token, folder), foldersToQuery, maxWorkers)
+        for folder, folderResult in zip(foldersToQuery, folderResults):
+            foundServices[folder] = folderResult['services']
+
+    with catalogLock:
+        # Keep when each service was first seen
+        firstSeen = {}
+        for serviceKey in siteCatalog['services']:
+            firstSeen[serviceKey] = siteCatalog['services'][serviceKey]['firstSeen']
+
+        # Remove services in folders that no longer exist or have just been queried
+        for serviceKey in siteCatalog['services'].keys():
+            folder = siteCatalog['services'][serviceKey]['folder']
+            if (folder != "" and folder not in folders) or (folder in foundServices):
+                del siteCatalog['services'][serviceKey]
+        for folder in siteCatalog['folders'].keys():
+            if folder not in folders:
+                del siteCatalog['folders'][folder]
+
+        # Add the services found, keeping the order the server lists them in
+        for folder in foundServices:
+            for position, eachService in enumerate(foundServices[folder]):
+                if (folder == ""):
+                    serviceKey = eachService['serviceName'] + "." + eachService['type']
+                else:
+                    serviceKey = folder + "/" + eachService['serviceName'] + "." + eachService['type']
+                siteCatalog['services'][serviceKey] = {'name': eachService['serviceName'],
+                                                       'type': eachService['type'],
+                                                       'folder': folder,
+                                                       'position': position,
+                                                       'firstSeen': firstSeen.get(serviceKey, currentTime),
+                                                       'lastSeen': currentTime}
+            if (folder != ""):
+                siteCatalog['folders'][folder] = currentTime
+
+        siteCatalog['folderOrder'] = folders
+        siteCatalog['updated'] = currentTime
+        saveCatalogFile()
+
+    return siteCatalog
+# End of refresh catalog function
+
+
+# Start of get catalog key function
+def getCatalogKey(serverName, serverPort, protocol, excludeFolders=[]):
+    siteKey = ArcGISAdminClient.getPoolKey(serverName, serverPort, protocol)
+    siteKey = siteKey[0] + "://" + siteKey[1] + ":" + str(siteKey[2])
+
+    # Keep a separate catalog for each set of excluded folders, so scripts excluding different folders don't replace each other's catalog
+    if (len(excludeFolders) > 0):
+        siteKey = siteKey + "|" + ",".join(sorted(excludeFolders))
+    return siteKey
+# End of get catalog key function
+
+
+# Start of query folder function
+def queryFolder(serverName, serverPort, protocol, token, folder):
+    params = urllib.urlencode({'token': token, 'f': 'json'})
+
+    # Construct URL to get services for the folder
+    url = "/arcgis/admin/services"
+    if (folder != ""):
+        url = url + "/" + folder
+
+    # Post to the server
+    response, data = ArcGISAdminClient.postToServer(serverName, serverPort, protocol, url, params)
+
+    # If there is an error
+    if (response.status != 200):
+        raise Exception("Error getting services. " + str(data))
+    dataObject = json.loads(data)
+    if ('status' in dataObject and dataObject['status'] == "error"):
+        raise Exception("Error getting services. Check if the server is running and ensure that the username/password provided are correct. " + " ".join(dataObject.get('messages', [])))
+    return dataObject
+# End of query folder function
+
+
+# Start of load catalog file function
+def loadCatalogFile():
+    # If using a catalog file and it exists
+    if (catalogFile and os.path.exists(catalogFile)):
+        try:
+            with open(catalogFile, "r") as f:
+                storedCatalog = json.load(f)
+            # Add any sites not already in memory
+            for siteKey in storedCatalog:
+                if siteKey not in serviceCatalog:
+                    serviceCatalog[siteKey] = storedCatalog[siteKey]
+        # If the file can't be read, the catalog will be rebuilt
+        except (IOError, ValueError):
+            pass
+# End of load catalog file function
+
+
+# Start of save catalog file function
+def saveCatalogFile():
+    # If using a catalog file
+    if (catalogFile):
+        try:
+            # Write to a temporary file first so the catalog is not lost if interrupted while writing
+            tempFile = catalogFile + "." + str(os.getpid()) + ".tmp"
+            with open(tempFile, "w") as f:
+                json.dump(serviceCatalog, f, indent=1)
+            try:
+                os.rename(tempFile, catalogFile)
+            # Windows can't rename over an existing file
+            except OSError:
+                if os.path.exists(catalogFile):
+                    os.remove(catalogFile)
+                os.rename(tempFile, catalogFile)
+        # If the file can't be written, the catalog is still kept in memory
+        except (IOError, OSError):
+            pass
+# End of save catalog file function
@@ -0,0 +1,212 @@
+#-------------------------------------------------------------
+# Name:       ArcGIS Tile Grid
+# Purpose:    Shared tile grid calculations used by the ArcGIS admin toolkit scripts. Works out the tile
+#             rows and columns covering a viewport for every level of detail in a cached map service's
+#             tile info, for a number of bounding boxes at once, so it is only done once per run.
+#             - Call getTilePlan for the tiles covering a viewport centred on each bounding box.
+#             - Call getExtentTileRanges for the tiles covering an extent (area of interest) at each level.
+#             - Call getJoinedTileRanges for the tiles covering a list of extents at each level, joining the
+#               extents that share tiles so no tile is counted twice.
+#             - Uses NumPy arrays if NumPy is installed, otherwise plain lists.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import math
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Set variables
+inchesToMetres = 0.0254 # Converting inch to metre (assume the map is in metre)
+
+
+# Start of get tile plan function
+def getTilePlan(tileInfo, boundingBoxes, imageWidth, imageHeight):
+    # Dividing image width by DPI to get it in inches
+    imgWidthInInch = imageWidth / tileInfo['dpi']
+    imgHeightInInch = imageHeight / tileInfo['dpi']
+
+    # Converting inch to metre
+    imgWidthInMapUnit = imgWidthInInch * inchesToMetres
+    imgHeightInMapUnit = imgHeightInInch * inchesToMetres
+
+    # Get the centre point of each bounding box
+    searchPointsX = []
+    searchPointsY = []
+    for boundingBox in boundingBoxes:
+        searchPointsX.append(float(boundingBox[0]) + ((float(boundingBox[2]) - float(boundingBox[0])) / 2))
+        searchPointsY.append(float(boundingBox[1]) + ((float(boundingBox[3]) - float(boundingBox[1])) / 2))
+
+    # Get the scale and tile size in map units for each level
+    scales = [float(level['scale']) for level in tileInfo['lods']]
+    tileWidths = [float(level['resolution']) * float(tileInfo['cols']) for level in tileInfo['lods']]
+    tileHeights = [float(level['resolution']) * float(tileInfo['rows']) for level in tileInfo['lods']]
+
+    # Find the tile row and column ranges - Top left and bottom right
+    if numpy:
+        topLeftColumns, topLeftRows, bottomRightColumns, bottomRightRows = getTileRangesArray(tileInfo, searchPointsX, searchPointsY, scales, tileWidths, tileHeights, imgWidthInMapUnit, imgHeightInMapUnit)
+    else:
+        topLeftColumns, topLeftRows, bottomRightColumns, bottomRightRows = getTileRangesList(tileInfo, searchPointsX, searchPointsY, scales, tileWidths, tileHeights, imgWidthInMapUnit, imgHeightInMapUnit)
+
+    # Build the plan - For each bounding box, a list of the tile ranges for each level
+    tilePlan = []
+    for boxIndex in range(len(boundingBoxes)):
+        boxPlan = []
+        for levelIndex, level in enumerate(tileInfo['lods']):
+            boxPlan.append({'level': level['level'],
+                            'scale': level['scale'],
+                            'resolution': level['resolution'],
+                            'topLeftColumn': int(topLeftColumns[boxIndex][levelIndex]),
+                            'topLeftRow': int(topLeftRows[boxIndex][levelIndex]),
+                            'bottomRightColumn': int(bottomRightColumns[boxIndex][levelIndex]),
+                            'bottomRightRow': int(bottomRightRows[boxIndex][levelIndex])})
+        tilePlan.append(boxPlan)
+    return tilePlan
+# End of get tile plan function
+
+
+# Start of get tile ranges array function
+def getTileRangesArray(tileInfo, searchPointsX, searchPointsY, scales, tileWidths, tileHeights, imgWidthInMapUnit, imgHeightInMapUnit):
+    # Bounding boxes down the rows, levels across the columns
+    searchPointsX = numpy.array(searchPointsX, dtype=numpy.float64).reshape(-1, 1)
+    searchPointsY = numpy.array(searchPointsY, dtype=numpy.float64).reshape(-1, 1)
+    scales = numpy.array(scales, dtype=numpy.float64)
+    tileWidths = numpy.array(tileWidths, dtype=numpy.float64)
+    tileHeights = numpy.array(tileHeights, dtype=numpy.float64)
+
+    # Calculating half of maps height & width at each scale
+    halfX = (imgWidthInMapUnit * scales) / 2
+    halfY = (imgHeightInMapUnit * scales) / 2
+
+    # Setup the extents
+    XMin = searchPointsX - halfX
+    XMax = searchPointsX + halfX
+    YMin = searchPointsY - halfY
+    YMax = searchPointsY + halfY
+
+    # Find the tile rows and columns
+    tileOriginX = float(tileInfo['origin']['x'])
+    tileOriginY = float(tileInfo['origin']['y'])
+    topLeftColumns = numpy.floor((XMin - tileOriginX) / tileWidths).astype(numpy.int64)
+    topLeftRows = numpy.floor((tileOriginY - YMax) / tileHeights).astype(numpy.int64)
+    bottomRightColumns = numpy.floor((XMax - tileOriginX) / tileWidths).astype(numpy.int64)
+    bottomRightRows = numpy.floor((tileOriginY - YMin) / tileHeights).astype(numpy.int64)
+    return topLeftColumns, topLeftRows, bottomRightColumns, bottomRightRows
+# End of get tile ranges array function
+
+
+# Start of get tile ranges list function
+def getTileRangesList(tileInfo, searchPointsX, searchPointsY, scales, tileWidths, tileHeights, imgWidthInMapUnit, imgHeightInMapUnit):
+    tileOriginX = float(tileInfo['origin']['x'])
+    tileOriginY = float(tileInfo['origin']['y'])
+
+    topLeftColumns = []
+    topLeftRows = []
+    bottomRightColumns = []
+    bottomRightRows = []
+    for searchPointX, searchPointY in zip(searchPointsX, searchPointsY):
+        topLeftColumns.append([])
+        topLeftRows.append([])
+        bottomRightColumns.append([])
+        bottomRightRows.append([])
+        for scale, tileWidth, tileHeight in zip(scales, tileWidths, tileHeights):
+            # Calculating half of maps height & width at the scale
+            halfX = (imgWidthInMapUnit * scale) / 2
+            halfY = (imgHeightInMapUnit * scale) / 2
+
+            # Find the tile rows and columns
+            topLeftColumns[-1].append(int(math.floor(((searchPointX - halfX) - tileOriginX) / tileWidth)))
+            topLeftRows[-1].append(int(math.floor((tileOriginY - (searchPointY + halfY)) / tileHeight)))
+            bottomRightColumns[-1].append(int(math.floor(((searchPointX + halfX) - tileOriginX) / tileWidth)))
+            bottomRightRows[-1].append(int(math.floor((tileOriginY - (searchPointY - halfY)) / tileHeight)))
+    return topLeftColumns, topLeftRows, bottomRightColumns, bottomRightRows
+# End of get tile ranges list function
+
+
+# Start of get extent tile ranges function
+def getExtentTileRanges(tileInfo, extent, levels=None):
+    # Get the levels to work out, all levels if none specified
+    lods = []
+    for level in tileInfo['lods']:
+        if (levels == None) or (int(level['level']) in levels):
+            lods.append(level)
+
+    tileOriginX = float(tileInfo['origin']['x'])
+    tileOriginY = float(tileInfo['origin']['y'])
+    XMin, YMin, XMax, YMax = [float(value) for value in extent]
+    tileWidths = [float(level['resolution']) * float(tileInfo['cols']) for level in lods]
+    tileHeights = [float(level['resolution']) * float(tileInfo['rows']) for level in lods]
+
+    # Find the first and last tile row and column covering the extent at each level
+    if numpy:
+        tileWidths = numpy.array(tileWidths, dtype=numpy.float64)
+        tileHeights = numpy.array(tileHeights, dtype=numpy.float64)
+        startColumns = numpy.floor((XMin - tileOriginX) / tileWidths).astype(numpy.int64)
+        endColumns = (numpy.ceil((XMax - tileOriginX) / tileWidths) - 1).astype(numpy.int64)
+        startRows = numpy.floor((tileOriginY - YMax) / tileHeights).astype(numpy.int64)
+        endRows = (numpy.ceil((tileOriginY - YMin) / tileHeights) - 1).astype(numpy.int64)
+    else:
+        startColumns = [int(math.floor((XMin - tileOriginX) / tileWidth)) for tileWidth in tileWidths]
+        endColumns = [int(math.ceil((XMax - tileOriginX) / tileWidth)) - 1 for tileWidth in tileWidths]
+        startRows = [int(math.floor((tileOriginY - YMax) / tileHeight)) for tileHeight in tileHeights]
+        endRows = [int(math.ceil((tileOriginY - YMin) / tileHeight)) - 1 for tileHeight in tileHeights]
+
+    # Build the list of tile ranges, the end row and column are included in the range
+    tileRanges = []
+    for levelIndex, level in enumerate(lods):
+        startColumn = int(startColumns[levelIndex])
+        startRow = int(startRows[levelIndex])
+        # An extent smaller than a tile still covers one tile
+        endColumn = max(startColumn, int(endColumns[levelIndex]))
+        endRow = max(startRow, int(endRows[levelIndex]))
+        tileRanges.append({'level': level['level'],
+                           'scale': level['scale'],
+                           'resolution': level['resolution'],
+                           'startColumn': startColumn,
+                           'endColumn': endColumn,
+                           'startRow': startRow,
+                           'endRow': endRow,
+                           'columns': endColumn - startColumn + 1,
+                           'rows': endRow - startRow + 1})
+    return tileRanges
+# End of get extent tile ranges function
+
+
+# Start of get joined tile ranges function
+def getJoinedTileRanges(tileInfo, extents, levels=None):
+    # Tile ranges for each extent, with the levels in the same order for each extent
+    extentTileRanges = [getExtentTileRanges(tileInfo, extent, levels) for extent in extents]
+    if (len(extentTileRanges) == 0):
+        return []
+
+    # For each level, join the ranges that share tiles
+    joinedTileRanges = []
+    for levelIndex in range(len(extentTileRanges[0])):
+        levelRanges = []
+        for tileRanges in extentTileRanges:
+            tileRange = dict(tileRanges[levelIndex])
+            joined = True
+            while joined:
+                joined = False
+                for otherRange in levelRanges:
+                    if (otherRange['startRow'] <= tileRange['endRow']) and (tileRange['startRow'] <= otherRange['endRow']) and (otherRange['startColumn'] <= tileRange['endColumn']) and (tileRange['startColumn'] <= otherRange['endColumn']):
+                        levelRanges.remove(otherRange)
+                        tileRange['startRow'] = min(otherRange['startRow'], tileRange['startRow'])
+                        tileRange['startColumn'] = min(otherRange['startColumn'], tileRange['startColumn'])
+                        tileRange['endRow'] = max(otherRange['endRow'], tileRange['endRow'])
+                        tileRange['endColumn'] = max(otherRange['endColumn'], tileRange['endColumn'])
+                        tileRange['columns'] = tileRange['endColumn'] - tileRange['startColumn'] + 1
+                        tileRange['rows'] = tileRange['endRow'] - tileRange['startRow'] + 1
+                        joined = True
+                        break
+            levelRanges.append(tileRange)
+        joinedTileRanges.append(levelRanges)
+    return joinedTileRanges
+# End of get joined tile ranges function
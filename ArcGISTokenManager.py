@@ -0,0 +1,218 @@
+#-------------------------------------------------------------
+# Name:       ArcGIS Token Manager
+# Purpose:    Shared token cache used by the ArcGIS admin toolkit scripts. Tokens are cached per site,
+#             user and client type and reused until shortly before they expire, so scripts that run
+#             often do not request a new token from the server every time.
+#             - Tokens are held in memory, and also in a file if tokenFile is set.
+#             - Tokens are renewed renewBefore seconds before the expiry time returned by the server.
+#             - Pass a function that gets a new token when getting or caching a token. If the server rejects
+#               the token (e.g. after a password change), it is dropped from the cache and a new token is
+#               got once, which the shared admin client uses to send the request again.
+#             - The token file is merged with the tokens other scripts have saved and written through a
+#               temporary file.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import os
+import re
+import json
+import time
+import threading
+
+# Set variables
+tokenFile = "" # os.path.join(os.path.dirname(__file__), "Tokens.json") - Leave blank to only cache tokens in memory
+renewBefore = 300 # Seconds before the token expires to request a new one
+defaultExpiration = 60 # Minutes a token is valid for if the server does not return an expiry time
+
+# Tokens keyed by site, user and client type
+tokenCache = {}
+tokenLock = threading.Lock()
+# Functions that get a new token, keyed by the token they replace, and the new tokens got for rejected tokens
+tokenRenewers = {}
+renewedTokens = {}
+renewLock = threading.Lock()
+# Token in a URL or parameters, and the server responses for an invalid or missing token
+tokenMatcher = re.compile(r"((?:^|[?&])token=)([^&#]*)")
+tokenRejectedMatcher = re.compile(r'"code"\s*:\s*49[89]\b|invalid token|token required', re.IGNORECASE)
+
+
+# Start of get cached token function
+def getCachedToken(serverName, serverPort, protocol, username, client, renewToken=None):
+    tokenKey = getTokenKey(serverName, serverPort, protocol, username, client)
+
+    with tokenLock:
+        # If not in memory, look in the token file
+        if (tokenKey not in tokenCache):
+            loadTokenFile()
+        tokenDetails = tokenCache.get(tokenKey)
+
+    # If there is a token and it is not about to expire
+    if tokenDetails:
+        if ((time.time() * 1000) < (tokenDetails['expires'] - (renewBefore * 1000))):
+            if renewToken:
+                tokenRenewers[tokenDetails['token']] = renewToken
+            return tokenDetails['token']
+    return None
+# End of get cached token function
+
+
+# Start of cache token function
+def cacheToken(serverName, serverPort, protocol, username, client, token, expires=None, renewToken=None):
+    tokenKey = getTokenKey(serverName, serverPort, protocol, username, client)
+
+    # If the server did not return an expiry time, use the default expiration
+    if not expires:
+        expires = (time.time() + (defaultExpiration * 60)) * 1000
+
+    with tokenLock:
+        tokenCache[tokenKey] = {'token': token, 'expires': float(expires)}
+        if renewToken:
+            tokenRenewers[token] = renewToken
+        saveTokenFile()
+# End of cache token function
+
+
+# Start of clear token function
+def clearToken(serverName, serverPort, protocol, username, client):
+    tokenKey = getTokenKey(serverName, serverPort, protocol, username, client)
+
+    with tokenLock:
+        if tokenKey in tokenCache:
+            tokenDetails = tokenCache.pop(tokenKey)
+            saveTokenFile([tokenDetails['token']])
+# End of clear token function
+
+
+# Start of is token rejected function
+def isTokenRejected(responseStatus, data):
+    # Invalid token (498) or token required (499), either as the HTTP status or in a short JSON error
+    if (responseStatus in [498, 499]):
+        return True
+    return (responseStatus in [200, 403]) and (len(data) < 4096) and (tokenRejectedMatcher.search(data) != None)
+# End of is token rejected function
+
+
+# Start of renew rejected token function
+def renewRejectedToken(query, responseStatus, data):
+    # Get the token sent, if any
+    tokenMatch = tokenMatcher.search(query or "")
+    if (tokenMatch == None) or (tokenMatch.group(2) == "") or (isTokenRejected(responseStatus, data) == False):
+        return None
+    token = tokenMatch.group(2)
+
+    # Only get one new token when many requests are rejected at once
+    with renewLock:
+        if token not in renewedTokens:
+            # Drop the token from the cache so it is not used again
+            with tokenLock:
+                renewToken = tokenRenewers.pop(token, None)
+                for tokenKey in [tokenKey for tokenKey in tokenCache if tokenCache[tokenKey]['token'] == token]:
+                    del tokenCache[tokenKey]
+                saveTokenFile([token])
+            # Get a new token, only once for each token rejected
+            if (renewToken == None):
+                return None
+            newToken = renewToken()
+            if (not newToken) or (newToken == -1) or (newToken == token):
+                return None
+            renewedTokens[token] = newToken
+    return replaceRenewedToken(query)
+# End of renew rejected token function
+
+
+# Start of replace renewed token function
+def replaceRenewedToken(query):
+    # If the token in the URL or parameters has been replaced by a new token, use the new token
+    if (not renewedTokens) or (not query):
+        return query
+    tokenMatch = tokenMatcher.search(query)
+    if (tokenMatch == None) or (tokenMatch.group(2) not in renewedTokens):
+        return query
+    token = tokenMatch.group(2)
+    while token in renewedTokens:
+        token = renewedTokens[token]
+    return query[:tokenMatch.start(2)] + token + query[tokenMatch.end(2):]
+# End of replace renewed token function
+
+
+# Start of get token key function
+def getTokenKey(serverName, serverPort, protocol, username, client):
+    protocol = str(protocol).lower()
+
+    # If on standard port
+    if ((serverPort == -1 or serverPort == None) and protocol == 'http'):
+        serverPort = 80
+
+    # If on secure port
+    if ((serverPort == -1 or serverPort == None) and protocol == 'https'):
+        serverPort = 443
+
+    return protocol + "://" + str(serverName).lower() + ":" + str(serverPort) + "|" + str(username) + "|" + str(client)
+# End of get token key function
+
+
+# Start of load token file function
+def loadTokenFile():
+    # If using a token file and it exists
+    if (tokenFile and os.path.exists(tokenFile)):
+        try:
+            with open(tokenFile, "r") as f:
+                storedTokens = json.load(f)
+            # Add any tokens not already in memory
+            for tokenKey in storedTokens:
+                if tokenKey not in tokenCache:
+                    tokenCache[tokenKey] = storedTokens[tokenKey]
+        # If the file can't be read, just request a new token
+        except (IOError, ValueError):
+            pass
+# End of load token file function
+
+
+# Start of save token file function
+def saveTokenFile(removedTokens=()):
+    # If using a token file
+    if (tokenFile):
+        # Keep the tokens saved by other scripts, except the tokens removed
+        storedTokens = {}
+        if os.path.exists(tokenFile):
+            try:
+                with open(tokenFile, "r") as f:
+                    storedTokens = json.load(f)
+            except (IOError, ValueError):
+                storedTokens = {}
+        for tokenKey in storedTokens.keys():
+            if (storedTokens[tokenKey].get('token') in removedTokens):
+                del storedTokens[tokenKey]
+
+        # Add the tokens in memory, keeping whichever token expires last
+        for tokenKey in tokenCache:
+            if (tokenKey not in storedTokens) or (storedTokens[tokenKey].get('expires', 0) < tokenCache[tokenKey]['expires']):
+                storedTokens[tokenKey] = tokenCache[tokenKey]
+
+        # Only keep tokens that have not expired
+        currentTime = time.time() * 1000
+        for tokenKey in storedTokens.keys():
+            if (storedTokens[tokenKey].get('expires', 0) <= currentTime):
+                del storedTokens[tokenKey]
+        try:
+            # Write to a temporary file first so other scripts never read a part written file
+            tempFile = tokenFile + "." + str(os.getpid()) + ".tmp"
+            with open(tempFile, "w") as f:
+                json.dump(storedTokens, f)
+            try:
+                os.rename(tempFile, tokenFile)
+            # Windows can't rename over an existing file
+            except OSError:
+                if os.path.exists(tokenFile):
+                    os.remove(tokenFile)
+                os.rename(tempFile, tokenFile)
+        # If the file can't be written, tokens are still cached in memory
+        except (IOError, OSError):
+            pass
+# End of save token file function
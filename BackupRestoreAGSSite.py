@@ -22,10 +22,11 @@ import sys
 import datetime
 import json
 import smtplib
-import httplib
 import urllib
 import urlparse
 import arcpy
+import ArcGISAdminClient
+import ArcGISTokenManager
 arcpy.env.overwriteOutput = True
 
 # Set variables
@@ -88,6 +89,8 @@ def mainFunction(agsServerSite,username,password,backupRestore,backupFolder,back
 
             # If restoring a web adaptor
             if (restoreWebAdaptor == "true"):
+                # Clear the cached token as the restored site may not accept it
+                ArcGISTokenManager.clearToken(serverName, serverPort, protocol, username, "referer")
                 # Get token
                 token = getToken(username, password, serverName, serverPort, protocol)
                 # Register the web adaptor
@@ -350,6 +353,14 @@ def registerWebAdaptor(serverName, serverPort, protocol, token):
 
 # Start of get token function
 def getToken(username, password, serverName, serverPort, protocol):
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort, protocol)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, protocol, username, "referer", renewToken)
+    if cachedToken:
+        return cachedToken
+
     params = urllib.urlencode({'username': username.decode(sys.stdin.encoding or sys.getdefaultencoding()).encode('utf-8'), 'password': password.decode(sys.stdin.encoding or sys.getdefaultencoding()).encode('utf-8'),'client': 'referer','referer':'backuputility','f': 'json'})
            
     # Construct URL to get a token
@@ -390,41 +401,16 @@ def getToken(username, password, serverName, serverPort, protocol):
                 loggingFunction(logFile,"error","Error retrieving token.")             
             return -1        
         else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, protocol, username, "referer", dataObject['token'], dataObject.get('expires'), renewToken)
             return dataObject['token']
 # End of get token function
 
 
 # Start of HTTP POST request to the server function
 def postToServer(serverName, serverPort, protocol, url, params):
-    # If on standard port
-    if (serverPort == -1 and protocol == 'http'):
-        serverPort = 80
-
-    # If on secure port
-    if (serverPort == -1 and protocol == 'https'):
-        serverPort = 443
-        
-    if (protocol == 'http'):
-        httpConn = httplib.HTTPConnection(serverName, int(serverPort))
-
-    if (protocol == 'https'):
-        httpConn = httplib.HTTPSConnection(serverName, int(serverPort))
-        
-    headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain",'referer':'backuputility','referrer':'backuputility'}
-     
-    # URL encode the resource URL
-    url = urllib.quote(url.encode('utf-8'))
-
-    # Build the connection to add the roles to the server
-    httpConn.request("POST", url, params, headers) 
-
-    response = httpConn.getresponse()
-    data = response.read()
-
-    httpConn.close()
-
-    # Return response
-    return (response, data)
+    # Post to the server using the shared keep-alive connection pool
+    return ArcGISAdminClient.postToServer(serverName, serverPort, protocol, url, params)
 # End of HTTP POST request to the server function
 
 
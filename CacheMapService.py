@@ -2,9 +2,17 @@
 # Name:       Cache Map Service
 # Purpose:    Caches a map service by either creating a new cache from scratch using a configuration file
 #             or by updating an existing cache.
+#             - Waits for the cache job to finish, showing the job messages as they come in along with the
+#               tiles per second and estimated time left. The job ID is kept in the job file, so if the
+#               script is stopped, running it again for the same map service reattaches to the job if a
+#               job file is set.
+#             - Set an area of interest to only update the cache there, given as extents or a polygon feature
+#               class. The update can be split into a job for each level or each tile bundle.
+#             - Set change extents to only recache the tiles where the data has changed, from a list of extents,
+#               the features edited recently or the differences between two snapshots of a feature class.
 # Author:     Shaun Weston (shaun_weston@eagle.co.nz)
 # Date Created:    04/11/2014
-# Last Updated:    18/02/2015
+# Last Updated:    18/10/2026
 # Copyright:   (c) Eagle Technology
 # ArcGIS Version:   10.1+
 # Python Version:   2.7
@@ -16,12 +24,17 @@ import sys
 import logging
 import smtplib
 import arcpy
-import httplib
+import ArcGISAdminClient
+import ArcGISTokenManager
+import ArcGISTileGrid
 import json
+import hashlib
+import datetime
 import urllib
 import urllib2
 import urlparse
 import time
+import re
 import xml.etree.ElementTree as ET
 
 # Enable data to be overwritten
@@ -37,6 +50,25 @@ emailPassword = ""
 emailSubject = ""
 emailMessage = ""
 output = None
+trackJobs = "true" # "true" waits for the cache job to finish and shows progress, "false" only checks the job has started
+jobFile = "" # os.path.join(os.path.dirname(__file__), "CacheMapServiceJobs.json") - Keeps the running cache jobs so a later run can reattach to them
+jobPollInterval = 5 # Seconds between checks on the job while new messages are coming in
+jobMaxPollInterval = 300 # Seconds the time between checks backs off to while the job is quiet
+jobMaxCheckErrors = 10 # Checks in a row that fail before giving up on following the job, the job is kept in the job file so a later run can reattach to it - 0 for no limit
+# Job message patterns for the percentage complete and the tiles done of the total
+percentMatcher = re.compile(r"(\d+(?:\.\d+)?)\s*(?:%|percent)", re.IGNORECASE)
+tilesMatcher = re.compile(r"(\d[\d,]*)\s*(?:of|/)\s*(\d[\d,]*)\s*tiles", re.IGNORECASE)
+areaOfInterest = "" # Area to update an existing cache for e.g. "XMin YMin XMax YMax;XMin YMin XMax YMax" or a polygon feature class, in the spatial reference of the service - Leave blank for the whole service
+partitionJobs = "none" # "none" for one job per extent, "level" for a job per level and extent, "bundle" for a job per tile bundle in the area of interest
+bundleSize = 128 # Tiles across and down a bundle
+maxPartitions = 1000 # Most jobs an update can be split into, the update is stopped if it needs more - 0 for no limit
+changeExtents = "" # Only recache where the data has changed, either "XMin YMin XMax YMax;XMin YMin XMax YMax" or a feature class - Leave blank to update the area of interest
+changeSnapshot = "" # Earlier copy of the change extents feature class, the features added, deleted or changed since the copy are recached
+changeKeyField = "" # Field with a value that identifies each feature in both the change extents feature class and the snapshot e.g. "GlobalID" or an asset ID - Needed when using a snapshot, ObjectIDs can change when the data is copied
+changeDateField = "last_edited_date" # Field with the date each feature was last edited, used if not comparing with a snapshot
+changeTimeStandard = "UTC" # "UTC" or "local" - The time standard of the edit dates, matching the editor tracking settings of the feature class
+changeHours = 0 # Recache the features edited in the last number of hours, 0 recaches every feature
+changeBuffer = 0 # Distance in map units to grow each change extent by e.g. to cover symbols and labels drawn past the features
         
 # Start of main function
 def mainFunction(agsServerSite,username,password,mapService,updateMode,cacheInstances,cacheConfig): # Get parameters from ArcGIS Desktop tool by seperating by comma e.g. (var1 is 1st parameter,var2 is 2nd parameter,var3 is 3rd parameter)         
@@ -62,8 +94,23 @@ def mainFunction(agsServerSite,username,password,mapService,updateMode,cacheInst
 
         # If token received
         if (token != -1):
+            # Get a cache job for the map service still running from an earlier run
+            savedJob = getSavedCacheJob(serverName, serverPort, protocol, token, mapService)
+
+            # If reattaching to a running cache job
+            if (savedJob):
+                arcpy.AddMessage("Reattaching to cache job " + savedJob['jobID'] + " for map service - " + mapService + "...")
+                # If the job has already finished
+                if (savedJob.pop('finished', False)):
+                    jobStatus = "esriJobSucceeded"
+                else:
+                    jobStatus = trackCacheJob(serverName, serverPort, protocol, username, password, mapService, savedJob['task'], savedJob['jobID'], savedJob)
+                # Carry on with the rest of the jobs if the update was split up
+                if (jobStatus.lower() == "esrijobsucceeded") and (savedJob.get('partitions')):
+                    arcpy.AddMessage("Carrying on with the " + str(len(savedJob['partitions'])) + " cache jobs left...")
+                    jobStatus = runCachePartitions(serverName, serverPort, protocol, username, password, mapService, savedJob['partitions'], savedJob)
             # If creating a new cache
-            if (updateMode.lower() == "new"):
+            elif (updateMode.lower() == "new"):
                 arcpy.AddMessage("Creating new cache for map service - " + mapService + "...")
 
                 # Convert config file to xml
@@ -86,23 +133,8 @@ def mainFunction(agsServerSite,username,password,mapService,updateMode,cacheInst
                 # Create the cache job, which returns a job ID      
                 jobID = createCache(serverName, serverPort, protocol, mapService, token, cacheFolder, tileOrigin, scales, storageFormat, cacheFormat, tileCompressQuality, dpi, tileWidth, tileHeight, useLocalCache)
 
-                # Check job status of cache
-                jobStatus, messages = checkRunningCache(serverName, serverPort, protocol, token, jobID)
-
-                # If the job has successfully started
-                if  ((jobStatus.lower() == "esrijobsubmitted") or (jobStatus.lower() == "esrijobwaiting") or (jobStatus.lower() == "esrijobexecuting") or (jobStatus.lower() == "esrijobsucceeded")):
-                        arcpy.AddMessage("Map caching - Started...")
-                        arcpy.AddMessage("Check Cache Status from ArcGIS Server Manager for an update on progress...")                            
-                        # Logging
-                        if (enableLogging == "true"):   
-                            logger.info("Map caching - Started...")
-                            logger.info("Check Cache Status from ArcGIS Server Manager for an update on progress...") 
-                # Caching has failed
-                else:
-                    arcpy.AddError("Caching has failed, see service logs for more details...")
-                    # Logging
-                    if (enableLogging == "true"):      
-                        logger.error("Caching has failed, see service logs for more details...")
+                # Follow the cache job
+                jobStatus = trackCacheJob(serverName, serverPort, protocol, username, password, mapService, "Create Map Cache", jobID)
      
             # If updating an existing cache
             else:
@@ -110,10 +142,11 @@ def mainFunction(agsServerSite,username,password,mapService,updateMode,cacheInst
                 
                 # Get tile info for the service
                 arcpy.AddMessage("Getting cache scales...")
-                scales = getTileInfo(serverName, serverPort, protocol, mapService, token)
+                serviceInfo = getTileInfo(serverName, serverPort, protocol, mapService, token)
 
                 # If the map service is cached
-                if scales:
+                if (serviceInfo) and (serviceInfo != -1):
+                    scales = getCacheScales(serviceInfo)
                     # If recreating all tiles
                     if (updateMode.lower() == "existing - recreate all tiles"):
                         updateMode = "RECREATE_ALL_TILES"
@@ -121,26 +154,26 @@ def mainFunction(agsServerSite,username,password,mapService,updateMode,cacheInst
                     else:
                         updateMode = "RECREATE_EMPTY_TILES"
 
-                    # Start the cache job, which returns a job ID                    
-                    jobID = startCache(serverName, serverPort, protocol, mapService, token, scales, updateMode, cacheInstances)
-
-                    # Check job status of cache
-                    jobStatus, messages = checkRunningCache(serverName, serverPort, protocol, token, jobID)
-
-                    # If the job has successfully started
-                    if  ((jobStatus.lower() == "esrijobsubmitted") or (jobStatus.lower() == "esrijobwaiting") or (jobStatus.lower() == "esrijobexecuting") or (jobStatus.lower() == "esrijobsucceeded")):
-                            arcpy.AddMessage("Map caching - Started...")
-                            arcpy.AddMessage("Check Cache Status from ArcGIS Server Manager for an update on progress...")                            
-                            # Logging
-                            if (enableLogging == "true"):   
-                                logger.info("Map caching - Started...")
-                                logger.info("Check Cache Status from ArcGIS Server Manager for an update on progress...") 
-                    # Caching has failed
+                    # If only recaching where the data has changed
+                    if (changeExtents):
+                        # Get the tiles covering the changes, with a job for each level
+                        updateFeatures = None
+                        partitions = getChangePartitions(serviceInfo, getChangeExtents(changeExtents, serviceInfo))
+                        if (len(partitions) == 0):
+                            arcpy.AddMessage("No changes found, the cache is up to date...")
+                    # Split the update into jobs for the area of interest
                     else:
-                        arcpy.AddError("Caching has failed, see service logs for more details...")
-                        # Logging
-                        if (enableLogging == "true"):      
-                            logger.error("Caching has failed, see service logs for more details...")                             
+                        extents, updateFeatures = getAreaOfInterest(areaOfInterest)
+                        partitions = getCachePartitions(serviceInfo, scales, extents)
+                    if (len(partitions) > 1):
+                        arcpy.AddMessage("Cache update split into " + str(len(partitions)) + " jobs...")
+                    jobDetails = {'updateMode': updateMode,
+                                  'cacheInstances': cacheInstances,
+                                  'updateFeatures': updateFeatures,
+                                  'spatialReference': serviceInfo['tileInfo'].get('spatialReference')}
+
+                    # Start the cache jobs and follow them
+                    jobStatus = runCachePartitions(serverName, serverPort, protocol, username, password, mapService, partitions, jobDetails)
                         
                 # If this is not a cached map service
                 else:
@@ -249,19 +282,10 @@ def getTileInfo(serverName, serverPort, protocol, mapService, token):
     # On successful query
     else: 
         dataObject = json.loads(data)
-        scales = ""
 
         # If the map service is cached
         if "tileInfo" in dataObject:
-            # Iterate through the scales
-            count = 0
-            for scale in dataObject['tileInfo']['lods']:
-                # Add each of the scales to the array
-                if (count > 0):
-                    scales = scales + ";"
-                scales = scales + str(scale['scale'])
-                count = count + 1             
-            return scales
+            return dataObject
             
         # Not cached map service
         else:
@@ -269,6 +293,302 @@ def getTileInfo(serverName, serverPort, protocol, mapService, token):
 # End of get tile info function
 
 
+# Start of get cache scales function
+def getCacheScales(serviceInfo):
+    scales = ""
+    # Iterate through the scales
+    count = 0
+    for scale in serviceInfo['tileInfo']['lods']:
+        # Add each of the scales to the array
+        if (count > 0):
+            scales = scales + ";"
+        scales = scales + str(scale['scale'])
+        count = count + 1             
+    return scales
+# End of get cache scales function
+
+
+# Start of get area of interest function
+def getAreaOfInterest(areaOfInterest):
+    # If no area of interest, update the whole service
+    if not areaOfInterest:
+        return [], None
+
+    # If a list of extents e.g. "XMin YMin XMax YMax;XMin YMin XMax YMax"
+    try:
+        extents = []
+        for eachExtent in areaOfInterest.split(";"):
+            if (eachExtent.strip()):
+                XMin, YMin, XMax, YMax = [float(value) for value in eachExtent.split()]
+                extents.append([XMin, YMin, XMax, YMax])
+        return extents, None
+    # Otherwise a polygon feature class
+    except ValueError:
+        pass
+
+    # Get the polygons as a feature set to send to the caching tools
+    features = []
+    with arcpy.da.SearchCursor(areaOfInterest, ["SHAPE@JSON"]) as searchCursor:
+        for row in searchCursor:
+            features.append({'geometry': json.loads(row[0]), 'attributes': {}})
+    if (len(features) == 0):
+        raise Exception("No polygons found in the area of interest - " + areaOfInterest)
+    updateFeatures = json.dumps({'geometryType': "esriGeometryPolygon",
+                                 'spatialReference': features[0]['geometry'].get('spatialReference'),
+                                 'features': features})
+
+    # Use the extent of the polygons to split up the update
+    extent = arcpy.Describe(areaOfInterest).extent
+    return [[extent.XMin, extent.YMin, extent.XMax, extent.YMax]], updateFeatures
+# End of get area of interest function
+
+
+# Start of get cache partitions function
+def getCachePartitions(serviceInfo, scales, extents):
+    tileInfo = serviceInfo['tileInfo']
+    partitions = []
+
+    # If a job for each tile bundle
+    if (partitionJobs == "bundle"):
+        # Bundles are only for updating part of a cache, the whole service would be too many jobs
+        if (len(extents) == 0):
+            raise Exception("An area of interest is needed to split the cache update into a job for each bundle")
+
+        # Check the number of bundles before splitting up the update
+        bundleCount = 0
+        for tileRanges in [ArcGISTileGrid.getExtentTileRanges(tileInfo, extent) for extent in extents]:
+            for tileRange in tileRanges:
+                bundleCount = bundleCount + (((tileRange['endRow'] // int(bundleSize)) - (tileRange['startRow'] // int(bundleSize)) + 1) * ((tileRange['endColumn'] // int(bundleSize)) - (tileRange['startColumn'] // int(bundleSize)) + 1))
+        checkPartitionCount(bundleCount)
+
+        tileOriginX = float(tileInfo['origin']['x'])
+        tileOriginY = float(tileInfo['origin']['y'])
+        for level in tileInfo['lods']:
+            bundleWidth = float(level['resolution']) * float(tileInfo['cols']) * int(bundleSize)
+            bundleHeight = float(level['resolution']) * float(tileInfo['rows']) * int(bundleSize)
+            for extentIndex, extent in enumerate(extents):
+                # Get the bundles covering the extent at the level
+                tileRange = ArcGISTileGrid.getExtentTileRanges(tileInfo, extent, [int(level['level'])])[0]
+                for bundleRow in range(tileRange['startRow'] // int(bundleSize), (tileRange['endRow'] // int(bundleSize)) + 1):
+                    for bundleColumn in range(tileRange['startColumn'] // int(bundleSize), (tileRange['endColumn'] // int(bundleSize)) + 1):
+                        # Only update the part of the bundle in the extent
+                        bundleExtent = [max(extent[0], tileOriginX + (bundleColumn * bundleWidth)),
+                                        max(extent[1], tileOriginY - ((bundleRow + 1) * bundleHeight)),
+                                        min(extent[2], tileOriginX + ((bundleColumn + 1) * bundleWidth)),
+                                        min(extent[3], tileOriginY - (bundleRow * bundleHeight))]
+                        # Named the same as the bundle file in the cache e.g. L14 R0080C0100
+                        partitionName = "L%02d R%04xC%04x" % (int(level['level']), bundleRow * int(bundleSize), bundleColumn * int(bundleSize))
+                        if (len(extents) > 1):
+                            partitionName = partitionName + " - Extent " + str(extentIndex + 1)
+                        partitions.append({'levels': str(level['scale']), 'extent': bundleExtent, 'name': partitionName})
+    # Otherwise a job for each extent, or each level and extent
+    else:
+        if (partitionJobs == "level"):
+            scaleGroups = [[scale] for scale in scales.split(";")]
+        else:
+            scaleGroups = [scales.split(";")]
+        for scaleGroup in scaleGroups:
+            for extentIndex, extent in enumerate(extents or [None]):
+                if (partitionJobs == "level"):
+                    partitionName = "1:" + scaleGroup[0]
+                else:
+                    partitionName = "All levels"
+                if (extent):
+                    partitionName = partitionName + " - Extent " + str(extentIndex + 1)
+                partitions.append({'levels': ";".join(scaleGroup), 'extent': extent, 'name': partitionName})
+        checkPartitionCount(len(partitions))
+    return partitions
+# End of get cache partitions function
+
+
+# Start of check partition count function
+def checkPartitionCount(partitionCount):
+    # Stop rather than queue more jobs than the maximum
+    if (int(maxPartitions) > 0) and (partitionCount > int(maxPartitions)):
+        raise Exception("The cache update would be split into " + str(partitionCount) + " jobs, more than the maximum of " + str(maxPartitions) + ". Use a smaller area of interest, fewer levels or a larger partition (partitionJobs), or raise maxPartitions")
+# End of check partition count function
+
+
+# Start of get change extents function
+def getChangeExtents(changeExtents, serviceInfo):
+    extents = []
+    # If a list of extents e.g. "XMin YMin XMax YMax;XMin YMin XMax YMax"
+    try:
+        for eachExtent in changeExtents.split(";"):
+            if (eachExtent.strip()):
+                XMin, YMin, XMax, YMax = [float(value) for value in eachExtent.split()]
+                extents.append([XMin, YMin, XMax, YMax])
+    # Otherwise a feature class
+    except ValueError:
+        # Get the features in the spatial reference of the service
+        spatialReference = None
+        wkid = serviceInfo['tileInfo'].get('spatialReference', {}).get('wkid')
+        if (wkid):
+            spatialReference = arcpy.SpatialReference(wkid)
+
+        # If comparing with a snapshot of the feature class
+        if (changeSnapshot):
+            if (changeKeyField.strip() == "") or (changeKeyField.upper() in ["OID@", "OBJECTID"]):
+                raise Exception("Set changeKeyField to a field that identifies each feature in both " + changeExtents + " and the snapshot e.g. GlobalID, ObjectIDs can change when the data is copied")
+            arcpy.AddMessage("Comparing " + changeExtents + " with the snapshot " + changeSnapshot + "...")
+            extents = getSnapshotChanges(changeExtents, changeSnapshot, spatialReference)
+        # Otherwise the features edited recently, or all features
+        else:
+            fields = ["SHAPE@"]
+            editedSince = None
+            if (float(changeHours) > 0):
+                fields.append(changeDateField)
+                # Editor tracking stores dates in UTC unless set to use local time
+                if (changeTimeStandard.lower() == "local"):
+                    editedSince = datetime.datetime.now() - datetime.timedelta(hours=float(changeHours))
+                else:
+                    editedSince = datetime.datetime.utcnow() - datetime.timedelta(hours=float(changeHours))
+                arcpy.AddMessage("Getting the features in " + changeExtents + " edited since " + editedSince.strftime("%d/%m/%Y %H:%M:%S") + " (" + changeTimeStandard + ")...")
+            with arcpy.da.SearchCursor(changeExtents, fields, spatial_reference=spatialReference) as searchCursor:
+                for row in searchCursor:
+                    if (row[0] == None):
+                        continue
+                    if (editedSince != None) and ((row[1] == None) or (row[1] < editedSince)):
+                        continue
+                    extents.append([row[0].extent.XMin, row[0].extent.YMin, row[0].extent.XMax, row[0].extent.YMax])
+
+    # Grow the extents to cover anything drawn past the features
+    buffer = float(changeBuffer)
+    return [[extent[0] - buffer, extent[1] - buffer, extent[2] + buffer, extent[3] + buffer] for extent in extents]
+# End of get change extents function
+
+
+# Start of get snapshot changes function
+def getSnapshotChanges(featureClass, snapshot, spatialReference):
+    # Compare the attributes and shape of the features in both, leaving out fields that change on their own
+    snapshotFields = [field.name.lower() for field in arcpy.ListFields(snapshot)]
+    fields = [changeKeyField]
+    for field in arcpy.ListFields(featureClass):
+        if (field.type not in ["OID", "Geometry", "Blob", "Raster", "GlobalID"]) and (field.name.lower() in snapshotFields) and (field.name.lower() not in ["shape_length", "shape_area", "shape.len", "shape.area"]) and (field.name != changeKeyField):
+            fields.append(field.name)
+    fields = fields + ["SHAPE@WKB", "SHAPE@"]
+
+    # Get a hash of each feature and its extent
+    def getFeatures(dataset):
+        features = {}
+        with arcpy.da.SearchCursor(dataset, fields, spatial_reference=spatialReference) as searchCursor:
+            for row in searchCursor:
+                extent = None
+                if (row[-1] != None):
+                    extent = [row[-1].extent.XMin, row[-1].extent.YMin, row[-1].extent.XMax, row[-1].extent.YMax]
+                featureHash = hashlib.md5(repr(row[1:-2]) + str(row[-2])).hexdigest()
+                features[row[0]] = (featureHash, extent)
+        return features
+    currentFeatures = getFeatures(featureClass)
+    snapshotFeatures = getFeatures(snapshot)
+
+    # Get the extents of the features added, deleted or changed, both before and after a change
+    extents = []
+    extentsFound = set()
+    changeCounts = {'added': 0, 'deleted': 0, 'changed': 0}
+    for featureKey in set(currentFeatures.keys()) | set(snapshotFeatures.keys()):
+        currentFeature = currentFeatures.get(featureKey)
+        snapshotFeature = snapshotFeatures.get(featureKey)
+        if (snapshotFeature == None):
+            changeCounts['added'] = changeCounts['added'] + 1
+        elif (currentFeature == None):
+            changeCounts['deleted'] = changeCounts['deleted'] + 1
+        elif (currentFeature[0] != snapshotFeature[0]):
+            changeCounts['changed'] = changeCounts['changed'] + 1
+        else:
+            continue
+        for feature in [currentFeature, snapshotFeature]:
+            if (feature != None) and (feature[1] != None) and (tuple(feature[1]) not in extentsFound):
+                extentsFound.add(tuple(feature[1]))
+                extents.append(feature[1])
+    arcpy.AddMessage("Features added - " + str(changeCounts['added']) + ", deleted - " + str(changeCounts['deleted']) + ", changed - " + str(changeCounts['changed']) + "...")
+    return extents
+# End of get snapshot changes function
+
+
+# Start of get change partitions function
+def getChangePartitions(serviceInfo, extents):
+    tileInfo = serviceInfo['tileInfo']
+    tileOriginX = float(tileInfo['origin']['x'])
+    tileOriginY = float(tileInfo['origin']['y'])
+    spatialReference = tileInfo.get('spatialReference')
+    partitions = []
+    totalTiles = 0
+    # Get the tiles covering each change at each level, joining changes that share tiles
+    for tileRanges in ArcGISTileGrid.getJoinedTileRanges(tileInfo, extents):
+        level = tileRanges[0]
+        tileWidth = float(level['resolution']) * float(tileInfo['cols'])
+        tileHeight = float(level['resolution']) * float(tileInfo['rows'])
+
+        # Build a polygon covering each range of tiles, kept just inside the tiles so the tiles next to them are not included
+        features = []
+        bundles = set()
+        levelTiles = 0
+        extent = None
+        for tileRange in tileRanges:
+            startRow, startColumn, endRow, endColumn = tileRange['startRow'], tileRange['startColumn'], tileRange['endRow'], tileRange['endColumn']
+            levelTiles = levelTiles + ((endRow - startRow + 1) * (endColumn - startColumn + 1))
+            # Bundles the tiles are stored in
+            for bundleRow in range(startRow // int(bundleSize), (endRow // int(bundleSize)) + 1):
+                for bundleColumn in range(startColumn // int(bundleSize), (endColumn // int(bundleSize)) + 1):
+                    bundles.add((bundleRow, bundleColumn))
+            XMin = tileOriginX + (startColumn * tileWidth) + (tileWidth * 0.01)
+            XMax = tileOriginX + ((endColumn + 1) * tileWidth) - (tileWidth * 0.01)
+            YMin = tileOriginY - ((endRow + 1) * tileHeight) + (tileHeight * 0.01)
+            YMax = tileOriginY - (startRow * tileHeight) - (tileHeight * 0.01)
+            features.append({'geometry': {'rings': [[[XMin, YMin], [XMin, YMax], [XMax, YMax], [XMax, YMin], [XMin, YMin]]]}, 'attributes': {}})
+            if (extent == None):
+                extent = [XMin, YMin, XMax, YMax]
+            else:
+                extent = [min(extent[0], XMin), min(extent[1], YMin), max(extent[2], XMax), max(extent[3], YMax)]
+        updateFeatures = {'geometryType': "esriGeometryPolygon", 'features': features}
+        if (spatialReference):
+            updateFeatures['spatialReference'] = spatialReference
+        totalTiles = totalTiles + levelTiles
+
+        partitions.append({'levels': str(level['scale']),
+                           'extent': extent,
+                           'updateFeatures': json.dumps(updateFeatures),
+                           'name': "1:" + str(level['scale']) + " - " + str(levelTiles) + " tiles in " + str(len(bundles)) + " bundles"})
+
+    if (len(partitions) > 0):
+        arcpy.AddMessage("Changes - " + str(len(extents)) + " extents, " + str(totalTiles) + " tiles to recache...")
+    return partitions
+# End of get change partitions function
+
+
+# Start of run cache partitions function
+def runCachePartitions(serverName, serverPort, protocol, username, password, mapService, partitions, jobDetails):
+    jobStatus = ""
+    for partitionIndex, partition in enumerate(partitions):
+        if (len(partitions) > 1):
+            arcpy.AddMessage("Cache job " + str(partitionIndex + 1) + " of " + str(len(partitions)) + " - " + partition['name'] + "...")
+            # Logging
+            if (enableLogging == "true"):
+                logger.info("Cache job " + str(partitionIndex + 1) + " of " + str(len(partitions)) + " - " + partition['name'] + "...")
+
+        # Start the cache job, which returns a job ID
+        token = getToken(username, password, serverName, serverPort)
+        jobID = startCache(serverName, serverPort, protocol, mapService, token, partition['levels'], jobDetails['updateMode'], jobDetails['cacheInstances'], partition['extent'], partition.get('updateFeatures', jobDetails['updateFeatures']), jobDetails['spatialReference'])
+
+        # Keep the jobs still to run with the job, so a later run can carry on with them
+        partitionDetails = dict(jobDetails)
+        if (trackJobs == "true"):
+            partitionDetails['partitions'] = partitions[partitionIndex + 1:]
+        # All the jobs are submitted straight away if not waiting for them to finish
+        else:
+            partitionDetails['partitions'] = []
+
+        # Follow the cache job
+        jobStatus = trackCacheJob(serverName, serverPort, protocol, username, password, mapService, "Manage Map Cache Tiles", jobID, partitionDetails)
+
+        # Stop if the job has failed
+        if (jobStatus.lower() not in ["esrijobsucceeded", "esrijobsubmitted", "esrijobwaiting", "esrijobexecuting"]):
+            break
+    return jobStatus
+# End of run cache partitions function
+
+
 # Start of create cache function
 def createCache(serverName, serverPort, protocol, mapService, token, cacheFolder, tileOrigin, scales, storageFormat, cacheFormat, tileCompressQuality, dpi, tileWidth, tileHeight, useLocalCache):
     params = urllib.urlencode({'service_url': mapService + ":MapServer",
@@ -338,13 +658,23 @@ def createCache(serverName, serverPort, protocol, mapService, token, cacheFolder
 
 
 # Start of start cache function
-def startCache(serverName, serverPort, protocol, mapService, token, scales, updateMode, cacheInstances):
-    params = urllib.urlencode({'service_url': mapService + ":MapServer",
-                               'levels': scales,
-                               'thread_count': cacheInstances,
-                               'update_mode': updateMode,
-                               'token': token,
-                               'f': 'json'})
+def startCache(serverName, serverPort, protocol, mapService, token, scales, updateMode, cacheInstances, extent=None, updateFeatures=None, spatialReference=None):
+    params = {'service_url': mapService + ":MapServer",
+              'levels': scales,
+              'thread_count': cacheInstances,
+              'update_mode': updateMode,
+              'token': token,
+              'f': 'json'}
+    # If only updating the cache within an extent
+    if (extent):
+        constrainingExtent = {'xmin': extent[0], 'ymin': extent[1], 'xmax': extent[2], 'ymax': extent[3]}
+        if (spatialReference):
+            constrainingExtent['spatialReference'] = spatialReference
+        params['constraining_extent'] = json.dumps(constrainingExtent)
+    # If only updating the cache within polygons
+    if (updateFeatures):
+        params['update_feature_class'] = updateFeatures
+    params = urllib.urlencode(params)
             
     # Construct URL to start the updating of the cache
     url = "/arcgis/rest/services/System/CachingTools/GPServer/Manage Map Cache Tiles/submitJob"
@@ -400,96 +730,323 @@ def startCache(serverName, serverPort, protocol, mapService, token, scales, upda
 
 # Start of check cache creation function
 def checkCreateCache(serverName, serverPort, protocol, token, jobID): 
+    # Check the job creating the cache
+    return checkCacheJob(serverName, serverPort, protocol, token, "Create Map Cache", jobID)
+# End of check cache creation function
+
+
+# Start of check running cache function
+def checkRunningCache(serverName, serverPort, protocol, token, jobID):
+    # Check the job updating the cache
+    return checkCacheJob(serverName, serverPort, protocol, token, "Manage Map Cache Tiles", jobID)
+# End of check running cache function
+
+
+# Start of check cache job function
+def checkCacheJob(serverName, serverPort, protocol, token, taskName, jobID):
     params = urllib.urlencode({'token': token,
                                'f': 'json'})
-            
-    # Construct URL to start the updating of the cache
-    url = "/arcgis/rest/services/System/CachingTools/GPServer/Create Map Cache/jobs/" + jobID
+
+    # Name of the job for the error messages
+    if (taskName == "Create Map Cache"):
+        jobName = "map service cache creation"
+    else:
+        jobName = "map service cache"
+
+    # Construct URL to check the cache job
+    url = "/arcgis/rest/services/System/CachingTools/GPServer/" + taskName + "/jobs/" + jobID
 
     # Post to the server
     try:
         response, data = postToServer(serverName, serverPort, protocol, url, params)
     except:
-        arcpy.AddError("Error checking map service cache creation on " + serverName + ". Please check if the server is running.")
+        arcpy.AddError("Error checking " + jobName + " on " + serverName + ". Please check if the server is running.")
         # Logging
         if (enableLogging == "true"):      
-            logger.error("Error checking map service cache creation on " + serverName + ". Please check if the server is running.")
+            logger.error("Error checking " + jobName + " on " + serverName + ". Please check if the server is running.")
             sys.exit()
         return -1
 
     # If there is an error
     if (response.status != 200):
-        arcpy.AddError("Error checking map service cache creation.")
+        arcpy.AddError("Error checking " + jobName + ".")
         arcpy.AddError(str(data))
         # Logging
         if (enableLogging == "true"):     
-            logger.error("Error checking map service cache creation.")
+            logger.error("Error checking " + jobName + ".")
             sys.exit()
         return -1
     if (not assertJsonSuccess(data)):
-        arcpy.AddError("Error checking map service cache creation. Please check if the server is running and ensure that the username/password provided are correct.")
+        arcpy.AddError("Error checking " + jobName + ". Please check if the server is running and ensure that the username/password provided are correct.")
         # Logging
         if (enableLogging == "true"):      
-            logger.error("Error checking map service cache creation. Please check if the server is running and ensure that the username/password provided are correct.")  
+            logger.error("Error checking " + jobName + ". Please check if the server is running and ensure that the username/password provided are correct.")  
             sys.exit()
         return -1
     # On successful query
     else:
         dataObject = json.loads(data)
+        # If the server does not know about the job e.g. the job has been cleaned up
+        if "jobStatus" not in dataObject:
+            arcpy.AddWarning("Cache job " + jobID + " could not be found - " + str(dataObject.get('error', dataObject)))
+            # Logging
+            if (enableLogging == "true"):
+                logger.warning("Cache job " + jobID + " could not be found - " + str(dataObject.get('error', dataObject)))
+            return None
         jobStatus = dataObject['jobStatus']
-        messages = dataObject['messages']
+        messages = dataObject.get('messages', [])
         
         return jobStatus, messages
-# End of check cache creation function
+# End of check cache job function
+
+
+# Start of track cache job function
+def trackCacheJob(serverName, serverPort, protocol, username, password, mapService, taskName, jobID, jobDetails=None):
+    # Keep the job ID so a later run can reattach to the job
+    saveCacheJob(serverName, serverPort, mapService, taskName, jobID, jobDetails)
+
+    jobStatus = ""
+    messageCount = 0
+    checkErrors = 0
+    pollInterval = float(jobPollInterval)
+    progress = {'startTime': time.time(),
+                'tiles': None,
+                'tilesStart': None,
+                'percent': None,
+                'percentStart': None}
+    while True:
+        # Get the token each time, as it will be renewed if it is about to expire during a long job
+        token = getToken(username, password, serverName, serverPort)
+        jobCheck = checkCacheJob(serverName, serverPort, protocol, token, taskName, jobID)
+        checkTime = time.time()
+
+        newMessages = []
+        # If the job could not be found
+        if (jobCheck == None):
+            jobStatus = ""
+            break
+        # If the job could not be checked
+        elif (jobCheck == -1):
+            checkErrors = checkErrors + 1
+            # Stop if the job keeps failing to be checked, leaving it in the job file
+            if (int(jobMaxCheckErrors) > 0) and (checkErrors >= int(jobMaxCheckErrors)):
+                errorMessage = "Stopped following cache job " + jobID + " as it could not be checked " + str(checkErrors) + " times in a row"
+                if (jobFile):
+                    errorMessage = errorMessage + ". The job is kept in the job file, run again to reattach to it"
+                raise Exception(errorMessage)
+        # If the job was checked
+        else:
+            checkErrors = 0
+            jobStatus, messages = jobCheck
+            # Show the messages that have come in since the last check
+            newMessages = messages[messageCount:]
+            messageCount = len(messages)
+            for message in newMessages:
+                description = message.get('description', "")
+                if (message.get('type') == "esriJobMessageTypeError") or (message.get('type') == "esriJobMessageTypeWarning"):
+                    arcpy.AddWarning(description)
+                else:
+                    arcpy.AddMessage(description)
+                # Logging
+                if (enableLogging == "true"):
+                    logger.info(description)
+                updateCacheProgress(progress, description, checkTime)
+
+            # Show the tiles per second and time left
+            progressMessage = getCacheProgressMessage(progress)
+            if (len(newMessages) > 0) and (progressMessage):
+                arcpy.AddMessage(progressMessage)
+                # Logging
+                if (enableLogging == "true"):
+                    logger.info(progressMessage)
 
+            # If the job has finished
+            if (jobStatus.lower() not in ["esrijobsubmitted", "esrijobwaiting", "esrijobexecuting", "esrijobcancelling"]):
+                break
 
-# Start of check running cache function
-def checkRunningCache(serverName, serverPort, protocol, token, jobID):
-    params = urllib.urlencode({'token': token,
-                               'f': 'json'})
-            
-    # Construct URL to start the updating of the cache
-    url = "/arcgis/rest/services/System/CachingTools/GPServer/Manage Map Cache Tiles/jobs/" + jobID
+        # If only checking the job has started
+        if (trackJobs != "true"):
+            break
 
-    # Post to the server
-    try:
-        response, data = postToServer(serverName, serverPort, protocol, url, params)
-    except:
-        arcpy.AddError("Error checking map service cache on " + serverName + ". Please check if the server is running.")
+        # Check again straight away while messages are coming in, otherwise back off
+        if (len(newMessages) > 0):
+            pollInterval = float(jobPollInterval)
+        else:
+            pollInterval = min(pollInterval * 2, float(jobMaxPollInterval))
+        time.sleep(pollInterval)
+
+    # If the job has finished successfully
+    if (jobStatus.lower() == "esrijobsucceeded"):
+        # Forget the job unless there are jobs left to run from splitting up the update
+        if not ((jobDetails) and (jobDetails.get('partitions'))):
+            removeCacheJob(serverName, serverPort, mapService)
+        arcpy.AddMessage("Map caching - Completed in " + str(round((time.time() - progress['startTime']) / 60, 1)) + " minutes...")
         # Logging
-        if (enableLogging == "true"):      
-            logger.error("Error checking map service cache on " + serverName + ". Please check if the server is running.")
-            sys.exit()
-        return -1
-
-    # If there is an error
-    if (response.status != 200):
-        arcpy.AddError("Error checking map service cache.")
-        arcpy.AddError(str(data))
+        if (enableLogging == "true"):
+            logger.info("Map caching - Completed in " + str(round((time.time() - progress['startTime']) / 60, 1)) + " minutes...")
+    # If the job has successfully started
+    elif ((jobStatus.lower() == "esrijobsubmitted") or (jobStatus.lower() == "esrijobwaiting") or (jobStatus.lower() == "esrijobexecuting")):
+        arcpy.AddMessage("Map caching - Started...")
+        arcpy.AddMessage("Check Cache Status from ArcGIS Server Manager for an update on progress...")
         # Logging
-        if (enableLogging == "true"):     
-            logger.error("Error checking map service cache.")
-            sys.exit()
-        return -1
-    if (not assertJsonSuccess(data)):
-        arcpy.AddError("Error checking map service cache. Please check if the server is running and ensure that the username/password provided are correct.")
+        if (enableLogging == "true"):   
+            logger.info("Map caching - Started...")
+            logger.info("Check Cache Status from ArcGIS Server Manager for an update on progress...") 
+    # Caching has failed
+    else:
+        # Forget the job if it has finished
+        if (jobStatus):
+            removeCacheJob(serverName, serverPort, mapService)
+        arcpy.AddError("Caching has failed, see service logs for more details...")
         # Logging
         if (enableLogging == "true"):      
-            logger.error("Error checking map service cache. Please check if the server is running and ensure that the username/password provided are correct.")  
-            sys.exit()
-        return -1
-    # On successful query
-    else:
-        dataObject = json.loads(data)
-        jobStatus = dataObject['jobStatus']
-        messages = dataObject['messages']
-        
-        return jobStatus, messages
-# End of check running cache function
+            logger.error("Caching has failed, see service logs for more details...")
+    return jobStatus
+# End of track cache job function
+
+
+# Start of update cache progress function
+def updateCacheProgress(progress, message, currentTime):
+    # Messages are timed by the check they came in on, so a backlog of messages is not counted as done at once
+
+    # If the message has the tiles done and total tiles
+    tilesMatch = tilesMatcher.search(message)
+    if tilesMatch:
+        tilesDone = int(tilesMatch.group(1).replace(",", ""))
+        totalTiles = int(tilesMatch.group(2).replace(",", ""))
+        # Start measuring again if the count has started again e.g. for the next level
+        if (progress['tiles'] == None) or (tilesDone < progress['tiles'][1]) or (totalTiles != progress['tiles'][2]):
+            progress['tilesStart'] = (currentTime, tilesDone)
+        progress['tiles'] = (currentTime, tilesDone, totalTiles)
+
+    # If the message has the percentage complete
+    percentMatch = percentMatcher.search(message)
+    if percentMatch:
+        percent = float(percentMatch.group(1))
+        # Start measuring again if the percentage has started again
+        if (progress['percent'] == None) or (percent < progress['percent'][1]):
+            progress['percentStart'] = (currentTime, percent)
+        progress['percent'] = (currentTime, percent)
+# End of update cache progress function
+
+
+# Start of get cache progress message function
+def getCacheProgressMessage(progress):
+    # Work out the tiles per second and time left from the tile counts
+    if (progress['tiles'] != None) and (progress['tiles'][0] > progress['tilesStart'][0]):
+        currentTime, tilesDone, totalTiles = progress['tiles']
+        tilesPerSecond = (tilesDone - progress['tilesStart'][1]) / (currentTime - progress['tilesStart'][0])
+        progressMessage = "Tiles - " + str(tilesDone) + " of " + str(totalTiles) + ", " + str(round(tilesPerSecond, 1)) + " tiles per second"
+        if (tilesPerSecond > 0):
+            progressMessage = progressMessage + ", about " + str(round((totalTiles - tilesDone) / tilesPerSecond / 60, 1)) + " minutes left"
+        return progressMessage + "..."
+    # Otherwise work out the time left from the percentage complete
+    if (progress['percent'] != None) and (progress['percent'][0] > progress['percentStart'][0]):
+        currentTime, percent = progress['percent']
+        percentPerSecond = (percent - progress['percentStart'][1]) / (currentTime - progress['percentStart'][0])
+        progressMessage = "Percent complete - " + str(percent)
+        if (percentPerSecond > 0):
+            progressMessage = progressMessage + ", about " + str(round((100 - percent) / percentPerSecond / 60, 1)) + " minutes left"
+        return progressMessage + "..."
+    return None
+# End of get cache progress message function
+
+
+# Start of get saved cache job function
+def getSavedCacheJob(serverName, serverPort, protocol, token, mapService):
+    savedJob = loadCacheJobs().get(getCacheJobKey(serverName, serverPort, mapService))
+
+    # If there is a job from an earlier run
+    if (savedJob):
+        jobCheck = checkCacheJob(serverName, serverPort, protocol, token, savedJob['task'], savedJob['jobID'])
+        # Don't start another job if it is not known whether the earlier job is still running
+        if (jobCheck == -1):
+            raise Exception("Unable to check cache job " + savedJob['jobID'] + " from an earlier run for map service - " + mapService)
+        # If the job is still running
+        if (jobCheck != None) and (jobCheck[0].lower() in ["esrijobsubmitted", "esrijobwaiting", "esrijobexecuting"]):
+            return savedJob
+        # If the job has finished but there are jobs left from splitting up the update
+        if (jobCheck != None) and (jobCheck[0].lower() == "esrijobsucceeded") and (savedJob.get('partitions')):
+            savedJob['finished'] = True
+            return savedJob
+        # Forget the job as it has finished
+        if (jobCheck != None):
+            arcpy.AddMessage("Cache job " + savedJob['jobID'] + " from an earlier run has finished - " + jobCheck[0] + "...")
+        removeCacheJob(serverName, serverPort, mapService)
+    return None
+# End of get saved cache job function
+
+
+# Start of get cache job key function
+def getCacheJobKey(serverName, serverPort, mapService):
+    # Jobs are kept by site and map service
+    return str(serverName).lower() + ":" + str(serverPort) + "/" + mapService
+# End of get cache job key function
+
+
+# Start of save cache job function
+def saveCacheJob(serverName, serverPort, mapService, taskName, jobID, jobDetails=None):
+    # If using a job file
+    if (jobFile):
+        cacheJobs = loadCacheJobs()
+        jobKey = getCacheJobKey(serverName, serverPort, mapService)
+        # If a new job
+        if (jobKey not in cacheJobs) or (cacheJobs[jobKey]['jobID'] != jobID):
+            # Keep the details needed to carry on with the rest of the update e.g. the jobs left
+            cacheJob = dict(jobDetails or {})
+            cacheJob.update({'task': taskName, 'jobID': jobID, 'submitted': int(time.time() * 1000)})
+            cacheJobs[jobKey] = cacheJob
+            saveCacheJobs(cacheJobs)
+# End of save cache job function
+
+
+# Start of remove cache job function
+def removeCacheJob(serverName, serverPort, mapService):
+    # If using a job file
+    if (jobFile):
+        cacheJobs = loadCacheJobs()
+        jobKey = getCacheJobKey(serverName, serverPort, mapService)
+        if jobKey in cacheJobs:
+            del cacheJobs[jobKey]
+            saveCacheJobs(cacheJobs)
+# End of remove cache job function
+
+
+# Start of load cache jobs function
+def loadCacheJobs():
+    # If using a job file and it exists
+    if (jobFile and os.path.exists(jobFile)):
+        try:
+            with open(jobFile, "r") as f:
+                return json.load(f)
+        # If the file can't be read, start again
+        except (IOError, ValueError):
+            arcpy.AddWarning("Job file could not be read - " + jobFile + "...")
+    return {}
+# End of load cache jobs function
+
+
+# Start of save cache jobs function
+def saveCacheJobs(cacheJobs):
+    # Write to a temporary file first so the jobs are not lost if interrupted while writing
+    with open(jobFile + ".tmp", "w") as f:
+        json.dump(cacheJobs, f)
+    if os.path.exists(jobFile):
+        os.remove(jobFile)
+    os.rename(jobFile + ".tmp", jobFile)
+# End of save cache jobs function
 
 
 # Start of get token function
 def getToken(username, password, serverName, serverPort):
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, "http", username, "requestip", renewToken)
+    if cachedToken:
+        return cachedToken
+
     query_dict = {'username':   username,
                   'password':   password,
                   'expiration': "60",
@@ -509,6 +1066,8 @@ def getToken(username, password, serverName, serverPort):
                 logger.error(token['messages'])                
             sys.exit()
         else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, "http", username, "requestip", token['token'], token.get('expires'), renewToken)
             # Return the token to the function which called for it
             return token['token']
     
@@ -525,35 +1084,8 @@ def getToken(username, password, serverName, serverPort):
 
 # Start of HTTP POST request to the server function
 def postToServer(serverName, serverPort, protocol, url, params):
-    # If on standard port
-    if (serverPort == -1 and protocol == 'http'):
-        serverPort = 80
-
-    # If on secure port
-    if (serverPort == -1 and protocol == 'https'):
-        serverPort = 443
-        
-    if (protocol == 'http'):
-        httpConn = httplib.HTTPConnection(serverName, int(serverPort))
-
-    if (protocol == 'https'):
-        httpConn = httplib.HTTPSConnection(serverName, int(serverPort))
-        
-    headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain",'referer':'backuputility','referrer':'backuputility'}
-     
-    # URL encode the resource URL
-    url = urllib.quote(url.encode('utf-8'))
-
-    # Build the connection to add the roles to the server
-    httpConn.request("POST", url, params, headers) 
-
-    response = httpConn.getresponse()
-    data = response.read()
-
-    httpConn.close()
-
-    # Return response
-    return (response, data)
+    # Post to the server using the shared keep-alive connection pool
+    return ArcGISAdminClient.postToServer(serverName, serverPort, protocol, url, params)
 # End of HTTP POST request to the server function
 
 
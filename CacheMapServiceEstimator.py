@@ -0,0 +1,405 @@
+#-------------------------------------------------------------
+# Name:       Cache Map Service Estimator
+# Purpose:    Estimates the number of tiles, disk space and time a map service cache will take before it is
+#             created, using the same configuration file as the Cache Map Service tool.
+#             - Works out the tiles at each scale covering each extent or polygon in the area of interest, or the
+#               full extent of the service. Tiles shared by more than one extent are only counted once.
+#             - Estimates the size of the cache from the average tile size for the cache format, plus the
+#               bundle index for compact caches or the disk cluster size for exploded caches.
+#             - Compares the size of the cache for each storage format and cache format, to help choose one.
+#             - Estimates the caching time from the tiles per second each caching instance draws.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import os
+import sys
+import logging
+import smtplib
+import arcpy
+import ArcGISTokenManager
+import ArcGISTileGrid
+import ArcGISCacheHelper
+import urllib
+import urllib2
+import json
+import math
+import xml.etree.ElementTree as ET
+from urlparse import urlparse
+
+# Enable data to be overwritten
+arcpy.env.overwriteOutput = True
+
+# Set global variables
+enableLogging = "false" # Use logger.info("Example..."), logger.warning("Example..."), logger.error("Example...")
+logFile = "" # os.path.join(os.path.dirname(__file__), "Example.log")
+sendErrorEmail = "false"
+emailTo = ""
+emailUser = ""
+emailPassword = ""
+emailSubject = ""
+emailMessage = ""
+enableProxy = "false"
+requestProtocol = "http" # http or https
+proxyURL = ""
+metresPerMapUnit = 1 # Metres in a map unit, 111319.49079327357 for degrees
+tileFormatBytes = {"PNG": 15000, "PNG8": 10000, "PNG24": 20000, "PNG32": 25000, "JPEG": 12000, "MIXED": 14000} # Rough placeholder size of a 256 x 256 tile for each cache format (JPEG at 75 quality), not measured from any data - Replace with sizes from a real cache of the data where possible
+averageTileBytes = 0 # Average tile size measured from a real cache of the data in the config file's cache format e.g. from the Map Service Cache Warmer, 0 uses the placeholder sizes
+storageFormatOptions = ["Compact", "Exploded"] # Storage formats to compare the cache size for
+cacheFormatOptions = ["PNG", "PNG8", "JPEG", "MIXED"] # Cache formats to compare the cache size for
+dataCoverage = 1.0 # Share of the tiles with data, as tiles with no data are not stored
+bundleSize = 128 # Tiles across and down a compact cache bundle
+bundleOverheadBytes = 131136 # Header and tile index in each compact cache bundle
+tileOverheadBytes = 4 # Stored with each tile in a compact cache bundle
+clusterSize = 4096 # Disk cluster size each exploded cache tile file is rounded up to
+tilesPerSecond = 20 # Tiles each caching instance draws per second e.g. from the Cache Map Service tool
+instanceOptions = [1, 2, 4, 8] # Numbers of caching instances to estimate the time for
+output = None
+
+# Start of main function
+def mainFunction(cacheConfig,mapService,username,password,areaOfInterest,csvFile): # Get parameters from ArcGIS Desktop tool by seperating by comma e.g. (var1 is 1st parameter,var2 is 2nd parameter,var3 is 3rd parameter)
+    try:
+        # --------------------------------------- Start of code --------------------------------------- #
+        # Convert config file to xml
+        configFileXML = ET.parse(cacheConfig)
+        # Import and reference the configuration file
+        root = configFileXML.getroot()
+
+        # Get the parameters from the config
+        tileOrigin = root.find("tile_origin").text
+        scales = root.find("scales").text
+        storageFormat = root.find("storage_format").text
+        cacheFormat = root.find("cache_format").text
+        tileCompressQuality = root.find("tile_compression_quality").text
+        dpi = root.find("dpi").text
+        tileWidth = root.find("tile_width").text
+        tileHeight = root.find("tile_height").text
+
+        # Work out the tile grid the cache will have
+        tileInfo = getCacheTileInfo(tileOrigin, scales, dpi, tileWidth, tileHeight)
+
+        # If an area of interest is given e.g. "XMin YMin XMax YMax;XMin YMin XMax YMax" or a polygon feature class
+        if (areaOfInterest):
+            extents = ArcGISCacheHelper.getAreaOfInterest(areaOfInterest)
+        # Otherwise use the full extent of the service
+        elif (mapService):
+            # Get token if needed
+            token = ""
+            if (username and password):
+                parse_object = urlparse(mapService)
+                serverNameAndPort = parse_object.netloc.split(":")
+                serverName = serverNameAndPort[0]
+                serverPort = 80
+                if (len(serverNameAndPort) > 1):
+                    serverPort = serverNameAndPort[1]
+                token = getToken(username, password, serverName, serverPort)
+            dataObject = ArcGISCacheHelper.getServiceInfo(mapService, token, enableProxy == "true")
+            extents = ArcGISCacheHelper.getAreaOfInterest("", dataObject)
+        else:
+            raise Exception("Either a map service or an area of interest is needed to estimate the cache for")
+        for extent in extents:
+            arcpy.AddMessage("Cache extent - " + " ".join([str(value) for value in extent]) + "...")
+
+        # Average size of a stored tile
+        tileBytes = getTileBytes(cacheFormat, tileCompressQuality, tileWidth, tileHeight)
+        arcpy.AddMessage("Cache format - " + cacheFormat + ", storage format - " + storageFormat + ", average tile size - " + str(round(tileBytes / 1024.0, 1)) + " KB...")
+
+        # Work out the tiles and size of each level, joining extents that share tiles
+        levelEstimates = []
+        for tileRanges in ArcGISTileGrid.getJoinedTileRanges(tileInfo, extents):
+            levelEstimate = getLevelEstimate(tileRanges, storageFormat, tileBytes)
+            levelEstimates.append(levelEstimate)
+            arcpy.AddMessage("Level " + str(levelEstimate['level']) + " (1:" + str(levelEstimate['scale']) + ") - " + str(levelEstimate['tiles']) + " tiles, " + str(levelEstimate['bundles']) + " bundles, about " + str(round(levelEstimate['bytes'] / 1048576.0, 1)) + " MB...")
+
+        totalTiles = sum([levelEstimate['tiles'] for levelEstimate in levelEstimates])
+        totalBytes = sum([levelEstimate['bytes'] for levelEstimate in levelEstimates])
+        arcpy.AddMessage("Total tiles - " + str(totalTiles) + ", about " + str(round(totalBytes / 1073741824.0, 2)) + " GB...")
+
+        # Compare the size of the cache in each storage and cache format from the same tiles
+        formatEstimates = []
+        for compareStorageFormat in storageFormatOptions:
+            for compareCacheFormat in cacheFormatOptions:
+                # The measured tile size is only used for the cache format it was measured for
+                if (compareCacheFormat.upper() == cacheFormat.upper()):
+                    compareTileBytes = tileBytes
+                else:
+                    compareTileBytes = getFormatTileBytes(compareCacheFormat, tileCompressQuality, tileWidth, tileHeight)
+                compareBytes = sum([getStorageBytes(levelEstimate['tiles'], levelEstimate['bundleCount'], compareStorageFormat, compareTileBytes) for levelEstimate in levelEstimates])
+                formatEstimates.append({'storageFormat': compareStorageFormat, 'cacheFormat': compareCacheFormat, 'tileBytes': compareTileBytes, 'bytes': compareBytes})
+                arcpy.AddMessage("Size as " + compareStorageFormat + " " + compareCacheFormat + " - About " + str(round(compareBytes / 1073741824.0, 2)) + " GB...")
+
+        # Estimate the caching time for each number of caching instances, every tile is drawn even if it has no data
+        for instances in instanceOptions:
+            cacheHours = totalTiles / (float(tilesPerSecond) * instances) / 3600
+            arcpy.AddMessage("Caching time with " + str(instances) + " caching instances - About " + str(round(cacheHours, 1)) + " hours...")
+        # Logging
+        if (enableLogging == "true"):
+            logger.info("Total tiles - " + str(totalTiles) + ", about " + str(round(totalBytes / 1073741824.0, 2)) + " GB...")
+
+        # Open text file and write header line and data
+        if (csvFile):
+            summaryFile = open(csvFile, "w")
+            header = "Level,Scale,Resolution,Tile Ranges,Tiles,Bundles,Estimated Size (MB)," + ",".join(["Caching Time " + str(instances) + " Instances (Hours)" for instances in instanceOptions]) + "\n"
+            summaryFile.write(header)
+            for levelEstimate in levelEstimates + [{'level': "Total", 'scale': "", 'resolution': "", 'ranges': "", 'tiles': totalTiles, 'bundles': sum([levelEstimate['bundles'] for levelEstimate in levelEstimates]), 'bytes': totalBytes}]:
+                serviceLine = str(levelEstimate['level']) + "," + str(levelEstimate['scale']) + "," + str(levelEstimate['resolution']) + "," + str(levelEstimate['ranges']) + "," + str(levelEstimate['tiles']) + "," + str(levelEstimate['bundles']) + "," + str(round(levelEstimate['bytes'] / 1048576.0, 2))
+                for instances in instanceOptions:
+                    serviceLine = serviceLine + "," + str(round(levelEstimate['tiles'] / (float(tilesPerSecond) * instances) / 3600, 2))
+                summaryFile.write(serviceLine + "\n")
+            # Write the size in each storage and cache format after the levels
+            summaryFile.write("\n")
+            summaryFile.write("Storage Format,Cache Format,Average Tile Size (KB),Estimated Size (MB)\n")
+            for formatEstimate in formatEstimates:
+                summaryFile.write(formatEstimate['storageFormat'] + "," + formatEstimate['cacheFormat'] + "," + str(round(formatEstimate['tileBytes'] / 1024.0, 2)) + "," + str(round(formatEstimate['bytes'] / 1048576.0, 2)) + "\n")
+            summaryFile.close()
+
+        # --------------------------------------- End of code --------------------------------------- #
+
+        # If called from gp tool return the arcpy parameter
+        if __name__ == '__main__':
+            # Return the output if there is any
+            if output:
+                arcpy.SetParameterAsText(1, output)
+        # Otherwise return the result
+        else:
+            # Return the output if there is any
+            if output:
+                return output
+        # Logging
+        if (enableLogging == "true"):
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        pass
+    # If arcpy error
+    except arcpy.ExecuteError:
+        # Build and show the error message
+        errorMessage = arcpy.GetMessages(2)
+        arcpy.AddError(errorMessage)
+        # Logging
+        if (enableLogging == "true"):
+            # Log error
+            logger.error(errorMessage)
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(errorMessage)
+    # If python error
+    except Exception as e:
+        errorMessage = ""
+        # Build and show the error message
+        for i in range(len(e.args)):
+            if (i == 0):
+                errorMessage = unicode(e.args[i]).encode('utf-8')
+            else:
+                errorMessage = errorMessage + " " + unicode(e.args[i]).encode('utf-8')
+        arcpy.AddError(errorMessage)
+        # Logging
+        if (enableLogging == "true"):
+            # Log error
+            logger.error(errorMessage)
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(errorMessage)
+# End of main function
+
+
+# Start of get cache tile info function
+def getCacheTileInfo(tileOrigin, scales, dpi, tileWidth, tileHeight):
+    # Tile origin is given as "X Y"
+    originX, originY = [float(value) for value in tileOrigin.split()]
+
+    # Levels are numbered from the smallest scale
+    lods = []
+    for scale in sorted([float(scale) for scale in scales.split(";") if scale.strip()], reverse=True):
+        # Size of a pixel in map units at the scale
+        resolution = scale * ArcGISTileGrid.inchesToMetres / float(dpi) / float(metresPerMapUnit)
+        lods.append({'level': len(lods), 'scale': scale, 'resolution': resolution})
+
+    return {'origin': {'x': originX, 'y': originY},
+            'dpi': int(dpi),
+            'cols': int(tileWidth),
+            'rows': int(tileHeight),
+            'lods': lods}
+# End of get cache tile info function
+
+
+# Start of get tile bytes function
+def getTileBytes(cacheFormat, tileCompressQuality, tileWidth, tileHeight):
+    # If the tile size has been measured
+    if (float(averageTileBytes) > 0):
+        return float(averageTileBytes)
+    return getFormatTileBytes(cacheFormat, tileCompressQuality, tileWidth, tileHeight)
+# End of get tile bytes function
+
+
+# Start of get format tile bytes function
+def getFormatTileBytes(cacheFormat, tileCompressQuality, tileWidth, tileHeight):
+    # Get the placeholder size for the cache format
+    tileBytes = float(tileFormatBytes.get(cacheFormat.upper(), tileFormatBytes["PNG"]))
+    # JPEG tiles get bigger with the compression quality
+    if (cacheFormat.upper() in ["JPEG", "MIXED"]) and (tileCompressQuality) and (int(tileCompressQuality) > 0):
+        tileBytes = tileBytes * int(tileCompressQuality) / 75.0
+    # Scale by the number of pixels in a tile
+    return tileBytes * (int(tileWidth) * int(tileHeight)) / 65536.0
+# End of get format tile bytes function
+
+
+# Start of get level estimate function
+def getLevelEstimate(tileRanges, storageFormat, tileBytes):
+    # The tile ranges at a level don't share tiles, but can share bundles
+    tiles = 0
+    levelBundles = set()
+    for tileRange in tileRanges:
+        tiles = tiles + (tileRange['columns'] * tileRange['rows'])
+        # Bundles covering the tiles
+        for bundleRow in range(tileRange['startRow'] // int(bundleSize), (tileRange['endRow'] // int(bundleSize)) + 1):
+            for bundleColumn in range(tileRange['startColumn'] // int(bundleSize), (tileRange['endColumn'] // int(bundleSize)) + 1):
+                levelBundles.add((bundleRow, bundleColumn))
+
+    return {'level': tileRanges[0]['level'],
+            'scale': tileRanges[0]['scale'],
+            'resolution': tileRanges[0]['resolution'],
+            'ranges': len(tileRanges),
+            'tiles': tiles,
+            # Exploded caches don't have bundles
+            'bundles': len(levelBundles) if (storageFormat.lower() == "compact") else 0,
+            'bundleCount': len(levelBundles),
+            'bytes': getStorageBytes(tiles, len(levelBundles), storageFormat, tileBytes)}
+# End of get level estimate function
+
+
+# Start of get storage bytes function
+def getStorageBytes(tiles, bundles, storageFormat, tileBytes):
+    # Tiles with no data are not stored
+    storedTiles = tiles * float(dataCoverage)
+
+    # If a compact cache, tiles are stored in bundles with an index
+    if (storageFormat.lower() == "compact"):
+        return (storedTiles * (tileBytes + int(tileOverheadBytes))) + (bundles * int(bundleOverheadBytes))
+    # Otherwise each tile is a file, taking up whole disk clusters
+    else:
+        return storedTiles * math.ceil(tileBytes / int(clusterSize)) * int(clusterSize)
+# End of get storage bytes function
+
+
+# Start of get token function
+def getToken(username, password, serverName, serverPort):
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, "http", username, "requestip", renewToken)
+    if cachedToken:
+        return cachedToken
+
+    query_dict = {'username':   username,
+                  'password':   password,
+                  'expiration': "60",
+                  'client':     'requestip'}
+
+    query_string = urllib.urlencode(query_dict)
+    url = "http://{}:{}/arcgis/admin/generateToken?f=json".format(serverName, serverPort)
+
+    try:
+        token = json.loads(urllib2.urlopen(url, query_string).read())
+        if "token" not in token or token == None:
+            arcpy.AddError("Failed to get token, return message from server:")
+            arcpy.AddError(token['messages'])
+            # Logging
+            if (enableLogging == "true"):
+                logger.error("Failed to get token, return message from server:")
+                logger.error(token['messages'])
+            sys.exit()
+        else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, "http", username, "requestip", token['token'], token.get('expires'), renewToken)
+            # Return the token to the function which called for it
+            return token['token']
+
+    except urllib2.URLError, error:
+        arcpy.AddError("Could not connect to machine {} on port {}".format(serverName, serverPort))
+        arcpy.AddError(error)
+        # Logging
+        if (enableLogging == "true"):
+            logger.error("Could not connect to machine {} on port {}".format(serverName, serverPort))
+            logger.error(error)
+        sys.exit()
+# End of get token function
+
+
+# Start of set logging function
+def setLogging(logFile):
+    # Create a logger
+    logger = logging.getLogger(os.path.basename(__file__))
+    logger.setLevel(logging.DEBUG)
+    # Setup log message handler
+    logMessage = logging.FileHandler(logFile)
+    # Setup the log formatting
+    logFormat = logging.Formatter("%(asctime)s: %(levelname)s - %(message)s", "%d/%m/%Y - %H:%M:%S")
+    # Add formatter to log message handler
+    logMessage.setFormatter(logFormat)
+    # Add log message handler to logger
+    logger.addHandler(logMessage)
+
+    return logger, logMessage
+# End of set logging function
+
+
+# Start of send email function
+def sendEmail(message):
+    # Send an email
+    arcpy.AddMessage("Sending email...")
+    # Server and port information
+    smtpServer = smtplib.SMTP("smtp.gmail.com",587)
+    smtpServer.ehlo()
+    smtpServer.starttls()
+    smtpServer.ehlo
+    # Login with sender email address and password
+    smtpServer.login(emailUser, emailPassword)
+    # Email content
+    header = 'To:' + emailTo + '\n' + 'From: ' + emailUser + '\n' + 'Subject:' + emailSubject + '\n'
+    body = header + '\n' + emailMessage + '\n' + '\n' + message
+    # Send the email and close the connection
+    smtpServer.sendmail(emailUser, emailTo, body)
+# End of send email function
+
+
+# This test allows the script to be used from the operating
+# system command prompt (stand-alone), in a Python IDE,
+# as a geoprocessing script tool, or as a module imported in
+# another script
+if __name__ == '__main__':
+    # Arguments are optional - If running from ArcGIS Desktop tool, parameters will be loaded into *argv
+    argv = tuple(arcpy.GetParameterAsText(i)
+        for i in range(arcpy.GetArgumentCount()))
+    # Logging
+    if (enableLogging == "true"):
+        # Setup logging
+        logger, logMessage = setLogging(logFile)
+        # Log start of process
+        logger.info("Process started.")
+    # Setup the use of a proxy for requests
+    if (enableProxy == "true"):
+        # Setup the proxy
+        proxy = urllib2.ProxyHandler({requestProtocol : proxyURL})
+        openURL = urllib2.build_opener(proxy)
+        # Install the proxy
+        urllib2.install_opener(openURL)
+    mainFunction(*argv)
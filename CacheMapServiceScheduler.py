@@ -0,0 +1,433 @@
+#-------------------------------------------------------------
+# Name:       Cache Map Service Scheduler
+# Purpose:    Updates the caches of a number of map services from a CSV file as a batch, keeping as many cache
+#             jobs running at once as the caching services on the ArcGIS Server site allow.
+#             - The CSV file has a line for each map service - Map Service,Update Mode,Cache Instances,Area Of Interest
+#             - Jobs are started in order of their estimated tile count, smallest first by default.
+#             - The queue is saved to the queue file, so if the script is stopped, running it again carries on
+#               with the queue, checking the jobs that were running and starting the rest.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import os
+import sys
+import logging
+import smtplib
+import arcpy
+import ArcGISTileGrid
+import CacheMapService
+import csv
+import json
+import urllib
+import time
+
+# Enable data to be overwritten
+arcpy.env.overwriteOutput = True
+
+# Set global variables
+enableLogging = "false" # Use logger.info("Example..."), logger.warning("Example..."), logger.error("Example...")
+logFile = "" # os.path.join(os.path.dirname(__file__), "Example.log")
+sendErrorEmail = "false"
+emailTo = ""
+emailUser = ""
+emailPassword = ""
+emailSubject = ""
+emailMessage = ""
+maxRunningJobs = 0 # Cache jobs running at once, 0 uses the maximum instances of the CachingControllers service
+maxRunningInstances = 0 # Caching instances the running jobs can use between them, 0 uses the maximum instances of the CachingTools service
+priorityOrder = "smallest" # "smallest" starts the jobs with the fewest tiles first, "largest" starts the jobs with the most tiles first
+queuePollInterval = 30 # Seconds between checks on the running jobs
+output = None
+
+# Start of main function
+def mainFunction(agsServerSite,username,password,servicesCSV,queueFile): # Get parameters from ArcGIS Desktop tool by seperating by comma e.g. (var1 is 1st parameter,var2 is 2nd parameter,var3 is 3rd parameter)
+    try:
+        # --------------------------------------- Start of code --------------------------------------- #
+        # Get the server site details
+        protocol, serverName, serverPort, context = CacheMapService.splitSiteURL(agsServerSite)
+
+        # If any of the variables are blank
+        if (serverName == None or serverPort == None or protocol == None or context == None):
+            return -1
+
+        # Get token
+        token = CacheMapService.getToken(username, password, serverName, serverPort)
+
+        # Carry on with the queue from an earlier run if there is one
+        queue = loadQueue(queueFile, agsServerSite)
+        if (queue != None):
+            arcpy.AddMessage("Carrying on with the queue from an earlier run - " + queueFile + "...")
+        # Otherwise build the queue from the CSV file
+        else:
+            arcpy.AddMessage("Getting the map services to cache from " + servicesCSV + "...")
+            queue = buildQueue(serverName, serverPort, protocol, token, servicesCSV)
+            saveQueue(queueFile, agsServerSite, queue)
+        arcpy.AddMessage("Cache jobs queued - " + str(len([queueItem for queueItem in queue if queueItem['status'] == "queued"])) + ", running - " + str(len([queueItem for queueItem in queue if queueItem['status'] == "running"])) + "...")
+
+        # Get the number of jobs and caching instances that can run at once
+        jobLimit, instanceLimit = getCachingLimits(serverName, serverPort, protocol, token)
+        arcpy.AddMessage("Running up to " + str(jobLimit) + " cache jobs using up to " + str(instanceLimit) + " caching instances at once...")
+
+        # Run the jobs in the queue
+        runQueue(serverName, serverPort, protocol, username, password, queue, queueFile, agsServerSite, jobLimit, instanceLimit)
+
+        # Report the jobs that have finished
+        succeededJobs = [queueItem for queueItem in queue if queueItem['status'] == "succeeded"]
+        failedJobs = [queueItem for queueItem in queue if queueItem['status'] == "failed"]
+        arcpy.AddMessage("Cache jobs succeeded - " + str(len(succeededJobs)) + ", failed - " + str(len(failedJobs)) + "...")
+        # Logging
+        if (enableLogging == "true"):
+            logger.info("Cache jobs succeeded - " + str(len(succeededJobs)) + ", failed - " + str(len(failedJobs)) + "...")
+
+        # All jobs have finished so remove the queue
+        if (queueFile and os.path.exists(queueFile)):
+            os.remove(queueFile)
+
+        # If any jobs have failed
+        if (len(failedJobs) > 0):
+            errorMessage = "Caching has failed for - " + ", ".join([queueItem['mapService'] + " (" + queueItem['name'] + ")" for queueItem in failedJobs]) + ", see service logs for more details..."
+            arcpy.AddError(errorMessage)
+            # Logging
+            if (enableLogging == "true"):
+                logger.error(errorMessage)
+            if (sendErrorEmail == "true"):
+                # Send email
+                sendEmail(errorMessage)
+
+        # --------------------------------------- End of code --------------------------------------- #
+
+        # If called from gp tool return the arcpy parameter
+        if __name__ == '__main__':
+            # Return the output if there is any
+            if output:
+                arcpy.SetParameterAsText(1, output)
+        # Otherwise return the result
+        else:
+            # Return the output if there is any
+            if output:
+                return output
+        # Logging
+        if (enableLogging == "true"):
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        pass
+    # If arcpy error
+    except arcpy.ExecuteError:
+        # Build and show the error message
+        errorMessage = arcpy.GetMessages(2)
+        arcpy.AddError(errorMessage)
+        # Logging
+        if (enableLogging == "true"):
+            # Log error
+            logger.error(errorMessage)
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(errorMessage)
+    # If python error
+    except Exception as e:
+        errorMessage = ""
+        # Build and show the error message
+        for i in range(len(e.args)):
+            if (i == 0):
+                errorMessage = unicode(e.args[i]).encode('utf-8')
+            else:
+                errorMessage = errorMessage + " " + unicode(e.args[i]).encode('utf-8')
+        arcpy.AddError(errorMessage)
+        # Logging
+        if (enableLogging == "true"):
+            # Log error
+            logger.error(errorMessage)
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(errorMessage)
+# End of main function
+
+
+# Start of build queue function
+def buildQueue(serverName, serverPort, protocol, token, servicesCSV):
+    queue = []
+    with open(servicesCSV, "rb") as f:
+        for line in csv.reader(f):
+            # Skip blank lines and the header line
+            if (len(line) < 3) or (not line[2].strip().isdigit()):
+                continue
+            mapService = line[0].strip()
+            updateMode = line[1].strip()
+            cacheInstances = line[2].strip()
+            areaOfInterest = ""
+            if (len(line) > 3):
+                areaOfInterest = line[3].strip()
+
+            # New caches need a configuration file so are created with the Cache Map Service tool
+            if (updateMode.lower() == "new"):
+                arcpy.AddWarning("New caches can't be scheduled, use the Cache Map Service tool to create the cache - " + mapService + "...")
+                continue
+
+            # If recreating all tiles
+            if (updateMode.lower() == "existing - recreate all tiles"):
+                updateMode = "RECREATE_ALL_TILES"
+            # If recreating empty tiles
+            else:
+                updateMode = "RECREATE_EMPTY_TILES"
+
+            # Get tile info for the service
+            serviceInfo = CacheMapService.getTileInfo(serverName, serverPort, protocol, mapService, token)
+            # If this is not a cached map service
+            if (not serviceInfo) or (serviceInfo == -1):
+                arcpy.AddWarning(mapService + " is not a cached map service so has not been queued...")
+                # Logging
+                if (enableLogging == "true"):
+                    logger.warning(mapService + " is not a cached map service so has not been queued...")
+                continue
+
+            # Split the update into jobs for the area of interest
+            extents, updateFeatures = CacheMapService.getAreaOfInterest(areaOfInterest)
+            partitions = CacheMapService.getCachePartitions(serviceInfo, CacheMapService.getCacheScales(serviceInfo), extents)
+            for partition in partitions:
+                queue.append({'mapService': mapService,
+                              'name': partition['name'],
+                              'updateMode': updateMode,
+                              'cacheInstances': cacheInstances,
+                              'levels': partition['levels'],
+                              'extent': partition['extent'],
+                              'updateFeatures': updateFeatures,
+                              'spatialReference': serviceInfo['tileInfo'].get('spatialReference'),
+                              'tiles': getTileCount(serviceInfo, partition),
+                              'status': "queued",
+                              'jobID': None,
+                              'started': None,
+                              'finished': None})
+
+    # Order the jobs by their estimated tile count
+    queue.sort(key=lambda queueItem: queueItem['tiles'], reverse=(priorityOrder == "largest"))
+    for queueItem in queue:
+        arcpy.AddMessage("Queued " + queueItem['mapService'] + " (" + queueItem['name'] + ") - About " + str(queueItem['tiles']) + " tiles...")
+    return queue
+# End of build queue function
+
+
+# Start of get tile count function
+def getTileCount(serviceInfo, partition):
+    tileInfo = serviceInfo['tileInfo']
+
+    # Get the levels for the scales being cached
+    scales = partition['levels'].split(";")
+    levels = [int(level['level']) for level in tileInfo['lods'] if str(level['scale']) in scales]
+
+    # If no extent, use the full extent of the service
+    extent = partition['extent']
+    if (extent == None):
+        fullExtent = serviceInfo['fullExtent']
+        extent = [float(fullExtent['xmin']), float(fullExtent['ymin']), float(fullExtent['xmax']), float(fullExtent['ymax'])]
+
+    # Add up the tiles covering the extent at each level
+    tileCount = 0
+    for tileRange in ArcGISTileGrid.getExtentTileRanges(tileInfo, extent, levels):
+        tileCount = tileCount + (tileRange['columns'] * tileRange['rows'])
+    return tileCount
+# End of get tile count function
+
+
+# Start of get caching limits function
+def getCachingLimits(serverName, serverPort, protocol, token):
+    jobLimit = int(maxRunningJobs)
+    instanceLimit = int(maxRunningInstances)
+
+    # If not set, get the limits from the maximum instances of the caching services on each machine
+    if (jobLimit <= 0) or (instanceLimit <= 0):
+        machineCount = len(getAdminInfo(serverName, serverPort, protocol, token, "/arcgis/admin/machines").get('machines', [])) or 1
+        if (jobLimit <= 0):
+            jobLimit = int(getAdminInfo(serverName, serverPort, protocol, token, "/arcgis/admin/services/System/CachingControllers.GPServer").get('maxInstancesPerNode', 1)) * machineCount
+        if (instanceLimit <= 0):
+            instanceLimit = int(getAdminInfo(serverName, serverPort, protocol, token, "/arcgis/admin/services/System/CachingTools.GPServer").get('maxInstancesPerNode', 1)) * machineCount
+    return max(1, jobLimit), max(1, instanceLimit)
+# End of get caching limits function
+
+
+# Start of get admin info function
+def getAdminInfo(serverName, serverPort, protocol, token, url):
+    params = urllib.urlencode({'token': token, 'f': 'json'})
+
+    # Post to the server
+    try:
+        response, data = CacheMapService.postToServer(serverName, serverPort, protocol, url, params)
+    except:
+        arcpy.AddWarning("Unable to get " + url + " from " + serverName + "...")
+        return {}
+
+    # If there is an error
+    if (response.status != 200):
+        arcpy.AddWarning("Unable to get " + url + " from " + serverName + " - " + str(data))
+        return {}
+    dataObject = json.loads(data)
+    if ('status' in dataObject and dataObject['status'] == "error"):
+        arcpy.AddWarning("Unable to get " + url + " from " + serverName + " - " + str(dataObject.get('messages')))
+        return {}
+    return dataObject
+# End of get admin info function
+
+
+# Start of run queue function
+def runQueue(serverName, serverPort, protocol, username, password, queue, queueFile, agsServerSite, jobLimit, instanceLimit):
+    while True:
+        # Get the token each time, as it will be renewed if it is about to expire during a long batch
+        token = CacheMapService.getToken(username, password, serverName, serverPort)
+
+        # Check the running jobs
+        for queueItem in queue:
+            if (queueItem['status'] != "running"):
+                continue
+            jobCheck = CacheMapService.checkCacheJob(serverName, serverPort, protocol, token, "Manage Map Cache Tiles", queueItem['jobID'])
+            # If the job could not be checked, try again next time
+            if (jobCheck == -1):
+                continue
+            # If the job has finished
+            if (jobCheck == None) or (jobCheck[0].lower() not in ["esrijobsubmitted", "esrijobwaiting", "esrijobexecuting", "esrijobcancelling"]):
+                if (jobCheck != None) and (jobCheck[0].lower() == "esrijobsucceeded"):
+                    queueItem['status'] = "succeeded"
+                else:
+                    queueItem['status'] = "failed"
+                queueItem['finished'] = int(time.time() * 1000)
+                jobMinutes = round((queueItem['finished'] - queueItem['started']) / 60000.0, 1)
+                arcpy.AddMessage("Cache job " + queueItem['status'] + " - " + queueItem['mapService'] + " (" + queueItem['name'] + ") in " + str(jobMinutes) + " minutes...")
+                # Logging
+                if (enableLogging == "true"):
+                    logger.info("Cache job " + queueItem['status'] + " - " + queueItem['mapService'] + " (" + queueItem['name'] + ") in " + str(jobMinutes) + " minutes...")
+                saveQueue(queueFile, agsServerSite, queue)
+
+        # Start the next jobs in the queue while there is room for them
+        runningJobs = [queueItem for queueItem in queue if queueItem['status'] == "running"]
+        instancesUsed = sum([int(queueItem['cacheInstances']) for queueItem in runningJobs])
+        for queueItem in queue:
+            if (queueItem['status'] != "queued"):
+                continue
+            # Wait for running jobs to finish if there are too many jobs or instances in use, keeping to the order of the queue
+            if (len(runningJobs) >= jobLimit) or ((len(runningJobs) > 0) and (instancesUsed + int(queueItem['cacheInstances']) > instanceLimit)):
+                break
+            jobID = CacheMapService.startCache(serverName, serverPort, protocol, queueItem['mapService'], token, queueItem['levels'], queueItem['updateMode'], queueItem['cacheInstances'], queueItem['extent'], queueItem['updateFeatures'], queueItem['spatialReference'])
+            queueItem['started'] = int(time.time() * 1000)
+            # If the job could not be started
+            if (jobID == -1):
+                queueItem['status'] = "failed"
+                queueItem['finished'] = queueItem['started']
+            else:
+                queueItem['status'] = "running"
+                queueItem['jobID'] = jobID
+                runningJobs.append(queueItem)
+                instancesUsed = instancesUsed + int(queueItem['cacheInstances'])
+                arcpy.AddMessage("Cache job started - " + queueItem['mapService'] + " (" + queueItem['name'] + "), about " + str(queueItem['tiles']) + " tiles, job " + jobID + "...")
+                # Logging
+                if (enableLogging == "true"):
+                    logger.info("Cache job started - " + queueItem['mapService'] + " (" + queueItem['name'] + "), about " + str(queueItem['tiles']) + " tiles, job " + jobID + "...")
+            saveQueue(queueFile, agsServerSite, queue)
+
+        # If all the jobs have finished
+        if (len(runningJobs) == 0) and (len([queueItem for queueItem in queue if queueItem['status'] == "queued"]) == 0):
+            break
+        time.sleep(float(queuePollInterval))
+# End of run queue function
+
+
+# Start of load queue function
+def loadQueue(queueFile, agsServerSite):
+    # If using a queue file and it exists
+    if (queueFile and os.path.exists(queueFile)):
+        try:
+            with open(queueFile, "r") as f:
+                storedQueue = json.load(f)
+            # Only carry on if the queue is for the same site
+            if (storedQueue.get('site') == agsServerSite):
+                return storedQueue.get('jobs', [])
+            else:
+                arcpy.AddWarning("Queue is for a different ArcGIS Server site, starting again...")
+        # If the file can't be read, start again
+        except (IOError, ValueError):
+            arcpy.AddWarning("Queue could not be read, starting again...")
+    return None
+# End of load queue function
+
+
+# Start of save queue function
+def saveQueue(queueFile, agsServerSite, queue):
+    # If using a queue file
+    if (queueFile):
+        # Write to a temporary file first so the queue is not lost if interrupted while writing
+        with open(queueFile + ".tmp", "w") as f:
+            json.dump({'site': agsServerSite, 'updated': int(time.time() * 1000), 'jobs': queue}, f)
+        if os.path.exists(queueFile):
+            os.remove(queueFile)
+        os.rename(queueFile + ".tmp", queueFile)
+# End of save queue function
+
+
+# Start of set logging function
+def setLogging(logFile):
+    # Create a logger
+    logger = logging.getLogger(os.path.basename(__file__))
+    logger.setLevel(logging.DEBUG)
+    # Setup log message handler
+    logMessage = logging.FileHandler(logFile)
+    # Setup the log formatting
+    logFormat = logging.Formatter("%(asctime)s: %(levelname)s - %(message)s", "%d/%m/%Y - %H:%M:%S")
+    # Add formatter to log message handler
+    logMessage.setFormatter(logFormat)
+    # Add log message handler to logger
+    logger.addHandler(logMessage)
+
+    return logger, logMessage
+# End of set logging function
+
+
+# Start of send email function
+def sendEmail(message):
+    # Send an email
+    arcpy.AddMessage("Sending email...")
+    # Server and port information
+    smtpServer = smtplib.SMTP("smtp.gmail.com",587)
+    smtpServer.ehlo()
+    smtpServer.starttls()
+    smtpServer.ehlo
+    # Login with sender email address and password
+    smtpServer.login(emailUser, emailPassword)
+    # Email content
+    header = 'To:' + emailTo + '\n' + 'From: ' + emailUser + '\n' + 'Subject:' + emailSubject + '\n'
+    body = header + '\n' + emailMessage + '\n' + '\n' + message
+    # Send the email and close the connection
+    smtpServer.sendmail(emailUser, emailTo, body)
+# End of send email function
+
+
+# This test allows the script to be used from the operating
+# system command prompt (stand-alone), in a Python IDE,
+# as a geoprocessing script tool, or as a module imported in
+# another script
+if __name__ == '__main__':
+    # Arguments are optional - If running from ArcGIS Desktop tool, parameters will be loaded into *argv
+    argv = tuple(arcpy.GetParameterAsText(i)
+        for i in range(arcpy.GetArgumentCount()))
+    # Logging
+    if (enableLogging == "true"):
+        # Setup logging
+        logger, logMessage = setLogging(logFile)
+        # Log start of process
+        logger.info("Process started.")
+    mainFunction(*argv)
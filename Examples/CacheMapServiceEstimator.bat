@@ -0,0 +1,8 @@
+REM --- Cache Map Service Estimator ---
+C:\Python27\ArcGIS10.2\python "C:\Development\Projects\ArcGIS Admin Toolkit\CacheMapServiceEstimator.py" ^
+ "C:\Development\Projects\ArcGIS Admin Toolkit\Configuration\CacheMapService.xml" ^
+ "http://laptop-sfw.etgnz.eagle.co.nz:6080/arcgis/rest/services/Wellington/CarparkingCached/MapServer" ^
+ "" ^
+ "" ^
+ "" ^
+ "C:\Temp\CacheMapServiceEstimate.csv"
\ No newline at end of file
@@ -0,0 +1,7 @@
+REM --- Cache Map Service Scheduler ---
+C:\Python27\ArcGIS10.2\python "C:\Development\Projects\ArcGIS Admin Toolkit\CacheMapServiceScheduler.py" ^
+ "http://laptop-sfw.etgnz.eagle.co.nz:6080/arcgis" ^
+ "siteadmin" ^
+ "adm1n" ^
+ "C:\Development\Projects\ArcGIS Admin Toolkit\Configuration\CacheMapServiceScheduler.csv" ^
+ "C:\Temp\CacheMapServiceQueue.json"
\ No newline at end of file
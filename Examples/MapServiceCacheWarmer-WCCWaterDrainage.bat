@@ -0,0 +1,8 @@
+REM ----- Warm map service cache -----
+C:\Python27\ArcGIS10.3\python "C:\Development\Python for ArcGIS Tools\ArcGIS Admin Toolkit\MapServiceCacheWarmer.py" ^
+ "http://gis.wcc.govt.nz/gistest/rest/services/Cache/WaterDrainage/MapServer" ^
+ "" ^
+ "" ^
+ "1748000 5424000 1756000 5432000" ^
+ "10;11;12;13;14" ^
+ "C:\Temp\WCC-WaterDrainage-Warm.json"
\ No newline at end of file
@@ -15,11 +15,12 @@ import os
 import sys
 import logging
 import smtplib
-import httplib
 import json
 import urllib
 import urlparse
 import arcpy
+import ArcGISAdminClient
+import ArcGISTokenManager
 
 # Enable data to be overwritten
 arcpy.env.overwriteOutput = True
@@ -105,9 +106,9 @@ def mainFunction(agsServerSite,username,password,usersCSV): # Get parameters fro
                 count +=1
 
             # Call functions to add users and roles
-            addRoles(roles,token,serverName,serverPort)
-            addUsers(users,token,serverName,serverPort)
-            addUserToRoles(addUserRole,token,serverName,serverPort)
+            addRoles(roles,token,serverName,serverPort,protocol)
+            addUsers(users,token,serverName,serverPort,protocol)
+            addUserToRoles(addUserRole,token,serverName,serverPort,protocol)
             
         # --------------------------------------- End of code --------------------------------------- #  
             
@@ -168,7 +169,7 @@ def mainFunction(agsServerSite,username,password,usersCSV): # Get parameters fro
 
 
 # Start of Add roles to ArcGIS Server function
-def addRoles(roleDict, token, serverName, serverPort):  
+def addRoles(roleDict, token, serverName, serverPort, protocol):  
     for item in roleDict.keys():
         # Build the dictionary with the role name and description
         roleToAdd = {"rolename":item}
@@ -179,20 +180,14 @@ def addRoles(roleDict, token, serverName, serverPort):
         # URL for adding a role
         addroleURL = "/arcgis/admin/security/roles/add"
         params = urllib.urlencode({'token':token,'f':'json','Role':jsRole})
-        headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
 
-        # Build the connection to add the roles to the server
-        httpRoleConn = httplib.HTTPConnection(serverName, serverPort)
-        httpRoleConn.request("POST",addroleURL,params,headers)
+        # Post to the server to add the roles
+        response, data = postToServer(serverName, serverPort, protocol, addroleURL, params)
 
-        response = httpRoleConn.getresponse()
         if (response.status != 200):
-            httpRoleConn.close()
             arcpy.AddError("Could not add role...")
             return
         else:
-            data = response.read()
-            
             # Check that data returned is not an error object
             if not assertJsonSuccess(data):          
                 arcpy.AddError("Error when adding role. " + str(data))
@@ -200,89 +195,74 @@ def addRoles(roleDict, token, serverName, serverPort):
             else:
                 arcpy.AddMessage("Added role successfully...")
 
-        httpRoleConn.close()
-
         # Assign a privilege to the recently added role 
         assignAdminUrl = "/arcgis/admin/security/roles/assignPrivilege"
         params = urllib.urlencode({'token':token,'f':'json',"rolename":item, "privilege":roleDict[item].keys()[0]})
-            
-        headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
 
-        # Build the connection to assign the privilege
-        httpRoleAdminConn = httplib.HTTPConnection(serverName, serverPort)
-        httpRoleAdminConn.request("POST",assignAdminUrl,params,headers)
+        # Post to the server to assign the privilege
+        response, data = postToServer(serverName, serverPort, protocol, assignAdminUrl, params)
 
-        response = httpRoleAdminConn.getresponse()
         if (response.status != 200):
-            httpRoleAdminConn.close()
             arcpy.AddError("Could not assign privilege to role.")
             return
         else:
-            data = response.read()
-            
             # Check that data returned is not an error object
             if not assertJsonSuccess(data):          
                 arcpy.AddError("Error when assigning privileges to role. " + str(data))
                 return
             else:
                 arcpy.AddMessage("Assigned privileges to role successfully...")
-
-        httpRoleAdminConn.close()
 # End of Add roles to ArcGIS Server function
 
 
 # Start of Add users to ArcGIS Server function
-def addUsers(userDict,token, serverName, serverPort):
+def addUsers(userDict,token, serverName, serverPort, protocol):
     for userAdd in userDict:
         jsUser = json.dumps(userDict[userAdd])
         
         # URL for adding a user
         addUserURL = "/arcgis/admin/security/users/add"
         params = urllib.urlencode({'token':token,'f':'json','user':jsUser})
-        headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
 
-        # Build the connection to add the users
-        httpRoleConn = httplib.HTTPConnection(serverName, serverPort)
-        httpRoleConn.request("POST",addUserURL,params,headers)
-
-        httpRoleConn.close()
+        # Post to the server to add the users
+        postToServer(serverName, serverPort, protocol, addUserURL, params)
 # End of Add roles to ArcGIS Server function
 
 
 # Start of Add user to roles function
-def addUserToRoles(userRoleDict,token, serverName, serverPort):
+def addUserToRoles(userRoleDict,token, serverName, serverPort, protocol):
     for userRole in userRoleDict.keys():
 
         # Using the current role build the URL to assign the right users to the role
         addUserURL = "/arcgis/admin/security/roles/addUsersToRole"
         params = urllib.urlencode({'token':token,'f':'json',"rolename":userRole,"users":userRoleDict[userRole]})
-        headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
     
-        # Build the connection
-        httpRoleConn = httplib.HTTPConnection(serverName, serverPort)
-        httpRoleConn.request("POST",addUserURL,params,headers)
+        # Post to the server
+        response, data = postToServer(serverName, serverPort, protocol, addUserURL, params)
 
-        response = httpRoleConn.getresponse()
         if (response.status != 200):
-            httpRoleConn.close()
             arcpy.AddError("Could not add user to role...")
             return
         else:
-            data = response.read()
-            
             # Check that data returned is not an error object
             if not assertJsonSuccess(data):          
                 arcpy.AddError("Error when adding user to role. " + str(data))
                 return
             else:
                 arcpy.AddMessage("Added user to role successfully...")
-                    
-        httpRoleConn.close()
 # End of Add user to roles function
 
         
 # Start of get token function
 def getToken(username, password, serverName, serverPort, protocol):
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort, protocol)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, protocol, username, "referer", renewToken)
+    if cachedToken:
+        return cachedToken
+
     params = urllib.urlencode({'username': username.decode(sys.stdin.encoding or sys.getdefaultencoding()).encode('utf-8'), 'password': password.decode(sys.stdin.encoding or sys.getdefaultencoding()).encode('utf-8'),'client': 'referer','referer':'backuputility','f': 'json'})
            
     # Construct URL to get a token
@@ -327,41 +307,16 @@ def getToken(username, password, serverName, serverPort, protocol):
                 sys.exit()
             return -1        
         else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, protocol, username, "referer", dataObject['token'], dataObject.get('expires'), renewToken)
             return dataObject['token']
 # End of get token function
 
 
 # Start of HTTP POST request to the server function
 def postToServer(serverName, serverPort, protocol, url, params):
-    # If on standard port
-    if (serverPort == -1 and protocol == 'http'):
-        serverPort = 80
-
-    # If on secure port
-    if (serverPort == -1 and protocol == 'https'):
-        serverPort = 443
-        
-    if (protocol == 'http'):
-        httpConn = httplib.HTTPConnection(serverName, int(serverPort))
-
-    if (protocol == 'https'):
-        httpConn = httplib.HTTPSConnection(serverName, int(serverPort))
-        
-    headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain",'referer':'backuputility','referrer':'backuputility'}
-     
-    # URL encode the resource URL
-    url = urllib.quote(url.encode('utf-8'))
-
-    # Build the connection to add the roles to the server
-    httpConn.request("POST", url, params, headers) 
-
-    response = httpConn.getresponse()
-    data = response.read()
-
-    httpConn.close()
-
-    # Return response
-    return (response, data)
+    # Post to the server using the shared keep-alive connection pool
+    return ArcGISAdminClient.postToServer(serverName, serverPort, protocol, url, params)
 # End of HTTP POST request to the server function
 
 
@@ -0,0 +1,381 @@
+#-------------------------------------------------------------
+# Name:       Map Service Cache Scanner
+# Purpose:    Checks how complete the tile cache of a cached map service is. Walks the full tile grid for the
+#             chosen levels over an area of interest, checks each tile exists with a HEAD request, and
+#             produces a bitmap of the present and missing tiles for each level along with a CSV summary.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import os
+import sys
+import logging
+import smtplib
+import arcpy
+import ArcGISAdminClient
+import ArcGISTokenManager
+import ArcGISTileGrid
+import ArcGISCacheHelper
+import urllib
+import urllib2
+import time
+import json
+import zlib
+import base64
+from urlparse import urlparse
+
+# Enable data to be overwritten
+arcpy.env.overwriteOutput = True
+
+# Set global variables
+enableLogging = "false" # Use logger.info("Example..."), logger.warning("Example..."), logger.error("Example...")
+logFile = "" # os.path.join(os.path.dirname(__file__), "Example.log")
+sendErrorEmail = "false"
+emailTo = ""
+emailUser = ""
+emailPassword = ""
+emailSubject = ""
+emailMessage = ""
+enableProxy = "false"
+requestProtocol = "http" # http or https
+proxyURL = ""
+scanConnections = 8 # Number of tiles checked at the same time
+scanBatchSize = 1000 # Number of tiles checked before the progress is shown
+scanMaxTiles = 10000000 # Levels with more tiles than this in the area of interest are skipped
+useHeadRequests = "true" # "false" downloads each tile rather than only asking for the headers
+output = None
+
+# Start of main function
+def mainFunction(mapService,username,password,areaOfInterest,levels,bitmapFile,csvFile): # Get parameters from ArcGIS Desktop tool by seperating by comma e.g. (var1 is 1st parameter,var2 is 2nd parameter,var3 is 3rd parameter)
+    try:
+        # --------------------------------------- Start of code --------------------------------------- #
+        # Get the server name and port
+        parse_object = urlparse(mapService)
+        protocol = parse_object.scheme
+        serverNameAndPort = parse_object.netloc.split(":")
+        serverName = serverNameAndPort[0]
+        if (len(serverNameAndPort) > 1):
+            serverPort = serverNameAndPort[1]
+        else:
+            serverPort = 80
+            if (protocol.lower() == "https"):
+                serverPort = 443
+
+        # Get token if needed
+        token = ""
+        if (username and password):
+            token = getToken(username, password, serverName, serverPort)
+
+        # Get the map service details
+        dataObject = ArcGISCacheHelper.getServiceInfo(mapService, token, enableProxy == "true")
+        if "tileInfo" not in dataObject:
+            arcpy.AddError("Map service is not cached - " + mapService)
+            # Logging
+            if (enableLogging == "true"):
+                logger.error("Map service is not cached - " + mapService)
+            sys.exit()
+        tileInfo = dataObject['tileInfo']
+
+        # Get the area of interest, the full extent of the service if not specified - The bitmap covers the extent around all the extents given
+        extent = ArcGISCacheHelper.getEnvelope(ArcGISCacheHelper.getAreaOfInterest(areaOfInterest, dataObject))
+        arcpy.AddMessage("Area of interest - " + " ".join([str(value) for value in extent]) + "...")
+
+        # If a string, convert to array for levels
+        scanLevels = None
+        if (levels):
+            if isinstance(levels, basestring):
+                levels = levels.split(";")
+            scanLevels = [int(level) for level in levels if str(level).strip()]
+
+        # Work out the tiles covering the area of interest at each level
+        tileRanges = ArcGISTileGrid.getExtentTileRanges(tileInfo, extent, scanLevels)
+
+        scanResults = []
+        scanStartTime = time.time()
+        for tileRange in tileRanges:
+            tileCount = tileRange['rows'] * tileRange['columns']
+            # If too many tiles to check
+            if (tileCount > int(scanMaxTiles)):
+                arcpy.AddWarning("Level " + str(tileRange['level']) + " has " + str(tileCount) + " tiles in the area of interest, more than the maximum of " + str(scanMaxTiles) + ", so is not being checked...")
+                # Logging
+                if (enableLogging == "true"):
+                    logger.warning("Level " + str(tileRange['level']) + " not checked, too many tiles - " + str(tileCount))
+                continue
+            arcpy.AddMessage("Checking level " + str(tileRange['level']) + " (1:" + str(tileRange['scale']) + ") - " + str(tileCount) + " tiles (" + str(tileRange['rows']) + " rows x " + str(tileRange['columns']) + " columns)...")
+            levelResults = scanLevel(mapService, token, tileRange)
+            scanResults.append(levelResults)
+            arcpy.AddMessage("Tiles present - " + str(levelResults['present']) + ", missing - " + str(levelResults['missing']) + ", errors - " + str(levelResults['errors']) + "...")
+        scanTime = time.time() - scanStartTime
+
+        tilesChecked = sum([levelResults['present'] + levelResults['missing'] + levelResults['errors'] for levelResults in scanResults])
+        arcpy.AddMessage("Tiles checked - " + str(tilesChecked) + " in " + str(round(scanTime,2)) + " seconds (" + str(round(tilesChecked / max(scanTime, 0.000001),2)) + " tiles per second)...")
+
+        # Write the bitmap file
+        if (bitmapFile):
+            saveBitmapFile(bitmapFile, mapService, extent, scanResults)
+            arcpy.AddMessage("Cache bitmap - " + bitmapFile)
+
+        # Open text file and write header line and data
+        if (csvFile):
+            summaryFile = open(csvFile, "w")
+            header = "Level,Scale,Start Row,End Row,Start Column,End Column,Tiles,Tiles Present,Tiles Missing,Errors,Complete (%)\n"
+            summaryFile.write(header)
+            for levelResults in scanResults:
+                tileCount = levelResults['rows'] * levelResults['columns']
+                serviceLine = str(levelResults['level']) + "," + str(levelResults['scale']) + "," + str(levelResults['startRow']) + "," + str(levelResults['endRow']) + "," + str(levelResults['startColumn']) + "," + str(levelResults['endColumn']) + "," + str(tileCount) + "," + str(levelResults['present']) + "," + str(levelResults['missing']) + "," + str(levelResults['errors']) + "," + str(round(100.0 * levelResults['present'] / max(1, tileCount),2)) + "\n"
+                summaryFile.write(serviceLine)
+            summaryFile.close()
+
+        # --------------------------------------- End of code --------------------------------------- #
+
+        # If called from gp tool return the arcpy parameter
+        if __name__ == '__main__':
+            # Return the output if there is any
+            if output:
+                arcpy.SetParameterAsText(1, output)
+        # Otherwise return the result
+        else:
+            # Return the output if there is any
+            if output:
+                return output
+        # Logging
+        if (enableLogging == "true"):
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        pass
+    # If arcpy error
+    except arcpy.ExecuteError:
+        # Build and show the error message
+        errorMessage = arcpy.GetMessages(2)
+        arcpy.AddError(errorMessage)
+        # Logging
+        if (enableLogging == "true"):
+            # Log error
+            logger.error(errorMessage)
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(errorMessage)
+    # If python error
+    except Exception as e:
+        errorMessage = ""
+        # Build and show the error message
+        for i in range(len(e.args)):
+            if (i == 0):
+                errorMessage = unicode(e.args[i]).encode('utf-8')
+            else:
+                errorMessage = errorMessage + " " + unicode(e.args[i]).encode('utf-8')
+        arcpy.AddError(errorMessage)
+        # Logging
+        if (enableLogging == "true"):
+            # Log error
+            logger.error(errorMessage)
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(errorMessage)
+# End of main function
+
+
+# Start of scan level function
+def scanLevel(mapService, token, tileRange):
+    # Bitmap of the tiles in the range, one bit per tile row by row, set if the tile is present
+    tileCount = tileRange['rows'] * tileRange['columns']
+    bitmap = bytearray((tileCount + 7) // 8)
+    levelResults = dict(tileRange)
+    levelResults.update({'present': 0, 'missing': 0, 'errors': 0})
+
+    # Function run on each of the workers to check a tile
+    def checkTile(tileIndex):
+        row = tileRange['startRow'] + (tileIndex // tileRange['columns'])
+        column = tileRange['startColumn'] + (tileIndex % tileRange['columns'])
+        # Ask for a 404 rather than a blank tile if the tile is not in the cache
+        query = mapService + "/tile/" + str(tileRange['level']) + "/" + str(row) + "/" + str(column) + "?blankTile=false"
+        # If token received
+        if (token):
+            query = query + "&token=" + token
+        return probeTile(query)
+
+    # Check the tiles a batch at a time
+    batchStart = 0
+    while (batchStart < tileCount):
+        tileIndexes = range(batchStart, min(batchStart + int(scanBatchSize), tileCount))
+        tileStatuses = ArcGISAdminClient.runConcurrently(checkTile, tileIndexes, scanConnections)
+        for tileIndex, tileStatus in zip(tileIndexes, tileStatuses):
+            # Tile present
+            if (tileStatus == 200):
+                bitmap[tileIndex >> 3] |= (1 << (tileIndex & 7))
+                levelResults['present'] = levelResults['present'] + 1
+            # Tile missing
+            elif (tileStatus == 404):
+                levelResults['missing'] = levelResults['missing'] + 1
+            # Any other error is counted as not present
+            else:
+                levelResults['errors'] = levelResults['errors'] + 1
+        batchStart = batchStart + len(tileIndexes)
+        if (batchStart < tileCount):
+            arcpy.AddMessage("Checked " + str(batchStart) + " of " + str(tileCount) + " tiles...")
+
+    levelResults['bitmap'] = bitmap
+    return levelResults
+# End of scan level function
+
+
+# Start of probe tile function
+def probeTile(query):
+    global useHeadRequests
+    # Check if the tile exists
+    if (useHeadRequests == "true"):
+        responseStatus, response = ArcGISCacheHelper.requestURL(query, "HEAD", enableProxy == "true")
+        # If the server doesn't support HEAD requests, download the tiles instead
+        if (responseStatus == 405) or (responseStatus == 501):
+            useHeadRequests = "false"
+            arcpy.AddWarning("Server does not support HEAD requests, downloading tiles instead...")
+        else:
+            return responseStatus
+    responseStatus, response = ArcGISCacheHelper.requestURL(query, "GET", enableProxy == "true")
+    return responseStatus
+# End of probe tile function
+
+
+# Start of save bitmap file function
+def saveBitmapFile(bitmapFile, mapService, extent, scanResults):
+    # Bitmaps are compressed and base64 encoded - Bit n of the bitmap is byte n / 8, bit n % 8 (least significant first),
+    # and is tile row startRow + (n / columns), column startColumn + (n % columns)
+    cacheBitmap = {'mapService': mapService,
+                   'created': int(time.time() * 1000),
+                   'extent': extent,
+                   'levels': []}
+    for levelResults in scanResults:
+        levelBitmap = {}
+        for key in ['level', 'scale', 'resolution', 'startRow', 'endRow', 'startColumn', 'endColumn', 'rows', 'columns', 'present', 'missing', 'errors']:
+            levelBitmap[key] = levelResults[key]
+        levelBitmap['bitmap'] = base64.b64encode(zlib.compress(str(levelResults['bitmap'])))
+        cacheBitmap['levels'].append(levelBitmap)
+
+    with open(bitmapFile, "w") as f:
+        json.dump(cacheBitmap, f, indent=1)
+# End of save bitmap file function
+
+
+# Start of get token function
+def getToken(username, password, serverName, serverPort):
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, "http", username, "requestip", renewToken)
+    if cachedToken:
+        return cachedToken
+
+    query_dict = {'username':   username,
+                  'password':   password,
+                  'expiration': "60",
+                  'client':     'requestip'}
+
+    query_string = urllib.urlencode(query_dict)
+    url = "http://{}:{}/arcgis/admin/generateToken?f=json".format(serverName, serverPort)
+
+    try:
+        token = json.loads(urllib2.urlopen(url, query_string).read())
+        if "token" not in token or token == None:
+            arcpy.AddError("Failed to get token, return message from server:")
+            arcpy.AddError(token['messages'])
+            # Logging
+            if (enableLogging == "true"):
+                logger.error("Failed to get token, return message from server:")
+                logger.error(token['messages'])
+            sys.exit()
+        else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, "http", username, "requestip", token['token'], token.get('expires'), renewToken)
+            # Return the token to the function which called for it
+            return token['token']
+
+    except urllib2.URLError, error:
+        arcpy.AddError("Could not connect to machine {} on port {}".format(serverName, serverPort))
+        arcpy.AddError(error)
+        # Logging
+        if (enableLogging == "true"):
+            logger.error("Could not connect to machine {} on port {}".format(serverName, serverPort))
+            logger.error(error)
+        sys.exit()
+# End of get token function
+
+
+# Start of set logging function
+def setLogging(logFile):
+    # Create a logger
+    logger = logging.getLogger(os.path.basename(__file__))
+    logger.setLevel(logging.DEBUG)
+    # Setup log message handler
+    logMessage = logging.FileHandler(logFile)
+    # Setup the log formatting
+    logFormat = logging.Formatter("%(asctime)s: %(levelname)s - %(message)s", "%d/%m/%Y - %H:%M:%S")
+    # Add formatter to log message handler
+    logMessage.setFormatter(logFormat)
+    # Add log message handler to logger
+    logger.addHandler(logMessage)
+
+    return logger, logMessage
+# End of set logging function
+
+
+# Start of send email function
+def sendEmail(message):
+    # Send an email
+    arcpy.AddMessage("Sending email...")
+    # Server and port information
+    smtpServer = smtplib.SMTP("smtp.gmail.com",587)
+    smtpServer.ehlo()
+    smtpServer.starttls()
+    smtpServer.ehlo
+    # Login with sender email address and password
+    smtpServer.login(emailUser, emailPassword)
+    # Email content
+    header = 'To:' + emailTo + '\n' + 'From: ' + emailUser + '\n' + 'Subject:' + emailSubject + '\n'
+    body = header + '\n' + emailMessage + '\n' + '\n' + message
+    # Send the email and close the connection
+    smtpServer.sendmail(emailUser, emailTo, body)
+# End of send email function
+
+
+# This test allows the script to be used from the operating
+# system command prompt (stand-alone), in a Python IDE,
+# as a geoprocessing script tool, or as a module imported in
+# another script
+if __name__ == '__main__':
+    # Arguments are optional - If running from ArcGIS Desktop tool, parameters will be loaded into *argv
+    argv = tuple(arcpy.GetParameterAsText(i)
+        for i in range(arcpy.GetArgumentCount()))
+    # Logging
+    if (enableLogging == "true"):
+        # Setup logging
+        logger, logMessage = setLogging(logFile)
+        # Log start of process
+        logger.info("Process started.")
+    # Setup the use of a proxy for requests
+    if (enableProxy == "true"):
+        # Setup the proxy
+        proxy = urllib2.ProxyHandler({requestProtocol : proxyURL})
+        openURL = urllib2.build_opener(proxy)
+        # Install the proxy
+        urllib2.install_opener(openURL)
+    mainFunction(*argv)
+
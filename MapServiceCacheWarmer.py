@@ -0,0 +1,428 @@
+#-------------------------------------------------------------
+# Name:       Map Service Cache Warmer
+# Purpose:    Warms up the tile cache of a cached map service after it has been rebuilt, by requesting every
+#             tile at the chosen levels over each extent in an area of interest so the first users don't pay for
+#             cold reads.
+#             - Tiles are requested in parallel at up to a set rate.
+#             - Progress is saved to a checkpoint file so an interrupted run carries on where it stopped.
+#             - Tiles that don't get a response from the server are requested again on the next run, and warming
+#               stops if too many tiles can't reach the server.
+# Author:     Shaun Weston (shaun_weston@eagle.co.nz)
+# Date Created:    18/10/2026
+# Last Updated:    18/10/2026
+# Copyright:   (c) Eagle Technology
+# ArcGIS Version:   10.1+
+# Python Version:   2.7
+#--------------------------------
+
+# Import modules
+import os
+import sys
+import logging
+import smtplib
+import arcpy
+import ArcGISAdminClient
+import ArcGISTokenManager
+import ArcGISTileGrid
+import ArcGISCacheHelper
+import urllib
+import urllib2
+import time
+import json
+import threading
+from urlparse import urlparse
+
+# Enable data to be overwritten
+arcpy.env.overwriteOutput = True
+
+# Set global variables
+enableLogging = "false" # Use logger.info("Example..."), logger.warning("Example..."), logger.error("Example...")
+logFile = "" # os.path.join(os.path.dirname(__file__), "Example.log")
+sendErrorEmail = "false"
+emailTo = ""
+emailUser = ""
+emailPassword = ""
+emailSubject = ""
+emailMessage = ""
+enableProxy = "false"
+requestProtocol = "http" # http or https
+proxyURL = ""
+warmConnections = 8 # Number of tiles requested at the same time
+warmRate = 0 # Maximum tiles requested per second, 0 is as fast as the connections allow
+warmBatchSize = 1000 # Number of tiles requested between saving the checkpoint and showing the progress
+warmMaxTiles = 10000000 # Levels with more tiles than this across the extents in the area of interest are skipped
+warmMaxConnectionErrors = 100 # Tiles that can't reach the server before warming stops, the checkpoint is kept so the next run carries on from the first of these
+output = None
+
+# Time the next tile is due when limiting the rate
+rateSchedule = [0]
+rateLock = threading.Lock()
+
+# Start of main function
+def mainFunction(mapService,username,password,areaOfInterest,levels,checkpointFile): # Get parameters from ArcGIS Desktop tool by seperating by comma e.g. (var1 is 1st parameter,var2 is 2nd parameter,var3 is 3rd parameter)
+    try:
+        # --------------------------------------- Start of code --------------------------------------- #
+        # Get the server name and port
+        parse_object = urlparse(mapService)
+        protocol = parse_object.scheme
+        serverNameAndPort = parse_object.netloc.split(":")
+        serverName = serverNameAndPort[0]
+        if (len(serverNameAndPort) > 1):
+            serverPort = serverNameAndPort[1]
+        else:
+            serverPort = 80
+            if (protocol.lower() == "https"):
+                serverPort = 443
+
+        # Get token if needed
+        token = ""
+        if (username and password):
+            token = getToken(username, password, serverName, serverPort)
+
+        # Get the map service details
+        dataObject = ArcGISCacheHelper.getServiceInfo(mapService, token, enableProxy == "true")
+        if "tileInfo" not in dataObject:
+            arcpy.AddError("Map service is not cached - " + mapService)
+            # Logging
+            if (enableLogging == "true"):
+                logger.error("Map service is not cached - " + mapService)
+            sys.exit()
+        tileInfo = dataObject['tileInfo']
+
+        # Get the extents in the area of interest, the full extent of the service if not specified
+        extents = ArcGISCacheHelper.getAreaOfInterest(areaOfInterest, dataObject)
+        for extent in extents:
+            arcpy.AddMessage("Area of interest - " + " ".join([str(value) for value in extent]) + "...")
+
+        # If a string, convert to array for levels
+        warmLevels = None
+        if (levels):
+            if isinstance(levels, basestring):
+                levels = levels.split(";")
+            warmLevels = [int(level) for level in levels if str(level).strip()]
+
+        # Work out the tiles covering each extent at each level, joining extents that share tiles
+        levelTileRanges = ArcGISTileGrid.getJoinedTileRanges(tileInfo, extents, warmLevels)
+
+        # Carry on from the checkpoint if there is one for this service and area of interest
+        checkpoint = loadCheckpoint(checkpointFile, mapService, extents)
+
+        warmStats = {'requested': 0, 'found': 0, 'missing': 0, 'errors': 0, 'connectionErrors': 0, 'bytes': 0}
+        warmStartTime = time.time()
+        for tileRanges in levelTileRanges:
+            level = tileRanges[0]
+            tileCount = sum([tileRange['rows'] * tileRange['columns'] for tileRange in tileRanges])
+            # If too many tiles to request
+            if (tileCount > int(warmMaxTiles)):
+                arcpy.AddWarning("Level " + str(level['level']) + " has " + str(tileCount) + " tiles in the area of interest, more than the maximum of " + str(warmMaxTiles) + ", so is not being warmed...")
+                # Logging
+                if (enableLogging == "true"):
+                    logger.warning("Level " + str(level['level']) + " not warmed, too many tiles - " + str(tileCount))
+                continue
+
+            # Tiles already requested at this level on an earlier run
+            levelTilesDone = sum([min(checkpoint['ranges'].get(getRangeKey(tileRange), 0), tileRange['rows'] * tileRange['columns']) for tileRange in tileRanges])
+            if (levelTilesDone >= tileCount):
+                arcpy.AddMessage("Level " + str(level['level']) + " already warmed...")
+                continue
+            arcpy.AddMessage("Warming level " + str(level['level']) + " (1:" + str(level['scale']) + ") - " + str(tileCount - levelTilesDone) + " of " + str(tileCount) + " tiles to request...")
+            for tileRange in tileRanges:
+                # Tiles already requested in this range on an earlier run
+                tilesDone = checkpoint['ranges'].get(getRangeKey(tileRange), 0)
+                if (tilesDone >= tileRange['rows'] * tileRange['columns']):
+                    continue
+                warmTileRange(mapService, token, tileRange, tilesDone, checkpoint, checkpointFile, warmStats, warmStartTime)
+
+                # Stop if the server can't be reached
+                if (warmStats['connectionErrors'] > int(warmMaxConnectionErrors)):
+                    raise Exception("Stopped warming, " + str(warmStats['connectionErrors']) + " tiles could not reach the server. Run again to carry on from the checkpoint.")
+
+        warmTime = time.time() - warmStartTime
+        arcpy.AddMessage("Tiles requested - " + str(warmStats['requested']) + " in " + str(round(warmTime,2)) + " seconds (" + str(round(warmStats['requested'] / max(warmTime, 0.000001),2)) + " tiles per second)...")
+        arcpy.AddMessage("Tiles found - " + str(warmStats['found']) + ", missing - " + str(warmStats['missing']) + ", errors - " + str(warmStats['errors']) + ", could not reach the server - " + str(warmStats['connectionErrors']) + ", downloaded - " + str(round(float(warmStats['bytes']) / 1048576, 2)) + " MB...")
+
+        # If some tiles could not reach the server, keep the checkpoint so they are requested on the next run
+        if (warmStats['connectionErrors'] > 0):
+            arcpy.AddWarning(str(warmStats['connectionErrors']) + " tiles could not reach the server. Run again to request these from the checkpoint...")
+            # Logging
+            if (enableLogging == "true"):
+                logger.warning(str(warmStats['connectionErrors']) + " tiles could not reach the server")
+        # All tiles requested so remove the checkpoint
+        elif (checkpointFile and os.path.exists(checkpointFile)):
+            os.remove(checkpointFile)
+
+        # --------------------------------------- End of code --------------------------------------- #
+
+        # If called from gp tool return the arcpy parameter
+        if __name__ == '__main__':
+            # Return the output if there is any
+            if output:
+                arcpy.SetParameterAsText(1, output)
+        # Otherwise return the result
+        else:
+            # Return the output if there is any
+            if output:
+                return output
+        # Logging
+        if (enableLogging == "true"):
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        pass
+    # If arcpy error
+    except arcpy.ExecuteError:
+        # Build and show the error message
+        errorMessage = arcpy.GetMessages(2)
+        arcpy.AddError(errorMessage)
+        # Logging
+        if (enableLogging == "true"):
+            # Log error
+            logger.error(errorMessage)
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(errorMessage)
+    # If python error
+    except Exception as e:
+        errorMessage = ""
+        # Build and show the error message
+        for i in range(len(e.args)):
+            if (i == 0):
+                errorMessage = unicode(e.args[i]).encode('utf-8')
+            else:
+                errorMessage = errorMessage + " " + unicode(e.args[i]).encode('utf-8')
+        arcpy.AddError(errorMessage)
+        # Logging
+        if (enableLogging == "true"):
+            # Log error
+            logger.error(errorMessage)
+            # Log end of process
+            logger.info("Process ended.")
+            # Remove file handler and close log file
+            logging.FileHandler.close(logMessage)
+            logger.removeHandler(logMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(errorMessage)
+# End of main function
+
+
+# Start of warm tile range function
+def warmTileRange(mapService, token, tileRange, tilesDone, checkpoint, checkpointFile, warmStats, warmStartTime):
+    tileCount = tileRange['rows'] * tileRange['columns']
+
+    # Function run on each of the workers to request a tile
+    def requestTile(tileIndex):
+        row = tileRange['startRow'] + (tileIndex // tileRange['columns'])
+        column = tileRange['startColumn'] + (tileIndex % tileRange['columns'])
+        # Request the tile the same way a web map does so any caches in front of the server are warmed too
+        query = mapService + "/tile/" + str(tileRange['level']) + "/" + str(row) + "/" + str(column)
+        # If token received
+        if (token):
+            query = query + "?token=" + token
+
+        # Wait until the tile is due if limiting the rate
+        if (float(warmRate) > 0):
+            with rateLock:
+                dueTime = max(time.time(), rateSchedule[0])
+                rateSchedule[0] = dueTime + (1 / float(warmRate))
+            waitTime = dueTime - time.time()
+            if (waitTime > 0):
+                time.sleep(waitTime)
+        responseStatus, response = ArcGISCacheHelper.requestURL(query, "GET", enableProxy == "true")
+        return responseStatus, len(response)
+
+    # Request the tiles a batch at a time
+    batchStart = tilesDone
+    # First tile in this range that could not reach the server, the checkpoint is not moved past it
+    firstFailedTile = None
+    while (batchStart < tileCount):
+        tileIndexes = range(batchStart, min(batchStart + int(warmBatchSize), tileCount))
+        tileResults = ArcGISAdminClient.runConcurrently(requestTile, tileIndexes, warmConnections)
+        for tileIndex, (responseStatus, responseSize) in zip(tileIndexes, tileResults):
+            warmStats['requested'] = warmStats['requested'] + 1
+            # Server could not be reached
+            if (responseStatus == 0):
+                warmStats['connectionErrors'] = warmStats['connectionErrors'] + 1
+                if (firstFailedTile == None):
+                    firstFailedTile = tileIndex
+            # Tile found
+            elif (responseStatus == 200):
+                warmStats['found'] = warmStats['found'] + 1
+                warmStats['bytes'] = warmStats['bytes'] + responseSize
+            # Tile missing
+            elif (responseStatus == 404):
+                warmStats['missing'] = warmStats['missing'] + 1
+            # Any other error
+            else:
+                warmStats['errors'] = warmStats['errors'] + 1
+        batchStart = batchStart + len(tileIndexes)
+
+        # Save the progress so an interrupted run can carry on from here
+        if (firstFailedTile == None):
+            checkpoint['ranges'][getRangeKey(tileRange)] = batchStart
+        else:
+            checkpoint['ranges'][getRangeKey(tileRange)] = firstFailedTile
+        saveCheckpoint(checkpointFile, checkpoint)
+        elapsedTime = time.time() - warmStartTime
+        arcpy.AddMessage("Requested " + str(batchStart) + " of " + str(tileCount) + " tiles (" + str(round(warmStats['requested'] / max(elapsedTime, 0.000001),2)) + " tiles per second)...")
+
+        # Stop if the server can't be reached
+        if (warmStats['connectionErrors'] > int(warmMaxConnectionErrors)):
+            return
+# End of warm tile range function
+
+
+# Start of get range key function
+def getRangeKey(tileRange):
+    # Key for a range of tiles in the checkpoint - Level and first row and column
+    return "L%02d R%08xC%08x" % (int(tileRange['level']), tileRange['startRow'], tileRange['startColumn'])
+# End of get range key function
+
+
+# Start of load checkpoint function
+def loadCheckpoint(checkpointFile, mapService, extents):
+    checkpoint = {'mapService': mapService, 'extents': extents, 'ranges': {}}
+    # If using a checkpoint file and it exists
+    if (checkpointFile and os.path.exists(checkpointFile)):
+        try:
+            with open(checkpointFile, "r") as f:
+                storedCheckpoint = json.load(f)
+            # Only carry on if the checkpoint is for the same service and area of interest
+            if (storedCheckpoint.get('mapService') == mapService) and (storedCheckpoint.get('extents') == extents):
+                checkpoint['ranges'] = storedCheckpoint.get('ranges', {})
+                arcpy.AddMessage("Carrying on from checkpoint - " + checkpointFile + "...")
+            else:
+                arcpy.AddWarning("Checkpoint is for a different map service or area of interest, starting again...")
+        # If the file can't be read, start again
+        except (IOError, ValueError):
+            arcpy.AddWarning("Checkpoint could not be read, starting again...")
+    return checkpoint
+# End of load checkpoint function
+
+
+# Start of save checkpoint function
+def saveCheckpoint(checkpointFile, checkpoint):
+    # If using a checkpoint file
+    if (checkpointFile):
+        checkpoint['updated'] = int(time.time() * 1000)
+        # Write to a temporary file first so the checkpoint is not lost if interrupted while writing
+        with open(checkpointFile + ".tmp", "w") as f:
+            json.dump(checkpoint, f)
+        if os.path.exists(checkpointFile):
+            os.remove(checkpointFile)
+        os.rename(checkpointFile + ".tmp", checkpointFile)
+# End of save checkpoint function
+
+
+# Start of get token function
+def getToken(username, password, serverName, serverPort):
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, "http", username, "requestip", renewToken)
+    if cachedToken:
+        return cachedToken
+
+    query_dict = {'username':   username,
+                  'password':   password,
+                  'expiration': "60",
+                  'client':     'requestip'}
+
+    query_string = urllib.urlencode(query_dict)
+    url = "http://{}:{}/arcgis/admin/generateToken?f=json".format(serverName, serverPort)
+
+    try:
+        token = json.loads(urllib2.urlopen(url, query_string).read())
+        if "token" not in token or token == None:
+            arcpy.AddError("Failed to get token, return message from server:")
+            arcpy.AddError(token['messages'])
+            # Logging
+            if (enableLogging == "true"):
+                logger.error("Failed to get token, return message from server:")
+                logger.error(token['messages'])
+            sys.exit()
+        else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, "http", username, "requestip", token['token'], token.get('expires'), renewToken)
+            # Return the token to the function which called for it
+            return token['token']
+
+    except urllib2.URLError, error:
+        arcpy.AddError("Could not connect to machine {} on port {}".format(serverName, serverPort))
+        arcpy.AddError(error)
+        # Logging
+        if (enableLogging == "true"):
+            logger.error("Could not connect to machine {} on port {}".format(serverName, serverPort))
+            logger.error(error)
+        sys.exit()
+# End of get token function
+
+
+# Start of set logging function
+def setLogging(logFile):
+    # Create a logger
+    logger = logging.getLogger(os.path.basename(__file__))
+    logger.setLevel(logging.DEBUG)
+    # Setup log message handler
+    logMessage = logging.FileHandler(logFile)
+    # Setup the log formatting
+    logFormat = logging.Formatter("%(asctime)s: %(levelname)s - %(message)s", "%d/%m/%Y - %H:%M:%S")
+    # Add formatter to log message handler
+    logMessage.setFormatter(logFormat)
+    # Add log message handler to logger
+    logger.addHandler(logMessage)
+
+    return logger, logMessage
+# End of set logging function
+
+
+# Start of send email function
+def sendEmail(message):
+    # Send an email
+    arcpy.AddMessage("Sending email...")
+    # Server and port information
+    smtpServer = smtplib.SMTP("smtp.gmail.com",587)
+    smtpServer.ehlo()
+    smtpServer.starttls()
+    smtpServer.ehlo
+    # Login with sender email address and password
+    smtpServer.login(emailUser, emailPassword)
+    # Email content
+    header = 'To:' + emailTo + '\n' + 'From: ' + emailUser + '\n' + 'Subject:' + emailSubject + '\n'
+    body = header + '\n' + emailMessage + '\n' + '\n' + message
+    # Send the email and close the connection
+    smtpServer.sendmail(emailUser, emailTo, body)
+# End of send email function
+
+
+# This test allows the script to be used from the operating
+# system command prompt (stand-alone), in a Python IDE,
+# as a geoprocessing script tool, or as a module imported in
+# another script
+if __name__ == '__main__':
+    # Arguments are optional - If running from ArcGIS Desktop tool, parameters will be loaded into *argv
+    argv = tuple(arcpy.GetParameterAsText(i)
+        for i in range(arcpy.GetArgumentCount()))
+    # Logging
+    if (enableLogging == "true"):
+        # Setup logging
+        logger, logMessage = setLogging(logFile)
+        # Log start of process
+        logger.info("Process started.")
+    # Setup the use of a proxy for requests
+    if (enableProxy == "true"):
+        # Setup the proxy
+        proxy = urllib2.ProxyHandler({requestProtocol : proxyURL})
+        openURL = urllib2.build_opener(proxy)
+        # Install the proxy
+        urllib2.install_opener(openURL)
+    mainFunction(*argv)
+
@@ -15,13 +15,26 @@ import sys
 import logging
 import smtplib
 import arcpy
+import ArcGISAdminClient
+import ArcGISTokenManager
+import ArcGISTileGrid
 import string
 import urllib
 import urllib2
 import time
 import json
 import math
+import hashlib
+import csv
+import socket
+import httplib
+import threading
+import collections
+import random
+import sqlite3
+from multiprocessing.pool import ThreadPool
 from urlparse import urlparse
+from timeit import default_timer as timer
 
 # Enable data to be overwritten
 arcpy.env.overwriteOutput = True
@@ -38,6 +51,26 @@ emailMessage = ""
 enableProxy = "false"
 requestProtocol = "http" # http or https
 proxyURL = ""
+tileConnections = 6 # Number of tiles downloaded at the same time, web browsers use 6-8 connections per server
+saveImages = "true" # "false" only hashes and counts the size of downloaded images in memory, without writing them to disk
+imageSampleRate = 0 # If not saving images, the fraction of images still saved for visual checks e.g. 0.01 saves 1 in 100
+workloadFile = "" # CSV file of extents and scales to replay instead of the bounding box - "XMin,YMin,XMax,YMax,Scale" on each line
+workloadRate = 0 # Map requests started per second when replaying the workload, 0 is as fast as the workers allow
+workloadWorkers = 8 # Number of map requests made at the same time when replaying the workload
+loadTestRate = "" # Export requests per second for an open loop load test of a dynamic map service e.g. "5" for a fixed rate or "1-20" to ramp up the rate
+loadTestDuration = 60 # Seconds each rate is run for in the load test
+loadTestSteps = 5 # Number of rates between the lowest and highest rate when ramping up
+loadTestThreads = 100 # Maximum number of requests in flight during the load test, requests after this wait in a queue
+loadTestSaturation = 3 # The service is saturated when the median latency is this many times the median latency at the lowest rate
+warmColdTest = "false" # "true" runs cold queries at random extents within the bounding box, then warm queries repeating the same extent
+resultsDatabase = "" # os.path.join(os.path.dirname(__file__), "MapServiceTest.sqlite") - Set to keep the results of each run and compare them with earlier runs
+testRunID = "" # ID the results of the run are saved under, blank uses the date and time
+compareOnly = "false" # "true" only compares the saved results of testRunID (or the latest run) with the baseline, without querying the map service
+baselineRuns = 10 # Number of earlier runs the draw times are compared with
+regressionThreshold = 20 # Percentage slower than the baseline a draw time needs to be to be flagged
+regressionSignificance = 2.0 # t statistic a slower draw time needs to reach to be flagged, 2.0 is about 95% confidence
+imageLock = threading.Lock()
+requestPhases = ["dns", "connect", "tls", "ttfb", "transfer"] # Phases each request is timed in
 output = None
 
 # Start of main function
@@ -51,10 +84,14 @@ def mainFunction(mapService,username,password,boundingBox,scales,imageFormat,num
         
         # GlobalVariables
         cachedMapService = False
-        scaleData = []
+        scaleData = collections.OrderedDict()
+        imageStats = {'count': 0, 'bytes': 0, 'saved': 0, 'hashes': set()}
 
-        # Seperate out XY coordinates
-        boundingBox = boundingBox.split(" ")
+        # Seperate out the bounding boxes and XY coordinates
+        boundingBoxes = []
+        for eachBoundingBox in boundingBox.split(";"):
+            if (eachBoundingBox.strip()):
+                boundingBoxes.append(eachBoundingBox.split())
 
         # Get the image format
         if (imageFormat == "PNG"):
@@ -90,122 +127,86 @@ def mainFunction(mapService,username,password,boundingBox,scales,imageFormat,num
         # Make the query to the map service
         response, downloadTime = urlQuery(query)
         dataObject = json.loads(response)
+        # If only comparing saved results with the baseline
+        if (compareOnly == "true"):
+            comparisonResults = compareTestResults(mapService, testRunID)
+        # If replaying a workload of extents and scales
+        elif (workloadFile):
+            arcpy.AddMessage("Replaying workload from " + workloadFile + "...")
+            workloadResults = replayWorkload(mapService, token, dataObject, imageFormat, dpi, ImageWidth, ImageHeight, numberQueries, imageStats)
+        # If load testing a dynamic map service
+        elif (loadTestRate) and ("tileInfo" not in dataObject):
+            arcpy.AddMessage("Map Service is dynamic, load testing at " + str(loadTestRate) + " requests per second...")
+            # If a string, convert to array for scales
+            if isinstance(scales, basestring):
+                scales = string.split(scales, ";")
+            exportQueries = []
+            for scale, boundingBox in [(scale, boundingBox) for scale in scales for boundingBox in boundingBoxes]:
+                exportQueries.append([scale, getExportQuery(mapService, token, imageFormat, dpi, ImageWidth, ImageHeight, scale, boundingBox)])
+            loadTestResults = runLoadTest(exportQueries, imageFormat, imageStats)
         # If the map service is cached
-        if "tileInfo" in dataObject:
+        elif "tileInfo" in dataObject:
             arcpy.AddMessage("Map Service is cached...")
             cachedMapService = True
         
             # Get the tile info
             tileInfo = dataObject['tileInfo']
-            tileHeight = tileInfo['rows']
-            tileWidth = tileInfo['cols']
-            tileOriginX = tileInfo['origin']['x']
-            tileOriginY = tileInfo['origin']['y']
-            dpi = tileInfo['dpi']
 
-            # Get the centre point of the bounding box
-            searchPointX = float(boundingBox[0]) + ((float(boundingBox[2]) - float(boundingBox[0])) / 2);
-            searchPointY = float(boundingBox[1]) + ((float(boundingBox[3]) - float(boundingBox[1])) / 2);
+            # Work out the tiles for each bounding box at every level once, reused for each query
+            fixedTileQueries = getLevelTileQueries(mapService, token, tileInfo, boundingBoxes, ImageWidth, ImageHeight)
 
-            count = 0
             # Make the number of queries as specified
-            while (count < int(numberQueries)):
-                arcpy.AddMessage("Map service query " + str(count + 1))
+            for run, count, queryBoxes in getQueryPasses(numberQueries, boundingBoxes):
+                if (run):
+                    arcpy.AddMessage("Map service query " + str(count + 1) + " (" + run + ")")
+                else:
+                    arcpy.AddMessage("Map service query " + str(count + 1))
+
+                # Cold queries have different extents each time
+                levelTileQueries = fixedTileQueries
+                if (run == "Cold"):
+                    levelTileQueries = getLevelTileQueries(mapService, token, tileInfo, queryBoxes, ImageWidth, ImageHeight)
                 
-                # Iterate through the levels
-                for level in tileInfo['lods']:
-                    thisLevel = level['level']
-                    thisScale = level['scale']
-                    thisResolution = level['resolution']
-                    
-                    # Dividing image width by DPI to get it in inches
-                    imgWidthInInch = ImageWidth / dpi;
-                    imgHeightInInch = ImageHeight / dpi;
-
-                    # Converting inch to metre (assume the map is in metre)
-                    imgWidthInMapUnit = imgWidthInInch * 0.0254;
-                    imgHeightInMapUnit = imgHeightInInch * 0.0254;
-
-                    # Calculating half of maps height & width at the specific scale
-                    halfX = (imgWidthInMapUnit * thisScale) / 2;
-                    halfY = (imgHeightInMapUnit * thisScale) / 2;
-
-                    # Setup the extent
-                    XMin = searchPointX - halfX
-                    XMax = searchPointX + halfX
-                    YMin = searchPointY - halfY
-                    YMax = searchPointY + halfY
-
-                    # Get the tile info - Top left
-                    topLeftPointX = XMin
-                    topLeftPointY = YMax
-                    # Get the tile info - Bottom right
-                    bottomRightPointX = XMax
-                    bottomRightPointY = YMin
-                    
-                    # Find the tile row and column - Top left
-                    topLeftTileColumn = int(math.floor((float(topLeftPointX) - float(tileOriginX)) / (float(thisResolution) * float(tileWidth))))                    
-                    topLeftTileRow = int(math.floor((float(tileOriginY) - float(topLeftPointY)) / (float(thisResolution) * float(tileHeight))))        
-                    # Find the tile row and column - Bottom right
-                    bottomRightTileColumn = int(math.floor((float(bottomRightPointX) - float(tileOriginX)) / (float(thisResolution) * float(tileWidth))))                    
-                    bottomRightTileRow = int(math.floor((float(tileOriginY) - float(bottomRightPointY)) / (float(thisResolution) * float(tileHeight))))       
-
-                    # Return all the tiles in between
+                # Iterate through the levels for each bounding box
+                for thisLevel, thisScale, tileQueries in levelTileQueries:
+                    scaleResults = getScaleResults(scaleData, thisScale, thisLevel, run)
+                    # Make the queries to the map service, downloading tiles at the same time like a web browser
+                    drawStartTime = timer()
+                    tileTimings = [{} for tileQuery in tileQueries]
+                    tileResponses = ArcGISAdminClient.runConcurrently(lambda tileRequest: urlQuery(tileRequest[0][2], tileRequest[1]), zip(tileQueries, tileTimings), tileConnections)
+                    # Time to fill the viewport
+                    totalDownloadTime = timer() - drawStartTime
+
                     tileCount = 0
                     tileMissingCount = 0
-                    totalDownloadTime = 0
-                    column = topLeftTileColumn
-                    while (column < bottomRightTileColumn):
-                        row = topLeftTileRow
-                        while (row < bottomRightTileRow):
-                            query = mapService + "/tile/" + str(thisLevel) + "/" + str(row) + "/" + str(column);
-                            # If token received
-                            if (token):
-                                # Add token to query
-                                query = query + "?token=" + token
-                        
-                            # Make the query to the map service
-                            response, downloadTime = urlQuery(query)
-
-                            # If tile returned
-                            if (response.lower() != "missing"):
-                                # Update total download time
-                                totalDownloadTime = totalDownloadTime + downloadTime
+                    for tileQuery, tileResponse, timings in zip(tileQueries, tileResponses, tileTimings):
+                        row, column, query = tileQuery
+                        response, downloadTime = tileResponse
 
-                                # Set the file path
-                                file = os.path.join(arcpy.env.scratchFolder, "MapService_" + str(thisScale) + "_" + str(row) + "_" + str(column) + "." + str(imageFormat))
+                        # If tile returned
+                        if (response.lower() != "missing"):
+                            # Add to the tile download times
+                            scaleResults['tileTimes'].append(downloadTime)
+                            addPhaseTimes(scaleResults, timings)
 
-                                # Open the file for writing
-                                responseImage = open(file, "wb")
+                            # Check the image and save it if needed
+                            handleImage(response, "MapService_" + str(thisScale) + "_" + str(row) + "_" + str(column) + "." + str(imageFormat), imageStats)
 
-                                # Read from request while writing to file
-                                responseImage.write(response)
-                                responseImage.close()
-                    
-                                tileCount = tileCount + 1
-                            # Missing tiles
-                            else:
-                                tileMissingCount = tileMissingCount + 1
-                            row = row + 1
-                        column = column + 1
+                            tileCount = tileCount + 1
+                        # Missing tiles
+                        else:
+                            tileMissingCount = tileMissingCount + 1
 
                     arcpy.AddMessage("Tiles found - " + str(tileCount) + "...")
                     arcpy.AddMessage("Tiles missing - " + str(tileMissingCount) + "...")
                     arcpy.AddMessage("1:" + str(thisScale) + " draw time - " + str(totalDownloadTime) + "...")
                     
-                    # Add results to array
-                    for eachScaleData in scaleData:             
-                        # If scale is already in array
-                        if (str(thisScale) == str(eachScaleData[0])):
-                            # Add results to existing array value
-                            eachScaleData[2] = float(eachScaleData[2]) + float(totalDownloadTime)
-                            
-                    # If on the first query
+                    # Add results to the scale
+                    addStatistic(scaleResults['drawTime'], totalDownloadTime)
+                    # If on the first query, add the tiles for this bounding box
                     if (count == 0):
-                        # Add results to array
-                        scaleData.append([str(thisScale), str(tileCount), str(tileMissingCount), str(totalDownloadTime)])
-
-                count = count + 1
+                        scaleResults['tiles'] = scaleResults['tiles'] + tileCount
+                        scaleResults['missing'] = scaleResults['missing'] + tileMissingCount
         # Dynamic map service
         else:
             arcpy.AddMessage("Map Service is dynamic...")
@@ -215,76 +216,90 @@ def mainFunction(mapService,username,password,boundingBox,scales,imageFormat,num
             if isinstance(scales, basestring):
                 scales = string.split(scales, ";")
 
-            count = 0
             # Make the number of queries as specified
-            while (count < int(numberQueries)):
-                arcpy.AddMessage("Map service query " + str(count + 1))
+            for run, count, queryBoxes in getQueryPasses(numberQueries, boundingBoxes):
+                if (run):
+                    arcpy.AddMessage("Map service query " + str(count + 1) + " (" + run + ")")
+                else:
+                    arcpy.AddMessage("Map service query " + str(count + 1))
                                     
-                # For each scale specified
-                for scale in scales:
+                # For each scale and bounding box specified
+                for scale, boundingBox in [(scale, boundingBox) for scale in scales for boundingBox in queryBoxes]:
                     # Setup the query
-                    query = mapService + "/export?f=image&dpi=" + str(dpi);
-                    query = query + "&format=" + str(imageFormat)            
-                    query = query + "&size=" + str(ImageWidth) + "," + str(ImageHeight)
-                    query = query + "&mapScale=" + str(scale)
-                    query = query + "&bbox=" + str(boundingBox[0]) + "," + str(boundingBox[1]) + "," + str(boundingBox[2]) + "," + str(boundingBox[3])
-
-                    # If token received
-                    if (token):
-                        # Add token to query
-                        query = query + "&token=" + token
-            
+                    query = getExportQuery(mapService, token, imageFormat, dpi, ImageWidth, ImageHeight, scale, boundingBox)
+
                     # Make the query to the map service
-                    response, downloadTime = urlQuery(query)                 
+                    timings = {}
+                    response, downloadTime = urlQuery(query, timings)
+                    scaleResults = getScaleResults(scaleData, scale, None, run)
+                    addPhaseTimes(scaleResults, timings)
 
                     arcpy.AddMessage("1:" + str(scale) + " draw time - " + str(downloadTime) + "...")
 
-                    # Add results to array
-                    for eachScaleData in scaleData:
-                        # If scale is already in array
-                        if (str(scale) == str(eachScaleData[0])):
-                            # Add results to existing array value
-                            eachScaleData[1] = float(eachScaleData[1]) + float(downloadTime)
-
-                    # If on the first query
-                    if (count == 0):
-                        # Add results to array
-                        scaleData.append([str(scale), str(downloadTime)])
+                    # Add results to the scale
+                    addStatistic(scaleResults['drawTime'], downloadTime)
                                      
-                    # Set the file path
-                    file = os.path.join(arcpy.env.scratchFolder, "MapService_" + str(scale) + "." + str(imageFormat))
-                    
-                    # Open the file for writing
-                    responseImage = open(file, "wb")
+                    # Check the image and save it if needed
+                    handleImage(response, "MapService_" + str(scale) + "." + str(imageFormat), imageStats)
 
-                    # Read from request while writing to file
-                    responseImage.write(response)
-                    responseImage.close()
+        if (imageStats['count'] > 0):
+            arcpy.AddMessage("Images downloaded - " + str(imageStats['count']) + ", total size - " + str(round(float(imageStats['bytes']) / 1048576, 2)) + " MB, unique images - " + str(len(imageStats['hashes'])) + "...")
+        if (imageStats['saved'] > 0):
+            arcpy.AddMessage("Downloaded images location - " + arcpy.env.scratchFolder + " (" + str(imageStats['saved']) + " images saved)")
                     
-                count = count + 1
+        # Add a column for the run if comparing cold and warm queries
+        runColumn = ""
+        if (warmColdTest == "true"):
+            runColumn = "Run,"
+            # Results of the query warming the caches are not included
+            for scaleKey in scaleData.keys():
+                if (scaleData[scaleKey]['run'] == "Warm-up"):
+                    del scaleData[scaleKey]
+
+        # Save the results and compare them with the baseline of earlier runs
+        if (resultsDatabase) and (compareOnly != "true") and (not workloadFile) and (not ((loadTestRate) and ("tileInfo" not in dataObject))):
+            runID = saveTestResults(mapService, scaleData)
+            arcpy.AddMessage("Results saved to " + resultsDatabase + " - Run " + runID + "...")
+            comparisonResults = compareTestResults(mapService, runID)
 
-        arcpy.AddMessage("Downloaded images location - " + arcpy.env.scratchFolder)
-                    
         # Open text file and write header line and data     
         summaryFile = open(csvFile, "w")         
                         
-        if (cachedMapService == True):               
-            header = "Scale,Number of Tiles Found,Number of Tiles Missing,Draw Time (Seconds)\n"
+        if (compareOnly == "true"):
+            header = "Run ID,Run,Scale,Level,Draw Time (Seconds),Baseline Draw Time (Seconds),Baseline Runs,Change (%),t Statistic,Slower\n"
             summaryFile.write(header)
-            for eachScaleData in scaleData:
-                scale = eachScaleData[0]
-                tileCount = eachScaleData[1]
-                tileMissingCount = eachScaleData[2]
-                drawTime = eachScaleData[3]
-                serviceLine = str(scale) + "," + str(tileCount) + "," + str(tileMissingCount) + "," + str(round(float(drawTime)/float(numberQueries),4)) + "\n"          
+            for comparison in comparisonResults:
+                serviceLine = str(comparison['runID']) + "," + str(comparison['run']) + "," + str(comparison['scale']) + "," + str(comparison['level'] if comparison['level'] != None else "") + "," + str(round(comparison['mean'],4)) + "," + str(round(comparison['baselineMean'],4)) + "," + str(comparison['baselineRuns']) + "," + str(round(comparison['change'],2)) + "," + str(round(comparison['tStatistic'],2)) + "," + str(comparison['slower']) + "\n"
+                summaryFile.write(serviceLine)
+        elif (workloadFile):
+            header = "Scale,Requests,Errors,Error Rate (%),Tiles,Missing Tiles,Missing Tile Rate (%),Throughput (Requests/Second),Latency P50 (Seconds),Latency P90 (Seconds),Latency P99 (Seconds),Latency Max (Seconds)\n"
+            summaryFile.write(header)
+            for scale in workloadResults['scales'] + ["All"]:
+                scaleResults = workloadResults['results'][scale]
+                latencies = sorted(scaleResults['latencies'] or [0])
+                serviceLine = str(scale) + "," + str(scaleResults['requests']) + "," + str(scaleResults['errors']) + "," + str(round(100.0 * scaleResults['errors'] / max(1, scaleResults['requests']),2)) + "," + str(scaleResults['tiles']) + "," + str(scaleResults['missing']) + "," + str(round(100.0 * scaleResults['missing'] / max(1, scaleResults['tiles']),2)) + "," + str(round(scaleResults['requests'] / max(workloadResults['elapsed'], 0.000001),2)) + "," + str(round(getPercentile(latencies, 50),4)) + "," + str(round(getPercentile(latencies, 90),4)) + "," + str(round(getPercentile(latencies, 99),4)) + "," + str(round(latencies[-1],4)) + "\n"
+                summaryFile.write(serviceLine)
+        elif (loadTestRate) and ("tileInfo" not in dataObject):
+            header = "Offered Rate (Requests/Second),Requests,Errors,Throughput (Requests/Second),Latency P50 (Seconds),Latency P90 (Seconds),Latency P99 (Seconds),Latency Max (Seconds),Service Time P50 (Seconds),Saturated\n"
+            summaryFile.write(header)
+            for stepResults in loadTestResults:
+                serviceLine = str(round(stepResults['rate'],2)) + "," + str(stepResults['requests']) + "," + str(stepResults['errors']) + "," + str(round(stepResults['throughput'],2)) + "," + str(round(stepResults['latencyP50'],4)) + "," + str(round(stepResults['latencyP90'],4)) + "," + str(round(stepResults['latencyP99'],4)) + "," + str(round(stepResults['latencyMax'],4)) + "," + str(round(stepResults['serviceTimeP50'],4)) + "," + str(stepResults['saturated']) + "\n"
+                summaryFile.write(serviceLine)
+        elif (cachedMapService == True):               
+            header = runColumn + "Scale,Level,Number of Tiles Found,Number of Tiles Missing,Draw Time (Seconds),Draw Time Min (Seconds),Draw Time Max (Seconds),Draw Time Std Dev (Seconds),Tile Time P50 (Seconds),Tile Time P90 (Seconds),Tile Time Max (Seconds),DNS (Seconds),Connect (Seconds),TLS (Seconds),Time To First Byte (Seconds),Transfer (Seconds)\n"
+            summaryFile.write(header)
+            for scaleResults in scaleData.values():
+                # Get the tile download time distribution
+                tileTimes = sorted(scaleResults['tileTimes'] or [0])
+                tileTimeP50 = getPercentile(tileTimes, 50)
+                tileTimeP90 = getPercentile(tileTimes, 90)
+                serviceLine = (scaleResults['run'] + "," if runColumn else "") + str(scaleResults['scale']) + "," + str(scaleResults['level']) + "," + str(scaleResults['tiles']) + "," + str(scaleResults['missing']) + getStatisticLine(scaleResults['drawTime']) + "," + str(round(tileTimeP50,4)) + "," + str(round(tileTimeP90,4)) + "," + str(round(tileTimes[-1],4)) + getPhaseTimesLine(scaleResults) + "\n"          
                 summaryFile.write(serviceLine)          
         else:
-            header = "Scale,Draw Time (Seconds)\n"            
+            header = runColumn + "Scale,Draw Time (Seconds),Draw Time Min (Seconds),Draw Time Max (Seconds),Draw Time Std Dev (Seconds),DNS (Seconds),Connect (Seconds),TLS (Seconds),Time To First Byte (Seconds),Transfer (Seconds)\n"            
             summaryFile.write(header)
-            for eachScaleData in scaleData:
-                scale = eachScaleData[0]
-                drawTime = eachScaleData[1]   
-                serviceLine = str(scale) + "," + str(round(float(drawTime)/float(numberQueries),4)) + "\n"          
+            for scaleResults in scaleData.values():
+                serviceLine = (scaleResults['run'] + "," if runColumn else "") + str(scaleResults['scale']) + getStatisticLine(scaleResults['drawTime']) + getPhaseTimesLine(scaleResults) + "\n"          
                 summaryFile.write(serviceLine)
         summaryFile.close()
             
@@ -351,22 +366,27 @@ def mainFunction(mapService,username,password,boundingBox,scales,imageFormat,num
 
 
 # Start of url query function
-def urlQuery(query):
+def urlQuery(query, timings=None):
     # Make the query to the map service
-    try:
-        startTime = time.time()
-        response = urllib2.urlopen(query).read()
-    except urllib2.URLError, error:
-        # If no image found
-        if (error.code == 404):
-            response = "Missing"
-        # If any other error
-        else:
-            arcpy.AddError(error)
-            # Logging
-            if (enableLogging == "true"):
-                logger.error(error)
-            sys.exit()
+    responseStatus, response, downloadTime = fetchURL(query, timings)
+
+    # If the server could not be reached
+    if (responseStatus == 0):
+        arcpy.AddError(response)
+        # Logging
+        if (enableLogging == "true"):
+            logger.error(response)
+        sys.exit()
+    # If no image found
+    elif (responseStatus == 404):
+        response = "Missing"
+    # If any other error
+    elif (responseStatus != 200):
+        arcpy.AddError("HTTP Error " + str(responseStatus) + ": " + str(response))
+        # Logging
+        if (enableLogging == "true"):
+            logger.error("HTTP Error " + str(responseStatus) + ": " + str(response))
+        sys.exit()
 
     # If there is an error in the response
     if "error" in response:
@@ -378,16 +398,612 @@ def urlQuery(query):
             logger.error(response)
         sys.exit()  
     else:
-        # Get the time for the request
-        endTime = time.time()
-        downloadTime = endTime - startTime                            
+        # Return the response and the time for the request
         return response, downloadTime
 # End of url query function
 
 
+# Start of fetch URL function
+def fetchURL(query, timings=None):
+    # Make the query to the map service, returning a status of 0 if the server could not be reached
+    if (timings == None):
+        timings = {}
+    startTime = timer()
+    # If using a proxy
+    if (enableProxy == "true"):
+        # Connection phases can't be split out through the proxy so are included in the time to first byte
+        timings.update({'dns': 0.0, 'connect': 0.0, 'tls': 0.0, 'ttfb': 0.0, 'transfer': 0.0})
+        try:
+            httpResponse = urllib2.urlopen(query)
+            responseStartTime = timer()
+            response = httpResponse.read()
+            responseStatus = 200
+            timings['ttfb'] = responseStartTime - startTime
+            timings['transfer'] = timer() - responseStartTime
+        except urllib2.HTTPError, error:
+            response = str(error)
+            responseStatus = error.code
+        except urllib2.URLError, error:
+            response = str(error)
+            responseStatus = 0
+    # Otherwise reuse connections to the server
+    else:
+        try:
+            httpResponse, response = ArcGISAdminClient.getURL(query, None, timings)
+            responseStatus = httpResponse.status
+        except (httplib.HTTPException, socket.error), error:
+            response = str(error)
+            responseStatus = 0
+    endTime = timer()
+
+    # Return the status, response and the time for the request
+    return responseStatus, response, endTime - startTime
+# End of fetch URL function
+
+
+# Start of get query passes function
+def getQueryPasses(numberQueries, boundingBoxes):
+    # Each pass is the run, query number and bounding boxes to query
+    queryPasses = []
+    if (warmColdTest == "true"):
+        # Cold queries at a random extent within each bounding box, so the tiles or images have not been drawn before
+        for count in range(int(numberQueries)):
+            queryPasses.append(["Cold", count, getJitteredBoxes(boundingBoxes)])
+        # Warm the caches with one query, then repeat the same extent
+        queryPasses.append(["Warm-up", 0, boundingBoxes])
+        for count in range(int(numberQueries)):
+            queryPasses.append(["Warm", count, boundingBoxes])
+    else:
+        for count in range(int(numberQueries)):
+            queryPasses.append(["", count, boundingBoxes])
+    return queryPasses
+# End of get query passes function
+
+
+# Start of get jittered boxes function
+def getJitteredBoxes(boundingBoxes):
+    # Move each bounding box so it is centred on a random point within it
+    jitteredBoxes = []
+    for boundingBox in boundingBoxes:
+        XMin, YMin, XMax, YMax = [float(value) for value in boundingBox]
+        centreX = random.uniform(XMin, XMax)
+        centreY = random.uniform(YMin, YMax)
+        halfWidth = (XMax - XMin) / 2
+        halfHeight = (YMax - YMin) / 2
+        jitteredBoxes.append([centreX - halfWidth, centreY - halfHeight, centreX + halfWidth, centreY + halfHeight])
+    return jitteredBoxes
+# End of get jittered boxes function
+
+
+# Start of get level tile queries function
+def getLevelTileQueries(mapService, token, tileInfo, boundingBoxes, ImageWidth, ImageHeight):
+    # Work out the tiles for each bounding box at every level
+    tilePlan = ArcGISTileGrid.getTilePlan(tileInfo, boundingBoxes, ImageWidth, ImageHeight)
+
+    # Get all the tiles in between for each level
+    levelTileQueries = []
+    for boxPlan in tilePlan:
+        for level in boxPlan:
+            tileQueries = getTileQueries(mapService, level, token)
+            levelTileQueries.append([level['level'], level['scale'], tileQueries])
+    return levelTileQueries
+# End of get level tile queries function
+
+
+# Start of get tile queries function
+def getTileQueries(mapService, level, token):
+    # Get all the tiles in between
+    tileQueries = []
+    column = level['topLeftColumn']
+    while (column < level['bottomRightColumn']):
+        row = level['topLeftRow']
+        while (row < level['bottomRightRow']):
+            query = mapService + "/tile/" + str(level['level']) + "/" + str(row) + "/" + str(column);
+            # If token received
+            if (token):
+                # Add token to query
+                query = query + "?token=" + token
+            tileQueries.append([row, column, query])
+            row = row + 1
+        column = column + 1
+    return tileQueries
+# End of get tile queries function
+
+
+# Start of get export query function
+def getExportQuery(mapService, token, imageFormat, dpi, ImageWidth, ImageHeight, scale, boundingBox):
+    # Setup the query
+    query = mapService + "/export?f=image&dpi=" + str(dpi);
+    query = query + "&format=" + str(imageFormat)            
+    query = query + "&size=" + str(ImageWidth) + "," + str(ImageHeight)
+    query = query + "&mapScale=" + str(scale)
+    query = query + "&bbox=" + str(boundingBox[0]) + "," + str(boundingBox[1]) + "," + str(boundingBox[2]) + "," + str(boundingBox[3])
+
+    # If token received
+    if (token):
+        # Add token to query
+        query = query + "&token=" + token
+    return query
+# End of get export query function
+
+
+# Start of get load test rates function
+def getLoadTestRates(loadTestRate):
+    # Fixed rate
+    rateRange = str(loadTestRate).split("-")
+    if (len(rateRange) == 1) or (int(loadTestSteps) <= 1):
+        return [float(rateRange[-1])]
+
+    # Ramp up from the lowest to the highest rate in equal steps
+    lowestRate = float(rateRange[0])
+    highestRate = float(rateRange[1])
+    rates = []
+    for step in range(int(loadTestSteps)):
+        rates.append(lowestRate + ((highestRate - lowestRate) * step / (int(loadTestSteps) - 1)))
+    return rates
+# End of get load test rates function
+
+
+# Start of run load test function
+def runLoadTest(exportQueries, imageFormat, imageStats):
+    # Function run on each of the workers for an export request
+    def loadTestRequest(scheduledTime, scale, query):
+        try:
+            responseStatus, response, downloadTime = fetchURL(query)
+            endTime = timer()
+            requestError = (responseStatus != 200) or ("error" in response)
+            if (requestError == False):
+                # Check the image and save it if needed
+                handleImage(response, "MapService_" + str(scale) + "." + str(imageFormat), imageStats)
+        # Count anything else going wrong as an error rather than stopping the load test
+        except Exception:
+            endTime = timer()
+            downloadTime = endTime - scheduledTime
+            requestError = True
+        # Latency is from when the request was due, so includes any time waiting in the queue
+        return {'latency': endTime - scheduledTime, 'serviceTime': downloadTime, 'error': requestError, 'endTime': endTime}
+
+    loadTestResults = []
+    pool = ThreadPool(int(loadTestThreads))
+    try:
+        for rate in getLoadTestRates(loadTestRate):
+            arcpy.AddMessage("Load testing at " + str(round(rate,2)) + " requests per second for " + str(loadTestDuration) + " seconds...")
+            requestCount = max(1, int(round(rate * float(loadTestDuration))))
+
+            # Start the requests on time whether or not the earlier requests have finished
+            stepStartTime = timer()
+            pendingRequests = []
+            for requestIndex in range(requestCount):
+                scheduledTime = stepStartTime + (requestIndex / rate)
+                waitTime = scheduledTime - timer()
+                if (waitTime > 0):
+                    time.sleep(waitTime)
+                scale, query = exportQueries[requestIndex % len(exportQueries)]
+                pendingRequests.append(pool.apply_async(loadTestRequest, (scheduledTime, scale, query)))
+            requestResults = [pendingRequest.get() for pendingRequest in pendingRequests]
+            stepTime = max([requestResult['endTime'] for requestResult in requestResults]) - stepStartTime
+
+            # Get the latency distribution of the successful requests
+            latencies = sorted([requestResult['latency'] for requestResult in requestResults if requestResult['error'] == False] or [0])
+            serviceTimes = sorted([requestResult['serviceTime'] for requestResult in requestResults if requestResult['error'] == False] or [0])
+            errorCount = len([requestResult for requestResult in requestResults if requestResult['error'] == True])
+            stepResults = {'rate': rate,
+                           'requests': requestCount,
+                           'errors': errorCount,
+                           'throughput': (requestCount - errorCount) / max(stepTime, 0.000001),
+                           'latencyP50': getPercentile(latencies, 50),
+                           'latencyP90': getPercentile(latencies, 90),
+                           'latencyP99': getPercentile(latencies, 99),
+                           'latencyMax': latencies[-1],
+                           'serviceTimeP50': getPercentile(serviceTimes, 50)}
+
+            # Saturated if latency has climbed sharply from the lowest rate or the service can't keep up with the rate
+            baselineLatency = stepResults['latencyP50']
+            if (len(loadTestResults) > 0):
+                baselineLatency = loadTestResults[0]['latencyP50']
+            if (stepResults['latencyP50'] > (float(loadTestSaturation) * baselineLatency)) or (stepResults['throughput'] < (0.9 * rate)):
+                stepResults['saturated'] = "Yes"
+            else:
+                stepResults['saturated'] = "No"
+            loadTestResults.append(stepResults)
+            arcpy.AddMessage("Throughput - " + str(round(stepResults['throughput'],2)) + " requests per second, latency P50 - " + str(round(stepResults['latencyP50'],4)) + ", P90 - " + str(round(stepResults['latencyP90'],4)) + ", errors - " + str(errorCount) + "...")
+    finally:
+        pool.close()
+        pool.join()
+
+    # Find the rate where the service saturated
+    for stepIndex, stepResults in enumerate(loadTestResults):
+        if (stepResults['saturated'] == "Yes"):
+            if (stepIndex == 0):
+                arcpy.AddMessage("Saturation point - at or below " + str(round(stepResults['rate'],2)) + " requests per second...")
+            else:
+                arcpy.AddMessage("Saturation point - between " + str(round(loadTestResults[stepIndex - 1]['rate'],2)) + " and " + str(round(stepResults['rate'],2)) + " requests per second...")
+            break
+    else:
+        arcpy.AddMessage("Saturation point - not reached at " + str(round(loadTestResults[-1]['rate'],2)) + " requests per second...")
+    return loadTestResults
+# End of run load test function
+
+
+# Start of load workload function
+def loadWorkload(workloadFile):
+    # Read the extents and scales from the workload file
+    workload = []
+    with open(workloadFile, "rb") as f:
+        for line in csv.reader(f):
+            # Skip blank lines and header lines
+            if (len(line) < 5):
+                continue
+            try:
+                workload.append([float(line[0]), float(line[1]), float(line[2]), float(line[3]), float(line[4])])
+            except ValueError:
+                continue
+    return workload
+# End of load workload function
+
+
+# Start of replay workload function
+def replayWorkload(mapService, token, dataObject, imageFormat, dpi, ImageWidth, ImageHeight, numberQueries, imageStats):
+    workload = loadWorkload(workloadFile)
+    if (len(workload) == 0):
+        raise Exception("No extents and scales found in the workload file - " + workloadFile)
+
+    # Work out the queries for each map request in the workload
+    workloadQueries = []
+    # If the map service is cached
+    if "tileInfo" in dataObject:
+        tileInfo = dataObject['tileInfo']
+        # Work out the tiles for each extent at every level once
+        tilePlan = ArcGISTileGrid.getTilePlan(tileInfo, workload, ImageWidth, ImageHeight)
+        for workloadItem, boxPlan in zip(workload, tilePlan):
+            # Use the level closest to the scale
+            level = min(boxPlan, key=lambda level: abs(float(level['scale']) - workloadItem[4]))
+            tileQueries = getTileQueries(mapService, level, token)
+            workloadQueries.append([level['scale'], [tileQuery[2] for tileQuery in tileQueries]])
+    # Dynamic map service
+    else:
+        for workloadItem in workload:
+            # Setup the query
+            query = getExportQuery(mapService, token, imageFormat, dpi, ImageWidth, ImageHeight, workloadItem[4], workloadItem)
+            workloadQueries.append([workloadItem[4], [query]])
+
+    # Replay the workload the number of times specified, starting each request at the target rate
+    workloadRequests = []
+    for count in range(int(numberQueries)):
+        for scale, queries in workloadQueries:
+            workloadRequests.append([len(workloadRequests), scale, queries])
+    arcpy.AddMessage("Map requests to make - " + str(len(workloadRequests)) + "...")
+
+    # One pool for the whole replay to download the tiles of each map request at the same time like a web browser
+    tilePool = ThreadPool(max(1, int(workloadWorkers)) * max(1, int(tileConnections)))
+    replayStartTime = timer()
+
+    # Function run on each of the workers for a map request
+    def replayRequest(workloadRequest):
+        requestIndex, scale, queries = workloadRequest
+        # Wait until the request is due
+        if (float(workloadRate) > 0):
+            requestStartTime = replayStartTime + (requestIndex / float(workloadRate))
+            waitTime = requestStartTime - timer()
+            if (waitTime > 0):
+                time.sleep(waitTime)
+        else:
+            requestStartTime = timer()
+
+        # Download the tiles or image at the same time like a web browser
+        if (len(queries) > 1):
+            queryResults = tilePool.map(fetchURL, queries, 1)
+        else:
+            queryResults = map(fetchURL, queries)
+        # Latency is from when the request was due, so includes any time waiting for a free worker
+        latency = timer() - requestStartTime
+
+        requestResult = {'scale': scale, 'latency': latency, 'error': False, 'tiles': 0, 'missing': 0}
+        for queryIndex, queryResult in enumerate(queryResults):
+            responseStatus, response, downloadTime = queryResult
+            requestResult['tiles'] = requestResult['tiles'] + 1
+            # If no image found
+            if (responseStatus == 404):
+                requestResult['missing'] = requestResult['missing'] + 1
+            # If any other error
+            elif (responseStatus != 200) or ("error" in response):
+                requestResult['error'] = True
+            else:
+                # Check the image and save it if needed
+                handleImage(response, "MapService_" + str(scale) + "_" + str(requestIndex) + "_" + str(queryIndex) + "." + str(imageFormat), imageStats)
+        return requestResult
+
+    try:
+        requestResults = ArcGISAdminClient.runConcurrently(replayRequest, workloadRequests, workloadWorkers)
+    finally:
+        tilePool.close()
+        tilePool.join()
+    replayTime = timer() - replayStartTime
+
+    # Add up the results for each scale and for the whole workload
+    workloadResults = {'scales': [], 'results': {}, 'elapsed': replayTime}
+    for requestResult in requestResults:
+        if requestResult['scale'] not in workloadResults['results']:
+            workloadResults['scales'].append(requestResult['scale'])
+        for scale in [requestResult['scale'], "All"]:
+            scaleResults = workloadResults['results'].setdefault(scale, {'requests': 0, 'errors': 0, 'tiles': 0, 'missing': 0, 'latencies': []})
+            scaleResults['requests'] = scaleResults['requests'] + 1
+            scaleResults['tiles'] = scaleResults['tiles'] + requestResult['tiles']
+            scaleResults['missing'] = scaleResults['missing'] + requestResult['missing']
+            # Only successful requests are included in the latency
+            if (requestResult['error'] == True):
+                scaleResults['errors'] = scaleResults['errors'] + 1
+            else:
+                scaleResults['latencies'].append(requestResult['latency'])
+    workloadResults['scales'].sort(key=lambda scale: -float(scale))
+
+    allResults = workloadResults['results']['All']
+    arcpy.AddMessage("Map requests made - " + str(allResults['requests']) + " in " + str(round(replayTime,2)) + " seconds, throughput - " + str(round(allResults['requests'] / max(replayTime, 0.000001),2)) + " requests per second...")
+    arcpy.AddMessage("Errors - " + str(allResults['errors']) + ", tiles missing - " + str(allResults['missing']) + " of " + str(allResults['tiles']) + "...")
+    return workloadResults
+# End of replay workload function
+
+
+# Start of get scale results function
+def getScaleResults(scaleData, scale, level=None, run=""):
+    # Results are kept for each run, scale and level
+    scaleKey = (run, level, str(scale))
+    if scaleKey not in scaleData:
+        scaleData[scaleKey] = {'run': run,
+                               'scale': scale,
+                               'level': level,
+                               'tiles': 0,
+                               'missing': 0,
+                               'drawTime': createStatistic(),
+                               'tileTimes': [],
+                               'phases': dict([(phase, createStatistic()) for phase in requestPhases])}
+    return scaleData[scaleKey]
+# End of get scale results function
+
+
+# Start of create statistic function
+def createStatistic():
+    # Running count, sum, mean, minimum, maximum and sum of squared differences from the mean
+    return {'count': 0, 'sum': 0.0, 'mean': 0.0, 'min': 0.0, 'max': 0.0, 'm2': 0.0}
+# End of create statistic function
+
+
+# Start of add statistic function
+def addStatistic(statistic, value):
+    value = float(value)
+    statistic['count'] = statistic['count'] + 1
+    statistic['sum'] = statistic['sum'] + value
+    if (statistic['count'] == 1):
+        statistic['min'] = value
+        statistic['max'] = value
+    else:
+        statistic['min'] = min(statistic['min'], value)
+        statistic['max'] = max(statistic['max'], value)
+
+    # Update the mean and variance in one pass (Welford's method)
+    delta = value - statistic['mean']
+    statistic['mean'] = statistic['mean'] + (delta / statistic['count'])
+    statistic['m2'] = statistic['m2'] + (delta * (value - statistic['mean']))
+# End of add statistic function
+
+
+# Start of get standard deviation function
+def getStandardDeviation(statistic):
+    # Sample standard deviation
+    if (statistic['count'] < 2):
+        return 0.0
+    return math.sqrt(statistic['m2'] / (statistic['count'] - 1))
+# End of get standard deviation function
+
+
+# Start of get statistic line function
+def getStatisticLine(statistic):
+    # Mean, minimum, maximum and standard deviation for the CSV file
+    return "," + str(round(statistic['mean'],4)) + "," + str(round(statistic['min'],4)) + "," + str(round(statistic['max'],4)) + "," + str(round(getStandardDeviation(statistic),4))
+# End of get statistic line function
+
+
+# Start of open results database function
+def openResultsDatabase():
+    database = sqlite3.connect(resultsDatabase)
+    database.execute("CREATE TABLE IF NOT EXISTS testRuns (runID TEXT, service TEXT, runTime INTEGER, PRIMARY KEY (runID, service))")
+    # Key the test runs by run ID and service if the database is from an earlier version, so a run can test more than one service
+    keyColumns = [column[1] for column in database.execute("PRAGMA table_info(testRuns)") if column[5] > 0]
+    if (keyColumns == ["runID"]):
+        database.execute("ALTER TABLE testRuns RENAME TO testRunsOld")
+        database.execute("CREATE TABLE testRuns (runID TEXT, service TEXT, runTime INTEGER, PRIMARY KEY (runID, service))")
+        database.execute("INSERT INTO testRuns SELECT runID, service, runTime FROM testRunsOld")
+        database.execute("DROP TABLE testRunsOld")
+        database.commit()
+    database.execute("CREATE TABLE IF NOT EXISTS scaleResults (runID TEXT, service TEXT, run TEXT, level INTEGER, scale REAL, drawCount INTEGER, drawMean REAL, drawMin REAL, drawMax REAL, drawM2 REAL, tiles INTEGER, missing INTEGER)")
+    database.execute("CREATE INDEX IF NOT EXISTS scaleResultsService ON scaleResults (service, runID)")
+    return database
+# End of open results database function
+
+
+# Start of save test results function
+def saveTestResults(mapService, scaleData):
+    service = mapService.rstrip("/")
+    runTime = int(time.time() * 1000)
+    runID = testRunID or time.strftime("%Y%m%d%H%M%S")
+
+    database = openResultsDatabase()
+    try:
+        # Replace the results if the run ID has been used before
+        database.execute("DELETE FROM testRuns WHERE runID = ? AND service = ?", (runID, service))
+        database.execute("DELETE FROM scaleResults WHERE runID = ? AND service = ?", (runID, service))
+        database.execute("INSERT INTO testRuns VALUES (?, ?, ?)", (runID, service, runTime))
+        for scaleResults in scaleData.values():
+            drawTime = scaleResults['drawTime']
+            database.execute("INSERT INTO scaleResults VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (runID, service, scaleResults['run'], scaleResults['level'], float(scaleResults['scale']), drawTime['count'], drawTime['mean'], drawTime['min'], drawTime['max'], drawTime['m2'], scaleResults['tiles'], scaleResults['missing']))
+        database.commit()
+    finally:
+        database.close()
+    return runID
+# End of save test results function
+
+
+# Start of compare test results function
+def compareTestResults(mapService, runID):
+    service = mapService.rstrip("/")
+    comparisonResults = []
+
+    database = openResultsDatabase()
+    try:
+        # Get the run to compare, the latest run if not specified
+        if (runID):
+            testRun = database.execute("SELECT runID, runTime FROM testRuns WHERE service = ? AND runID = ?", (service, runID)).fetchone()
+        else:
+            testRun = database.execute("SELECT runID, runTime FROM testRuns WHERE service = ? ORDER BY runTime DESC LIMIT 1", (service,)).fetchone()
+        if (testRun == None):
+            raise Exception("No saved results found for " + service + " in " + resultsDatabase)
+        runID, runTime = testRun
+
+        # Get the earlier runs making up the baseline
+        baselineIDs = [row[0] for row in database.execute("SELECT runID FROM testRuns WHERE service = ? AND runTime < ? ORDER BY runTime DESC LIMIT ?", (service, runTime, int(baselineRuns)))]
+        if (len(baselineIDs) == 0):
+            arcpy.AddMessage("No earlier runs to compare with...")
+            return comparisonResults
+
+        # Combine the draw times of the baseline runs for each run, level and scale
+        baseline = {}
+        baselineCounts = {}
+        for run, level, scale, drawCount, drawMean, drawM2 in database.execute("SELECT run, level, scale, drawCount, drawMean, drawM2 FROM scaleResults WHERE service = ? AND runID IN (" + ",".join(["?"] * len(baselineIDs)) + ")", [service] + baselineIDs):
+            resultKey = (run, level, scale)
+            statistic = baseline.setdefault(resultKey, createStatistic())
+            mergeStatistic(statistic, drawCount, drawMean, drawM2)
+            baselineCounts[resultKey] = baselineCounts.get(resultKey, 0) + 1
+
+        # Compare each scale of the run with the baseline
+        for run, level, scale, drawCount, drawMean, drawM2 in database.execute("SELECT run, level, scale, drawCount, drawMean, drawM2 FROM scaleResults WHERE service = ? AND runID = ? ORDER BY run, scale DESC", (service, runID)):
+            resultKey = (run, level, scale)
+            if resultKey not in baseline:
+                continue
+            statistic = createStatistic()
+            mergeStatistic(statistic, drawCount, drawMean, drawM2)
+            baselineStatistic = baseline[resultKey]
+
+            # Percentage change and Welch's t statistic of the difference in the mean draw times
+            change = 100.0 * (statistic['mean'] - baselineStatistic['mean']) / max(baselineStatistic['mean'], 0.000001)
+            standardError = math.sqrt((getStandardDeviation(statistic) ** 2 / max(1, statistic['count'])) + (getStandardDeviation(baselineStatistic) ** 2 / max(1, baselineStatistic['count'])))
+            if (standardError > 0):
+                tStatistic = (statistic['mean'] - baselineStatistic['mean']) / standardError
+            # No variation so any difference is significant
+            else:
+                tStatistic = float(regressionSignificance) if (statistic['mean'] > baselineStatistic['mean']) else 0.0
+
+            comparison = {'runID': runID,
+                          'run': run,
+                          'level': level,
+                          'scale': scale,
+                          'mean': statistic['mean'],
+                          'baselineMean': baselineStatistic['mean'],
+                          'baselineRuns': baselineCounts[resultKey],
+                          'change': change,
+                          'tStatistic': tStatistic,
+                          'slower': "No"}
+            # Flag if slower by more than the threshold and the difference is significant
+            if (change >= float(regressionThreshold)) and (tStatistic >= float(regressionSignificance)):
+                comparison['slower'] = "Yes"
+            comparisonResults.append(comparison)
+    finally:
+        database.close()
+
+    # Report the scales that are slower than the baseline
+    slowerResults = [comparison for comparison in comparisonResults if comparison['slower'] == "Yes"]
+    arcpy.AddMessage("Compared run " + runID + " with the baseline of up to " + str(baselineRuns) + " earlier runs - " + str(len(slowerResults)) + " of " + str(len(comparisonResults)) + " scales slower...")
+    if (len(slowerResults) > 0):
+        slowerMessage = "Map service draw times slower than the baseline - " + service + "\n"
+        for comparison in slowerResults:
+            slowerMessage = slowerMessage + ((comparison['run'] + " ") if comparison['run'] else "") + "1:" + str(comparison['scale']) + " - " + str(round(comparison['mean'],4)) + " seconds, baseline " + str(round(comparison['baselineMean'],4)) + " seconds (+" + str(round(comparison['change'],1)) + "%)\n"
+        arcpy.AddWarning(slowerMessage)
+        # Logging
+        if (enableLogging == "true"):
+            logger.warning(slowerMessage)
+        if (sendErrorEmail == "true"):
+            # Send email
+            sendEmail(slowerMessage)
+    return comparisonResults
+# End of compare test results function
+
+
+# Start of merge statistic function
+def mergeStatistic(statistic, count, mean, m2):
+    # Combine a count, mean and sum of squared differences into the statistic (Chan's parallel method)
+    if (count == 0):
+        return
+    totalCount = statistic['count'] + count
+    delta = mean - statistic['mean']
+    statistic['mean'] = statistic['mean'] + (delta * count / totalCount)
+    statistic['m2'] = statistic['m2'] + m2 + (delta * delta * statistic['count'] * count / totalCount)
+    statistic['count'] = totalCount
+# End of merge statistic function
+
+
+# Start of add phase times function
+def addPhaseTimes(scaleResults, timings):
+    # Add the time spent in each phase of the request
+    for phase in requestPhases:
+        addStatistic(scaleResults['phases'][phase], timings.get(phase, 0.0))
+# End of add phase times function
+
+
+# Start of get phase times line function
+def getPhaseTimesLine(scaleResults):
+    # Average time spent in each phase of the requests at a scale
+    phaseTimesLine = ""
+    for phase in requestPhases:
+        phaseTimesLine = phaseTimesLine + "," + str(round(scaleResults['phases'][phase]['mean'],4))
+    return phaseTimesLine
+# End of get phase times line function
+
+
+# Start of get percentile function
+def getPercentile(sortedValues, percentile):
+    # Nearest rank percentile of a sorted list
+    return sortedValues[max(0, int(math.ceil(len(sortedValues) * (percentile / 100.0))) - 1)]
+# End of get percentile function
+
+
+# Start of handle image function
+def handleImage(response, fileName, imageStats):
+    # Hash and count the size of the image in memory
+    imageHash = hashlib.md5(response).hexdigest()
+    with imageLock:
+        imageStats['count'] = imageStats['count'] + 1
+        imageStats['bytes'] = imageStats['bytes'] + len(response)
+        imageStats['hashes'].add(imageHash)
+        imageCount = imageStats['count']
+
+    # If not saving all images, save a sample of them spread evenly through the run
+    if (saveImages != "true"):
+        if (int(imageCount * float(imageSampleRate)) == int((imageCount - 1) * float(imageSampleRate))):
+            return
+
+    # Set the file path
+    file = os.path.join(arcpy.env.scratchFolder, fileName)
+
+    # Open the file for writing
+    responseImage = open(file, "wb")
+
+    # Write the image to file
+    responseImage.write(response)
+    responseImage.close()
+    with imageLock:
+        imageStats['saved'] = imageStats['saved'] + 1
+# End of handle image function
+
+
 # Start of get token function
 def getToken(username, password, serverName, serverPort):
-    
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, "http", username, "requestip", renewToken)
+    if cachedToken:
+        return cachedToken
+
     query_dict = {'username':   username,
                   'password':   password,
                   'expiration': "60",
@@ -407,6 +1023,8 @@ def getToken(username, password, serverName, serverPort):
                 logger.error(token['messages'])                
             sys.exit()
         else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, "http", username, "requestip", token['token'], token.get('expires'), renewToken)
             # Return the token to the function which called for it
             return token['token']
     
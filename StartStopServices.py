@@ -16,7 +16,9 @@ import sys
 import logging
 import smtplib
 import arcpy
-import httplib
+import ArcGISAdminClient
+import ArcGISTokenManager
+import ArcGISServiceCatalog
 import json
 import urllib
 import urllib2
@@ -69,43 +71,18 @@ def mainFunction(agsServerSite,username,password,startStop,allServices,userServi
         # If token received
         if (token != -1):
             services = []    
-            folder = ''
 
             # If task is for all services
             if (allServices == "true"):                
-                # Query the root level for services            
-                url = "http://{}:{}/arcgis/admin/services{}?f=pjson&token={}".format(serverName, serverPort, folder, token)    
-
-                # Make the request 
+                # Get services from the service catalog, querying the folders in parallel and leaving out the System and Utilities folder
                 try:
-                    serviceList = json.loads(urllib2.urlopen(url).read())
-                except urllib2.URLError, error:
+                    services = ArcGISServiceCatalog.getServices(serverName, serverPort, protocol, token, ["System", "Utilities"])
+                except Exception, error:
                     arcpy.AddError(error)
                     # Logging
                     if (enableLogging == "true"):
                         logger.error(error)                    
                     sys.exit()
-
-                # Add the services at the root level
-                for single in serviceList["services"]:
-                    services.append(single['serviceName'] + '.' + single['type'])
-                    
-                # Build up list of folders and remove the System and Utilities folder
-                folderList = serviceList["folders"]
-                folderList.remove("Utilities")             
-                folderList.remove("System")
-
-                # If there is any folders
-                if len(folderList) > 0:
-                    # For each folder in the list
-                    for folder in folderList:
-                        # Query the folder for map services
-                        URL = "http://{}:{}/arcgis/admin/services/{}?f=pjson&token={}".format(serverName, serverPort, folder, token)    
-                        fList = json.loads(urllib2.urlopen(URL).read())
-                        
-                        for single in fList["services"]:
-                            # Add the services found to the list
-                            services.append(folder + "/" + single['serviceName'] + '.' + single['type'])
             # Just for the user defined list of services
             else:
                 services = userServices.split(",")
@@ -113,8 +90,9 @@ def mainFunction(agsServerSite,username,password,startStop,allServices,userServi
             # For each of the services
             for service in services:
                 # Start or stop the map service
-                op_service_url = "http://{}:{}/arcgis/admin/services/{}/{}?token={}&f=json".format(serverName, serverPort, service, startStop, token)
-                status = urllib2.urlopen(op_service_url, ' ').read()
+                url = "/arcgis/admin/services/" + service + "/" + startStop
+                params = urllib.urlencode({'token': token, 'f': 'json'})
+                response, status = postToServer(serverName, serverPort, protocol, url, params)
 
                 # If successfully started/stopped                    
                 if 'success' in status:
@@ -192,7 +170,14 @@ def mainFunction(agsServerSite,username,password,startStop,allServices,userServi
 
 # Start of get token function
 def getToken(username, password, serverName, serverPort):
-    
+    # Function to get a new token if the server rejects this one
+    renewToken = lambda: getToken(username, password, serverName, serverPort)
+
+    # Use the cached token if it has not expired
+    cachedToken = ArcGISTokenManager.getCachedToken(serverName, serverPort, "http", username, "requestip", renewToken)
+    if cachedToken:
+        return cachedToken
+
     query_dict = {'username':   username,
                   'password':   password,
                   'expiration': "60",
@@ -212,6 +197,8 @@ def getToken(username, password, serverName, serverPort):
                 logger.error(token['messages'])                
             sys.exit()
         else:
+            # Cache the token so it can be reused until it expires
+            ArcGISTokenManager.cacheToken(serverName, serverPort, "http", username, "requestip", token['token'], token.get('expires'), renewToken)
             # Return the token to the function which called for it
             return token['token']
     
@@ -226,6 +213,13 @@ def getToken(username, password, serverName, serverPort):
 # End of get token function
 
 
+# Start of HTTP POST request to the server function
+def postToServer(serverName, serverPort, protocol, url, params):
+    # Post to the server using the shared keep-alive connection pool
+    return ArcGISAdminClient.postToServer(serverName, serverPort, protocol, url, params)
+# End of HTTP POST request to the server function
+
+
 # Start of split URL function 
 def splitSiteURL(siteURL):
     try: